@@ -4,11 +4,11 @@ from scripts.RESbased_scenario_generator.RESbased_scenario_generator import res_
 # , generate_geojson
 from scripts.KPI_module.energy_consumption import generation_system_function
 from scripts.RESbased_scenario_generator.get_new_context import resbased_generator_context_creation
-from scripts.KPI_module.key_performance_indicators import recalculate_indicators, get_indicators_from_baseline, aggregate_demand_profiles, community_KPIs
+from scripts.KPI_module.key_performance_indicators import recalculate_indicators, get_indicators_from_baseline, aggregate_demand_profiles, community_KPIs, recalculate_indicators_incremental
 
 
 
-def generate_baseline_pathway_simple(data, front_data):
+def generate_baseline_pathway_simple(data, front_data, resolution="hourly", hourly_buildings=None):
     #calculate electricity and heat demand
     demand_profile=demand_statistics(data=data, front_data=front_data)
     #calculate energy consumption based on the technology
@@ -16,17 +16,19 @@ def generate_baseline_pathway_simple(data, front_data):
     #create baseline object
     baseline=baseline_pathway_simple(data=data, front_data=front_data, demand_profile=demand_profile, building_consumption_dict=building_consumption_dict )
      # calculate kpis per building
-    citizen_KPIs_per_building = get_indicators_from_baseline(front_data, data, building_consumption_dict,
-                                                             demand_profile)
+    citizen_KPIs_per_building, electricity_grid = get_indicators_from_baseline(
+        front_data, data, building_consumption_dict, demand_profile, resolution=resolution,
+        hourly_buildings=hourly_buildings)
     # calculate total aggregated demand
-    total_demand = aggregate_demand_profiles(demand_profile)
+    total_demand = aggregate_demand_profiles(demand_profile, as_matrix=True)
     # calculate total community indicators
-    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand)
+    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand, resolution=resolution,
+                                          electricity_grid=electricity_grid)
 
     return baseline, community_indicators
 
 
-def generate_baseline_pathway_intermediate(data, front_data):
+def generate_baseline_pathway_intermediate(data, front_data, resolution="hourly", hourly_buildings=None):
     geojson_object=generate_geojson(front_data=front_data)
     geojson_file = fetch_geojson(geojson_object=geojson_object)
     demand_profile=demand_thermagrid(front_data=front_data, geojson_file=geojson_file)
@@ -35,11 +37,14 @@ def generate_baseline_pathway_intermediate(data, front_data):
     #create baseline object
     baseline = baseline_pathway_intermediate(front_data=front_data, data=data, geojson_file=geojson_file, demand_profile=demand_profile, building_consumption_dict=building_consumption_dict )
     #calculate kpis per building
-    citizen_KPIs_per_building = get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile)
+    citizen_KPIs_per_building, electricity_grid = get_indicators_from_baseline(
+        front_data, data, building_consumption_dict, demand_profile, resolution=resolution,
+        hourly_buildings=hourly_buildings)
     #calculate total aggregated demand
-    total_demand = aggregate_demand_profiles(demand_profile)
+    total_demand = aggregate_demand_profiles(demand_profile, as_matrix=True)
     #calculate total community indicators
-    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand)
+    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand, resolution=resolution,
+                                          electricity_grid=electricity_grid)
 
     return  baseline, community_indicators
 
@@ -53,12 +58,21 @@ def get_new_context(goal, community_context,recommendations_dic):
     new_context=resbased_generator_context_creation(goal,community_context,recommendations_dic)
     return new_context
 
-def calculate_indicators(community_context):
-    citizen_KPIs_per_building, demand_profiles_context=recalculate_indicators(community_context)
+def calculate_indicators(community_context, max_workers=None, kpi_cache=None, resolution="hourly",
+                         hourly_buildings=None):
+    if kpi_cache is not None:
+        # only the buildings that changed since the cached contexts are recalculated
+        citizen_KPIs_per_building, demand_profiles_context, community_indicators = recalculate_indicators_incremental(
+            community_context, kpi_cache, max_workers=max_workers, resolution=resolution,
+            hourly_buildings=hourly_buildings)
+        return citizen_KPIs_per_building, community_indicators
+    citizen_KPIs_per_building, demand_profiles_context=recalculate_indicators(community_context, max_workers=max_workers,
+                                                                              resolution=resolution,
+                                                                              hourly_buildings=hourly_buildings)
     #calculate total aggregated demand
-    total_demand = aggregate_demand_profiles(demand_profiles_context)
+    total_demand = aggregate_demand_profiles(demand_profiles_context, as_matrix=True)
     #calculate total community indicators
-    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand)
+    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand, resolution=resolution)
     return citizen_KPIs_per_building, community_indicators
 
 current_path=os.path.dirname(os.path.abspath(__file__))
@@ -201,6 +201,59 @@ def kpi_ctz_factors():
 
     return citizen_kpis_factors
 
+# Bases of the citizen equivalences
+TOTAL_PRIMARY_ENERGY = "total_primary_energy"  # [kWh]
+TOTAL_CO2 = "total_co2"  # [kg_CO2]
+
+# Citizen equivalences, in the order of the citizen KPIs: each one is the basis divided by the product of its
+# factors of kpi_ctz_factors. A new equivalence only needs a new row here (and its factors in kpi_ctz_factors).
+CITIZEN_EQUIVALENCES = [
+    {"name": "EquivalentTVHours_[h]", "unit": "h", "basis": TOTAL_PRIMARY_ENERGY, "factors": ("f_tv",)},
+    {"name": "EquivalentstreamingHours_[h]", "unit": "h", "basis": TOTAL_PRIMARY_ENERGY,
+     "factors": ("f_streaming",)},
+    {"name": "PizzaConsumptionComparison_[pizza]", "unit": "pizza", "basis": TOTAL_PRIMARY_ENERGY,
+     "factors": ("f_pizza",)},
+    {"name": "BatteryUsageEstimation_[charges]", "unit": "charges", "basis": TOTAL_PRIMARY_ENERGY,
+     "factors": ("f_battery",)},
+    {"name": "ElectricCarChargingEstimation_[charges]", "unit": "charges", "basis": TOTAL_PRIMARY_ENERGY,
+     "factors": ("f_km", "f_elcar")},
+    {"name": "WineBottlesProduction_[bottles]", "unit": "bottles", "basis": TOTAL_PRIMARY_ENERGY,
+     "factors": ("f_wine",)},
+    {"name": "TreesRequiredForCarbonOffset_[trees]", "unit": "trees", "basis": TOTAL_CO2, "factors": ("f_trees",)},
+    {"name": "streamingEmissionsImpact_[hours]", "unit": "hours", "basis": TOTAL_CO2, "factors": ("f_em_net",)},
+    {"name": "CarbonEmissionsPerKilometer_[km]", "unit": "km", "basis": TOTAL_CO2, "factors": ("f_ICV",)},
+]
+
+
+def citizen_equivalences(citizen_kpis_factors, bases, equivalences=CITIZEN_EQUIVALENCES):
+    '''
+    Calculates all the citizen equivalences at once, dividing the stacked bases by the factors of the
+    equivalences in a single broadcast (equivalences x timesteps).
+
+    Parameters
+    ----------
+    citizen_kpis_factors : dict
+        A dictionary containing the factors of kpi_ctz_factors.
+    bases : dict
+        Values of the bases (e.g. TOTAL_PRIMARY_ENERGY and TOTAL_CO2): float, int, list or array,
+        all of them with the same length.
+    equivalences : list
+        Table of equivalences, CITIZEN_EQUIVALENCES by default.
+
+    Returns
+    -------
+    citizen_equivalences : dict
+        A dictionary of name: array with the values of each equivalence.
+    '''
+    basis_names = list(bases)
+    basis_matrix = np.stack([np.asarray(bases[basis_name], dtype=float) for basis_name in basis_names])
+    rows = [basis_names.index(equivalence["basis"]) for equivalence in equivalences]
+    divisors = np.array([np.prod([citizen_kpis_factors[factor] for factor in equivalence["factors"]])
+                         for equivalence in equivalences])
+    values = basis_matrix[rows] / divisors.reshape((-1,) + (1,) * (basis_matrix.ndim - 1))
+    return {equivalence["name"]: values[i] for i, equivalence in enumerate(equivalences)}
+
+
 def generation_system_function(data, demand_profile):
     '''
     This function processes data related to generation systems and calculates energy consumption based on the provided profiles.
@@ -463,297 +516,6 @@ def kpi_scenario_objective(front_data):
     return num_members
 
 
-def tv_h(citizen_kpis_factors,total_primary_energy):
-    '''
-    Equivalent TV hours
-    Description: Calculates the number of hours equivalent to the energy consumption, 
-    representing the time spent watching TV.
-
-    Parameters
-    ----------
-    citizen_kpis_factors : dict
-        A dictionary containing information about citizen factors.
-     total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    TV_h : float
-        Equivalent TV hours.
-    '''
-    f_tv = citizen_kpis_factors["f_tv"]  # Factor for TV hours
-
-    if isinstance(total_primary_energy, list):  # Check if it's a list
-        TV_h = [(total_primary_energy[i] / f_tv) for i in
-                range(len(total_primary_energy))]  # Element-wise division for list
-    elif isinstance(total_primary_energy, (int, float)):  # Check if it's a float or integer
-        TV_h = total_primary_energy / f_tv  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-
-    return TV_h
-
-
-def streaming_h(citizen_kpis_factors,total_primary_energy):
-    '''
-    Equivalent streaming hours
-    Description: Estimates the hours equivalent to the energy consumed, 
-    reflecting the duration of streaming.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    streaming_h : float
-        Equivalent streaming hours
-    '''
-    
-    f_streaming= citizen_kpis_factors["f_streaming"]  # [h]
-    print(f_streaming)
-
-    if isinstance(total_primary_energy, list):  # Check if it's a list
-        streaming_h = [(total_primary_energy[i] / f_streaming) for i in
-                range(len(total_primary_energy))]  # Element-wise division for list
-    elif isinstance(total_primary_energy, (int, float)):  # Check if it's a float or integer
-        streaming_h = total_primary_energy / f_streaming  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-
-    return streaming_h
-
-
-def pizza_h(citizen_kpis_factors,total_primary_energy):
-    '''
-    Pizza consumption comparison
-    Description: Converts the energy consumption into hours of pizza consumption, 
-    providing a relatable comparison.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    Pizza_h : float
-        Equivalent pizza consumption hours.
-    '''
-    
-    f_pizza =citizen_kpis_factors["f_pizza"]  # [h]
-
-    if isinstance(total_primary_energy, list):  # Check if it's a list
-        Pizza_h = [(total_primary_energy[i] / f_pizza) for i in
-                       range(len(total_primary_energy))]  # Element-wise division for list
-    elif isinstance(total_primary_energy, (int, float)):  # Check if it's a float or integer
-        Pizza_h = total_primary_energy / f_pizza  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-    return Pizza_h
-
-
-def battery_charges(citizen_kpis_factors,total_primary_energy):
-    '''
-    Battery usage estimation
-    Description: Determines the number of times a battery could be charged 
-    with the energy consumed.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    Battery_charges : float
-        Number of battery charges.
-    '''
-    f_battery= citizen_kpis_factors["f_battery"]  # [charges]
-    if isinstance(total_primary_energy, list):  # Check if it's a list
-        Battery_charges = [(total_primary_energy[i] / f_battery) for i in
-                       range(len(total_primary_energy))]  # Element-wise division for list
-    elif isinstance(total_primary_energy, (int, float)):  # Check if it's a float or integer
-        Battery_charges = total_primary_energy / f_battery  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-    return Battery_charges
-
-
-def el_car_charges(citizen_kpis_factors,total_primary_energy):
-    '''
-    Electric car charging estimation
-    Description: Computes the number of times an electric car could be charged 
-    with the energy consumed.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    ElCar_charges : float
-        Number of electric car charges.
-    '''
-
-    f_km = citizen_kpis_factors["f_km"]  # [km/charges]
-    f_elcar = citizen_kpis_factors["f_elcar"]  # [kWh/km]
-
-    if isinstance(total_primary_energy, list):  # Check if it's a list
-        ElCar_charges = [(total_primary_energy[i] / (f_km*f_elcar)) for i in
-                       range(len(total_primary_energy))]  # Element-wise division for list
-    elif isinstance(total_primary_energy, (int, float)):  # Check if it's a float or integer
-        ElCar_charges = total_primary_energy /(f_km*f_elcar) # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-    return ElCar_charges
-
-
-def trees_number(citizen_kpis_factors,total_co2):
-    '''
-    Trees required for carbon offset
-    Description: Calculates the number of trees needed to offset the carbon emissions 
-    resulting from the energy consumption.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-    Returns
-    -------
-    Trees_number : float
-        Number of trees required for carbon offset.
-    '''
-
-    f_trees= citizen_kpis_factors["f_trees"]  # [trees/year]
-
-    if isinstance(total_co2, list):  # Check if it's a list
-        Trees_number = [(total_co2[i] / f_trees) for i in
-                       range(len(total_co2))]  # Element-wise division for list
-    elif isinstance(total_co2, (int, float)):  # Check if it's a float or integer
-        Trees_number = total_co2 / f_trees  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-    return Trees_number
-
-
-def streaming_emission_hours(citizen_kpis_factors,total_co2):
-    '''
-    Streaming emissions impact
-    Description: Assesses the environmental impact in terms of streaming usage 
-    associated with the energy consumption.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    Streaming_emissionhours : float
-        Streaming emissions impact in hours.
-    '''
-
-    f_em_net = citizen_kpis_factors["f_em_net"]  # [h]
-    if isinstance(total_co2, list):  # Check if it's a list
-        streaming_emissionhours = [(total_co2[i] / f_em_net) for i in
-                       range(len(total_co2))]  # Element-wise division for list
-    elif isinstance(total_co2, (int, float)):  # Check if it's a float or integer
-        streaming_emissionhours = total_co2 / f_em_net  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-    return streaming_emissionhours
-
-
-def icv_km(citizen_kpis_factors,total_co2):
-    '''
-    Carbon emissions per kilometer
-    Description: Calculates the carbon emissions per kilometer traveled 
-    as a result of the energy consumption.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    ICV_km : float
-        Carbon emissions per kilometer.
-    '''
-
-    f_ICV= citizen_kpis_factors["f_ICV"]  # [km]
-
-    if isinstance(total_co2, list):  # Check if it's a list
-        ICV_km = [(total_co2[i] / f_ICV) for i in
-                       range(len(total_co2))]  # Element-wise division for list
-    elif isinstance(total_co2, (int, float)):  # Check if it's a float or integer
-        ICV_km = total_co2 / f_ICV  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-    return ICV_km
-
-def wine_bottles(citizen_kpis_factors,total_primary_energy):
-    '''
-    Consume related to Wine bottles production
-    Description: Calculates the number of wine bottles producted based on energy consumption.
-
-    Parameters
-    ----------
-    citizen : dict
-        A dictionary containing information about citizen factors.
-    data : dict
-        A dictionary containing information about building statistics profiles, including generation system profiles.
-    total_primary_energy : dict
-        A dictionary containing information about total_primary_energy 
-
-    Returns
-    -------
-    Wine_bottles : float
-        Number of wine bottles generated.
-    '''
-
-    f_wine= citizen_kpis_factors["f_wine"]  # [bottles]
-
-    if isinstance(total_primary_energy, list):  # Check if it's a list
-        Wine_bottles = [(total_primary_energy[i] / f_wine) for i in
-                       range(len(total_primary_energy))]  # Element-wise division for list
-    elif isinstance(total_primary_energy, (int, float)):  # Check if it's a float or integer
-        Wine_bottles = total_primary_energy / f_wine  # Single value division for float or int
-    else:
-        raise ValueError("total_primary_energy must be a float, int, or list.")
-    return Wine_bottles
-
 def save_to_csv(building_consumption_dict, demand_profile, total_primary_energy_MWh, KPI_peak_heat_demand, KPI_peak_elec_demand, num_members,
                 TV_h, streaming_h, Pizza_h, Battery_charges, ElCar_charges, Trees_number, streaming_emissionhours, ICV_km, Wine_bottles):
     '''
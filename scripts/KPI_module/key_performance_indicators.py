@@ -35,10 +35,16 @@ This part of the code is changes the
 """
 import os
 import json
-from scripts.RESbased_scenario_generator.classes_database import FinalEnergy, BuildingKPIs
+import hashlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from scripts.RESbased_scenario_generator.classes_database import (BuildingKPIs, CommunityMatrix,
+                                                                   EnergySystemsCatalogue, EnergyCarrierRegistry, KPICache,
+                                                                   ProcessWideInstance, HOURS_PER_MONTH, MONTH_START_HOURS)
+import numpy as np
 import pandas as pd
-from scripts.KPI_module.KPI_module import (kpi_ctz_factors,tv_h, streaming_h, pizza_h, battery_charges, el_car_charges,trees_number,
-                        streaming_emission_hours,icv_km,wine_bottles)
+from scripts.KPI_module.KPI_module import (kpi_ctz_factors, citizen_equivalences, CITIZEN_EQUIVALENCES,
+                                           TOTAL_PRIMARY_ENERGY, TOTAL_CO2)
 # Define constants for recurring string literals
 BUILDING = "building"
 BUILDING_CONSUMPTION="building_consumption"
@@ -72,6 +78,32 @@ HEATING_SYSTEM_ID="heating_system_id"
 COOLING_SYSTEM_ID="cooling_system_id"
 ELECTRICITY_SYSTEM_ID="electricity_system_id"
 
+# Generation system ids of heat pumps, their electricity consumption is added to the building electricity use
+LIST_OF_HPS = [1, 2, 3, 4, 5, 6, 7, 8, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 41, 61, 62, 63, 64, 65, 66,
+               67, 68, 73]
+#dhn 145, 147, 153, 155 is out of the list as el. is consumed somewhere else
+COOLING_HPS_LIST = [1, 2, 3, 4, 5, 6, 7, 8]
+HEATING_HPS_LIST = [61, 62, 63, 64, 65, 66, 67, 68, 73]
+DHW_HPS_LIST = [27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 41]
+CHP_LIST = [88, 89, 90, 91]
+ELECTRIC_ASSET_LIST = [80, 81, 82, 83, 84, 85, 86, 87]
+SOLAR_THERMAL = [37, 38, 39, 40, 69, 70, 71, 72]
+#any other id is a boiler?????
+# Time resolutions of the KPI outputs
+HOURLY = "hourly"
+DAILY = "daily"
+MONTHLY = "monthly"
+YEARLY = "yearly"
+RESOLUTIONS = (HOURLY, DAILY, MONTHLY, YEARLY)
+# Citizen KPIs that are ratios, they are averaged over the timesteps instead of summed
+MEAN_KPIS = ("Total_self_sufficiency", "rate_of_self_consumption")
+# system id key in generation_system_profile: (consumption key, system key, heat pumps of that system)
+SYSTEMS_CONSUMPTION = {
+    DHW_SYSTEM_ID: (DHW_CONSUMPTION, DHW_SYSTEM, DHW_HPS_LIST),
+    HEATING_SYSTEM_ID: (HEAT_CONSUMPTION, HEATING_SYSTEM, HEATING_HPS_LIST),
+    COOLING_SYSTEM_ID: (COOL_CONSUMPTION, COOLING_SYSTEM, COOLING_HPS_LIST),
+}
+
 
 
 def handle_demand_profile(building_asset_context,generation_system_profile,consumption_profile):
@@ -112,90 +144,92 @@ def handle_demand_profile(building_asset_context,generation_system_profile,consu
         return ValueError(
             f"Demand profile could not be calculated because generation system profile is missing for building ID: {building_id}")
 
+def time_series_to_array(values, timestep_count):
+    """
+    Converts a time series (list, tuple or array) into a new float array, None values are treated as 0.
+    If the time series is missing, an array of zeros of length timestep_count is returned.
+    """
+    if values is None:
+        return np.zeros(timestep_count)
+    return np.nan_to_num(np.array(values, dtype=float), nan=0.0, copy=False)
+
+
 def calculate_self_consumption(total_electricity_use, total_PV):
-    return [
-        min(total_electricity_use[i], total_PV[i])
-        for i in range(len(total_electricity_use))
-    ]
+    return np.minimum(total_electricity_use, total_PV)
 
 
 def calculate_rate_of_self_consumption(self_consumption, total_PV):
-    return [
-        (self_consumption[i] / total_PV[i]) * 100 if total_PV[i] > 0 else 0
-        for i in range(len(self_consumption))
-    ]
+    self_consumption = np.asarray(self_consumption, dtype=float)
+    total_PV = np.asarray(total_PV, dtype=float)
+    rate_of_self_consumption = np.zeros(len(self_consumption))
+    np.divide(self_consumption, total_PV, out=rate_of_self_consumption, where=total_PV > 0)
+    return rate_of_self_consumption * 100
 
 
 def calculate_grid_consumption(total_electricity_use, self_consumption):
-    return [
-        total_electricity_use[i] - self_consumption[i]
-        for i in range(len(total_electricity_use))
-    ]
+    return np.subtract(total_electricity_use, self_consumption)
 
 
 def calculate_self_sufficiency(self_consumption, total_electricity_use):
-    return [
-        (self_consumption[i] / total_electricity_use[i]) * 100 if total_electricity_use[i] > 0 else 0
-        for i in range(len(self_consumption))
-    ]
+    self_consumption = np.asarray(self_consumption, dtype=float)
+    total_electricity_use = np.asarray(total_electricity_use, dtype=float)
+    self_sufficiency = np.zeros(len(self_consumption))
+    np.divide(self_consumption, total_electricity_use, out=self_sufficiency, where=total_electricity_use > 0)
+    return self_sufficiency * 100
 
 
-def add_electricity_consumption(total_electricity_use, consumption):
-    for i in range(len(total_electricity_use)):
-        if consumption[i] is None:
-            consumption[i] = 0  # Handle None values in consumption
-        total_electricity_use[i] += consumption[i]
-    return total_electricity_use
-
-def check_system_type_to_get_consumption(system_name,consumption_profile):
-    print(type(consumption_profile))
-    print(consumption_profile.keys())
-    system_type=None
-    if system_name == DHW_SYSTEM_ID:
-        consumption = consumption_profile[DHW_CONSUMPTION].copy()
-        system_type=DHW_SYSTEM
-    elif system_name == HEATING_SYSTEM_ID:
-        consumption = consumption_profile[HEAT_CONSUMPTION].copy()
-        system_type=HEATING_SYSTEM
-    elif system_name == COOLING_SYSTEM_ID:
-        consumption = consumption_profile[COOL_CONSUMPTION].copy()
-        system_type=COOLING_SYSTEM
-    else:
-        consumption=[0]*8760
-        system_type="electricity_system"
-    return consumption, system_type
+ENERGY_CARRIER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogues", "energy_carrier.json")
+# Process-wide energy carrier registry, it is loaded on the first call to load_energy_carrier_registry
+_energy_carrier_registry = ProcessWideInstance(lambda: EnergyCarrierRegistry(ENERGY_CARRIER_PATH))
 
 
-def instantiate_final_energy_with_json():
-    parent_directory = os.path.dirname(os.path.abspath(__file__))
-    print(parent_directory)
-    json_file_path = os.path.join(parent_directory,
-                                  "catalogues", "energy_carrier.json")
-    with open(json_file_path, "r") as file:
-        json_data = json.load(file)
+def load_energy_carrier_registry():
+    """
+    Returns the process-wide EnergyCarrierRegistry. energy_carrier.json is only parsed on the first call, or again
+    after reload_energy_carrier_registry.
+    """
+    return _energy_carrier_registry.get()
+
+
+def reload_energy_carrier_registry():
+    """Parses energy_carrier.json again and returns the new registry."""
+    return _energy_carrier_registry.reload()
 
-    total_final_energy = {} #diccionario de instancias de la clase Final Energy para cada energy carrier
-    for entry in json_data:
-        if entry.get("final"):
-            id = entry["id"]
-            total_final_energy[id] = FinalEnergy(id)
-            total_final_energy[id].name = entry["name"]
-            total_final_energy[id].final = entry["final"]
 
-    return total_final_energy
+def instantiate_final_energy_with_json():
+    # diccionario de instancias de la clase Final Energy para cada energy carrier
+    return load_energy_carrier_registry().new_final_energy()
+
 
+ENERGY_SYSTEMS_CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogues",
+                                             "generation_systems_catalogue.json")
+# Process-wide catalogue, it is loaded on the first call to load_energy_system_catalogue
+_energy_systems_catalogue = ProcessWideInstance(lambda: EnergySystemsCatalogue(ENERGY_SYSTEMS_CATALOGUE_PATH))
 
 
 def load_energy_system_catalogue():
-    parent_directory = os.path.dirname(os.path.abspath(__file__))
-    input_files_path = os.path.join(parent_directory,"catalogues",
-                                    "generation_systems_catalogue.json")
-    with open(input_files_path, "r") as file:
-        energy_systems_catalogue = json.load(file)
-    return energy_systems_catalogue
+    """
+    Returns the process-wide EnergySystemsCatalogue. The json file is only parsed on the first call, or again
+    after reload_energy_system_catalogue.
+    """
+    return _energy_systems_catalogue.get()
+
+
+def reload_energy_system_catalogue():
+    """
+    Parses generation_systems_catalogue.json again (e.g. after the catalogue file is updated) and returns the new
+    catalogue. Catalogues obtained before the reload are not modified.
+    """
+    return _energy_systems_catalogue.reload()
 
 
 def filter_energy_systems_catalogue(energy_systems_catalogue, new_generation_system_id):
+    """
+    Returns the system of the catalogue with id new_generation_system_id as a new dictionary, or None if no
+    matching system is found. energy_systems_catalogue is an EnergySystemsCatalogue or a list of systems.
+    """
+    if isinstance(energy_systems_catalogue, EnergySystemsCatalogue):
+        return energy_systems_catalogue.get_copy(new_generation_system_id)
     # Loop through each system in the "systems" list
     for system in energy_systems_catalogue:
         # Check if the "id" in the system matches the new_generation_system_id
@@ -204,160 +238,77 @@ def filter_energy_systems_catalogue(energy_systems_catalogue, new_generation_sys
 
     return None  # Return None if no matching system is found
 
-def calculate_building_indicators(consumption_profile, generation_system_profile, building_energy_asset,timestep_count):
+def calculate_building_indicators_arrays(consumption_profile, generation_system_profile, building_energy_asset,
+                                        timestep_count):
     """
+    Array-backed engine of calculate_building_indicators. The heat pump, PV and fuel bookkeeping is done on
+    numpy arrays of length timestep_count instead of lists, and the input profiles are never modified.
 
     Parameters
     ----------
-    consumption_profile is the dictionary of consumption, typically:
-        BUILDING_CONSUMPTION:{
-            "id": int,
-            HEAT_CONSUMPTION:[],
-            DHW_CONSUMPTION:[],
-            ELECTRICITY_CONSUMPTION:[],
-            COOL_CONSUMPTION:[]
-            }
+    consumption_profile is the dictionary of consumption (see calculate_building_indicators)
     generation_system_profile is the dictionary of the energy systems
-    building_energy_asset is a list of several assets
+    building_energy_asset is a list of several assets, or None if there is no asset in this building
 
     Returns
     -------
-
+    total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption as numpy arrays,
+    total_final_energy (dictionary of FinalEnergy per energy carrier) and KPIs (dictionary of BuildingKPIs)
     """
-    #initilize:
-    rate_of_self_consumption = []
-    grid_consumption = []
-    self_sufficiency = []
-    total_electricity_use = []
-    list_of_hps = [1, 2, 3, 4, 5, 6, 7, 8, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 41, 61, 62, 63, 64, 65, 66,
-                   67, 68, 73]
-    #dhn 145, 147, 153, 155 is out of the list as el. is consumed somewhere else
-    cooling_hps_list = [1, 2, 3, 4, 5, 6, 7, 8]
-    heating_hps_list = [61, 62, 63, 64, 65, 66, 67, 68, 73]
-    dhw_hps_list = [27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 41]
-    chp_list = [88, 89, 90, 91]
-    electric_asset_list = [80, 81, 82, 83, 84, 85, 86, 87]
-    solar_thermal = [37, 38, 39, 40, 69, 70, 71, 72]
-    #any other id is a boiler?????
-    total_fuels_use={}
-    cooling_asset = False
-    heating_asset = False
-    dhw_asset = False
-    electricity_asset = False
     total_final_energy=instantiate_final_energy_with_json()
     energy_systems_catalogue=load_energy_system_catalogue()
-    consumption=[]
+    # Initialize total_electricity_use with the base consumption profile
+    total_electricity_use = time_series_to_array(consumption_profile.get(ELECTRICITY_CONSUMPTION), timestep_count)
+    # Without electricity assets the self consumption indicators are zero and the grid supplies all the electricity
+    total_PV = np.zeros(timestep_count)
+    self_consumption = np.zeros(timestep_count)
+    rate_of_self_consumption = np.zeros(timestep_count)
+    self_sufficiency = np.zeros(timestep_count)
+    grid_consumption = None
+    # systems already supplied by a heat pump asset, their electricity is taken from the asset and not from the profile
+    systems_with_hp_asset = set()
     if building_energy_asset is not None:
-        # Initialize total_electricity_use with the base consumption profile
-        total_electricity_use = consumption_profile.get(ELECTRICITY_CONSUMPTION, [])
         for asset in building_energy_asset:
-            if asset[GENERATION_SYSTEM_ID] in list_of_hps:
-                # Perform element-wise summation for time_series_input1
-                time_series_input1_values =asset[AVAILABILITY_TS][VALUE_INPUT1].copy()
-                total_electricity_use = [
-                            total_electricity_use[i] + time_series_input1_values[i]
-                            for i in range(len(total_electricity_use))
-                        ]
-                if asset[GENERATION_SYSTEM_ID] in cooling_hps_list:
-                    cooling_asset = True
-                if asset[GENERATION_SYSTEM_ID] in dhw_hps_list:
-                    dhw_asset = True
-                if asset[GENERATION_SYSTEM_ID] in heating_hps_list:
-                    heating_asset = True
-            #falta ..
-
-        for system_name, system_id in generation_system_profile.items():
-            # Check if the value is an integer (system ID)
-            if not isinstance(system_id, int):
-                continue  # Skip if the value is not an integer
-            #System_id is an integer, you can safely check it
-            #Get consumption
-            consumption, system_type=check_system_type_to_get_consumption(system_name, consumption_profile)
-            if system_name == DHW_SYSTEM_ID and system_id in dhw_hps_list and dhw_asset == False:
-                total_electricity_use = add_electricity_consumption(total_electricity_use, consumption)
-            elif system_name ==HEATING_SYSTEM_ID and system_id in heating_hps_list and heating_asset == False:
-                total_electricity_use = add_electricity_consumption(total_electricity_use, consumption)
-            elif system_name ==COOLING_SYSTEM_ID and system_id in cooling_hps_list and cooling_asset == False:
-                #If cooling_system_id is in list_of_new_hps and is not already found in asset["generation_system_id],
-                # the program will proceed to sum the corresponding cool_consumption values with total_electricity_use for each hour.
-                total_electricity_use = add_electricity_consumption(total_electricity_use, consumption)
-            elif system_name == DHW_SYSTEM_ID and dhw_asset == False and generation_system_profile[system_type] is not None:
-                fuels_id=generation_system_profile[system_type][ENERGY_CARRIER_INPUT1_ID ]
-                total_final_energy[fuels_id].add_new_consumption(consumption)
-            elif system_name == HEATING_SYSTEM_ID and heating_asset == False and generation_system_profile[system_type] is not None:
-                fuels_id=generation_system_profile[system_type][ENERGY_CARRIER_INPUT1_ID ]
-                total_final_energy[fuels_id].add_new_consumption(consumption)
-            elif system_name == COOLING_SYSTEM_ID and cooling_asset == False and generation_system_profile[system_type] is not None:
-                fuels_id=generation_system_profile[system_type][ENERGY_CARRIER_INPUT1_ID ]
-                total_final_energy[fuels_id].add_new_consumption(consumption)
+            if asset[GENERATION_SYSTEM_ID] in LIST_OF_HPS:
+                total_electricity_use += time_series_to_array(asset[AVAILABILITY_TS][VALUE_INPUT1], timestep_count)
+                for system_name, (consumption_name, system_type, hps_list) in SYSTEMS_CONSUMPTION.items():
+                    if asset[GENERATION_SYSTEM_ID] in hps_list:
+                        systems_with_hp_asset.add(system_name)
+
+    for system_name, system_id in generation_system_profile.items():
+        # Check if the value is an integer (system ID) of a heating, cooling or dhw system
+        if not isinstance(system_id, int) or system_name not in SYSTEMS_CONSUMPTION:
+            continue
+        if system_name in systems_with_hp_asset:
+            continue
+        consumption_name, system_type, hps_list = SYSTEMS_CONSUMPTION[system_name]
+        consumption = time_series_to_array(consumption_profile.get(consumption_name), timestep_count)
+        if system_id in hps_list:
+            # heat pumps consume electricity
+            total_electricity_use += consumption
+        elif generation_system_profile.get(system_type) is not None:
+            # this means is not a heat pump but other type of system, therefore its fuel is consumed
+            fuels_id=generation_system_profile[system_type][ENERGY_CARRIER_INPUT1_ID]
+            total_final_energy[fuels_id].add_new_consumption(consumption)
 
+    if building_energy_asset is not None:
         for asset in building_energy_asset:
-            if asset[GENERATION_SYSTEM_ID] in electric_asset_list:
+            if asset[GENERATION_SYSTEM_ID] in ELECTRIC_ASSET_LIST:
                 # PV system, scale output by pmax_scalar
-                # Perform element-wise summation for time_series_input1
-                time_series_input1_values =asset[AVAILABILITY_TS][VALUE_INPUT1].copy()
-                total_PV = [x * asset[PMAX_SCALAR] for x in time_series_input1_values]
-                electricity_asset = True
-                # Calculate self-consumption
+                total_PV = time_series_to_array(asset[AVAILABILITY_TS][VALUE_INPUT1], timestep_count) * asset[PMAX_SCALAR]
                 self_consumption = calculate_self_consumption(total_electricity_use, total_PV)
-
-                # Calculate rate of self-consumption
                 rate_of_self_consumption = calculate_rate_of_self_consumption(self_consumption, total_PV)
-
-                # Calculate grid consumption
                 grid_consumption = calculate_grid_consumption(total_electricity_use, self_consumption)
-
-                #Calculate self-sufficiency
                 self_sufficiency = calculate_self_sufficiency(self_consumption, total_electricity_use)
-            if asset[GENERATION_SYSTEM_ID] not in list_of_hps and asset[
-                GENERATION_SYSTEM_ID] not in electric_asset_list:
-                    time_series_input1_values = asset[AVAILABILITY_TS][VALUE_INPUT1].copy()
-                    total_input1 = [x * asset[PMAX_SCALAR] for x in time_series_input1_values]
-                    system = filter_energy_systems_catalogue(energy_systems_catalogue, asset[GENERATION_SYSTEM_ID])
-                    fuels_id=int(system[ENERGY_CARRIER_INPUT1_ID ])
-                    total_final_energy[fuels_id].add_new_consumption(total_input1)
-
-        if electricity_asset == False:
-            # If no electricity asset, set grid_consumption equal to total_electricity_use
-            grid_consumption = total_electricity_use
-            # Set rate_of_self_consumption and self_sufficiency to lists of 8760 zeros
-            self_consumption = [0] * timestep_count
-            rate_of_self_consumption = [0] * timestep_count
-            self_sufficiency = [0] * timestep_count
-            total_PV =[0] * timestep_count
-    else:
-        #there is no asset in this building
-        # Initialize total_electricity_use with the base consumption profile
-        total_electricity_use = consumption_profile[ELECTRICITY_CONSUMPTION].copy()
-        for system_name, system_id in generation_system_profile.items():
-            # Check if the value is an integer (system ID)
-            if not isinstance(system_id, int):
-                continue  # Skip if the value is not an integer
-            # Get consumption
-            consumption, system_type = check_system_type_to_get_consumption(system_name, consumption_profile)
-                # Now, system_id is an integer, and you can safely check it
-            if system_name == DHW_SYSTEM_ID and system_id in dhw_hps_list:
-                total_electricity_use = add_electricity_consumption(total_electricity_use, consumption)
-            elif system_name == HEATING_SYSTEM_ID and system_id in heating_hps_list:
-                total_electricity_use = add_electricity_consumption(total_electricity_use, consumption)
-            elif system_name == COOLING_SYSTEM_ID and system_id in cooling_hps_list:
-                total_electricity_use = add_electricity_consumption(total_electricity_use, consumption)
-            elif system_name == ELECTRICITY_SYSTEM_ID and system_id == 79:
-                # This is the grid
-                # grid_consumption equal to total_electricity_use
-                grid_consumption = total_electricity_use
-                # Set rate_of_self_consumption and self_sufficiency to lists of 8760 zeros
-                self_consumption = [0] * timestep_count
-                rate_of_self_consumption = [0] * timestep_count
-                self_sufficiency = [0] * timestep_count
-                total_PV =[0] * timestep_count
-            #consumption_profile
-            else:
-                #this means is not a heat pump nor electricity grid but other type of system, therefore:
-                if generation_system_profile[system_type] is not None:
-                    fuels_id=generation_system_profile[system_type][ENERGY_CARRIER_INPUT1_ID ]
-                    total_final_energy[fuels_id].add_new_consumption(consumption)
-
+            elif asset[GENERATION_SYSTEM_ID] not in LIST_OF_HPS:
+                total_input1 = time_series_to_array(asset[AVAILABILITY_TS][VALUE_INPUT1], timestep_count) * asset[PMAX_SCALAR]
+                system = energy_systems_catalogue.get(asset[GENERATION_SYSTEM_ID])
+                fuels_id=int(system[ENERGY_CARRIER_INPUT1_ID])
+                total_final_energy[fuels_id].add_new_consumption(total_input1)
+
+    if grid_consumption is None:
+        # If no electricity asset, set grid_consumption equal to total_electricity_use
+        grid_consumption = total_electricity_use
     total_final_energy[12].add_new_consumption(grid_consumption)
     KPIs = {}  # Dictionary to store the BuildingKPIs objects
 
@@ -368,7 +319,7 @@ def calculate_building_indicators(consumption_profile, generation_system_profile
             if ENERGY_CARRIER_INPUT1 in system and system[ENERGY_CARRIER_INPUT1].get("final") == True:
                 # Get the ID and KPI data
                 energy_carrier_id = system[ENERGY_CARRIER_INPUT1]["id"]
-                print(system)
+                kpi_data = None
                 if isinstance(system[ENERGY_CARRIER_INPUT1][NATIONAL_ENERGY_CARRIER_DATA], list):
                     kpi_data = system[ENERGY_CARRIER_INPUT1][NATIONAL_ENERGY_CARRIER_DATA][0] #aquí se debería filtrar por country_id...
                 elif isinstance(system[ENERGY_CARRIER_INPUT1][NATIONAL_ENERGY_CARRIER_DATA], dict):
@@ -376,305 +327,714 @@ def calculate_building_indicators(consumption_profile, generation_system_profile
                 if kpi_data is not None:
                     KPIs[energy_carrier_id] = BuildingKPIs(total_final_energy[energy_carrier_id], kpi_data)
 
-
-    return (total_PV,rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
+    return (total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
             total_final_energy, KPIs)
 
-def aggregate_demand_profiles(demand_profile):
-    # Initialize a dictionary to store the aggregated demand
-    total_demand = {}
+
+def calculate_building_indicators(consumption_profile, generation_system_profile, building_energy_asset,timestep_count):
+    """
+
+    Parameters
+    ----------
+    consumption_profile is the dictionary of consumption, typically:
+        BUILDING_CONSUMPTION:{
+            "id": int,
+            HEAT_CONSUMPTION:[],
+            DHW_CONSUMPTION:[],
+            ELECTRICITY_CONSUMPTION:[],
+            COOL_CONSUMPTION:[]
+            }
+    generation_system_profile is the dictionary of the energy systems
+    building_energy_asset is a list of several assets
+
+    Returns
+    -------
+    total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption as lists,
+    total_final_energy and KPIs. The calculation is done by calculate_building_indicators_arrays.
+    """
+    (total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
+     total_final_energy, KPIs) = calculate_building_indicators_arrays(consumption_profile, generation_system_profile,
+                                                                      building_energy_asset, timestep_count)
+
+    return (total_PV.tolist(), rate_of_self_consumption.tolist(), self_sufficiency.tolist(),
+            total_electricity_use.tolist(), self_consumption.tolist(), total_final_energy, KPIs)
+
+def aggregate_time_series(values, resolution, mean=False):
+    """
+    Aggregates an hourly time series to the given resolution.
+    :param values: hourly values (list or array), numbers are returned as they are
+    :param resolution: HOURLY, DAILY, MONTHLY or YEARLY
+    :param mean: average the hours instead of summing them (ratios)
+    :return: the same values for HOURLY, a list of daily or monthly values or the yearly value
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {RESOLUTIONS}, not {resolution}")
+    if resolution == HOURLY or not isinstance(values, (list, tuple, np.ndarray)):
+        return values
+    values = np.asarray(values, dtype=float)
+    if resolution == YEARLY:
+        return float(values.mean() if mean else values.sum())
+    if resolution == DAILY:
+        if len(values) % 24 != 0:
+            raise ValueError(f"Daily aggregates need whole days of hourly values, not {len(values)} values")
+        days = values.reshape(-1, 24)
+        return (days.mean(axis=1) if mean else days.sum(axis=1)).tolist()
+    if len(values) != sum(HOURS_PER_MONTH):
+        raise ValueError(f"Monthly aggregates need {sum(HOURS_PER_MONTH)} hourly values, not {len(values)} values")
+    months = np.add.reduceat(values, MONTH_START_HOURS)
+    return (months / HOURS_PER_MONTH if mean else months).tolist()
+
+
+def aggregate_citizen_KPIs(citizen_KPIs, resolution, hourly_length=None):
+    """
+    Returns the citizen KPIs of a building with their time series aggregated to the given resolution.
+    If hourly_length is given only the time series of that length are aggregated, the rest are already aggregated.
+    """
+    if resolution == HOURLY:
+        return citizen_KPIs
+    return [kpi if hourly_length is not None and (not isinstance(kpi["value"], (list, tuple, np.ndarray))
+                                                 or len(kpi["value"]) != hourly_length)
+            else {**kpi, "value": aggregate_time_series(kpi["value"], resolution, mean=kpi["name"] in MEAN_KPIS)}
+            for kpi in citizen_KPIs]
+
+
+def demand_profiles_matrix(demand_profile):
+    """
+    Builds the columnar store (buildings x timesteps matrix per demand type) of the demand profiles.
+    demand_profile is either a list of {DEMAND_PROFILE: {...}} (one per building) or a single dictionary.
+    """
+    demand_matrix = CommunityMatrix()
     # Check if demand_profile is a list or a dictionary
     if isinstance(demand_profile, list):
         # Loop over each building"s demand profile in the list
-        for building in demand_profile:
-            # Get the specific demand profile dictionary for each building
-            profile = building.get(DEMAND_PROFILE, {})
-
-            # Loop through each demand type in the building"s demand profile
-            for demand_type, demand_values in profile.items():
-                # If the demand type is already in total_demand, sum it element-wise
-                if demand_type in total_demand:
-                    total_demand[demand_type] = [
-                        total_demand[demand_type][i] + demand_values[i]
-                        for i in range(len(demand_values))
-                    ]
-                else:
-                    # If it"s the first occurrence, initialize it in total_demand
-                    total_demand[demand_type] = demand_values
-
+        for building_idx, building in enumerate(demand_profile):
+            demand_matrix.add_building(building_idx, building.get(DEMAND_PROFILE, {}))
     elif isinstance(demand_profile, dict):
         # If demand_profile is a single dictionary, process it directly
-        for demand_type, demand_values in demand_profile.get(DEMAND_PROFILE, {}).items():
-            if demand_type in total_demand:
-                total_demand[demand_type] = [
-                    total_demand[demand_type][i] + demand_values[i]
-                    for i in range(len(demand_values))
-                ]
-            else:
-                total_demand[demand_type] = demand_values
-
+        demand_matrix.add_building(0, demand_profile.get(DEMAND_PROFILE, {}))
     else:
         raise TypeError("demand_profile must be either a list or a dictionary.")
+    return demand_matrix
 
-    return total_demand
 
+def aggregate_demand_profiles(demand_profile, as_matrix=False):
+    """
+    Sums the demand profiles of all the buildings per demand type.
+    If as_matrix is True the CommunityMatrix is returned instead of the dictionary of totals, so community_KPIs
+    can take the peaks from it.
+    """
+    demand_matrix = demand_profiles_matrix(demand_profile)
+    if as_matrix:
+        return demand_matrix
+    return demand_matrix.totals()
 
-def community_KPIs(citizen_KPIs,total_demand):
-    # Initialize an empty dictionary to hold the sum of each KPI
-    aggregate_KPIs = {}
 
-    # Loop through each building"s KPI data in citizen_KPIs
+def citizen_KPIs_matrix(citizen_KPIs):
+    """
+    Builds the columnar store (buildings x timesteps matrix per KPI) of the citizen KPIs of every building.
+    """
+    kpis_matrix = CommunityMatrix()
     for building_id, kpis in citizen_KPIs.items():
-        # Loop through each KPI entry for the building
-        for kpi in kpis:
-            kpi_name = kpi["name"]
-            kpi_value = kpi["value"]
-            # Check if the KPI value is a number (int or float)
-            if isinstance(kpi_value, (int, float)):
-                # If the KPI name already exists in the aggregate dictionary, add to its value
-                if kpi_name in aggregate_KPIs:
-                    aggregate_KPIs[kpi_name]["value"] += kpi_value
-                else:
-                    # Initialize the entry in the aggregate dictionary with the current value and unit
-                    aggregate_KPIs[kpi_name] = {"value": kpi_value, "unit": kpi["unit"]}
-
-            # Check if the KPI value is a list (time series data)
-            elif isinstance(kpi_value, list):
-                # Determine the length of the time series if not provided
-                timestep_count = len(kpi_value)
-
-                # If the KPI name already exists, add each timestep"s value element-wise
-                if kpi_name in aggregate_KPIs:
-                    aggregate_KPIs[kpi_name]["value"] = [
-                        aggregate_KPIs[kpi_name]["value"][i] + kpi_value[i]
-                        for i in range(timestep_count)
-                    ]
-                else:
-                    # Initialize the entry in the aggregate dictionary with the list and unit
-                    aggregate_KPIs[kpi_name] = {"value": kpi_value, "unit": kpi["unit"]}
-
-    aggregate_KPIs["KPI_peak_heat_demand_[kWh]"]={"value": max(total_demand[HEATING_DEMAND]),"unit": "kWh"}
-    aggregate_KPIs["KPI_peak_dhw_demand_[kWh]"]={"value":max(total_demand[DHW_DEMAND]),"unit": "kWh"}
-    aggregate_KPIs["KPI_peak_cooling_demand_[kWh]"]={"value": max(total_demand[COOLING_DEMAND]),"unit": "kWh"}
-    aggregate_KPIs["KPI_peak_elec_demand_[kWh]"]={"value": max(total_demand[ELECTRICITY_DEMAND]),"unit": "kWh"}
-    aggregate_KPIs["KPI_peak_electricity_consumption_[kWh]"]={"value": max(aggregate_KPIs[FINAL_ENERGY_ELECTRICITY_GRID]["value"]),"unit": "kWh"}
+        kpis_matrix.add_building(building_id, {kpi["name"]: kpi["value"] for kpi in kpis},
+                                 units={kpi["name"]: kpi["unit"] for kpi in kpis})
+    return kpis_matrix
+
+
+def get_peak(total_demand, demand_type):
+    if isinstance(total_demand, CommunityMatrix):
+        return total_demand.peak(demand_type)
+    return float(np.max(total_demand[demand_type]))
+
+
+def community_KPIs(citizen_KPIs,total_demand, resolution=HOURLY, electricity_grid=None):
+    """
+    Sums the KPIs of all the buildings and adds the community peaks.
+    total_demand is the dictionary returned by aggregate_demand_profiles or its CommunityMatrix (as_matrix=True).
+    resolution is the resolution of the summed KPIs (HOURLY, DAILY, MONTHLY or YEARLY), the citizen KPIs can be
+    hourly or already aggregated to it (see recalculate_indicators).
+    electricity_grid is the hourly grid electricity consumption of the community (see get_indicators_from_baseline),
+    by default it is taken from the demand profiles or from the hourly citizen KPIs.
+    """
+    hourly_length = len(get_demand_series(total_demand, HEATING_DEMAND))
+    if electricity_grid is None and not has_demand_series(total_demand, FINAL_ENERGY_ELECTRICITY_GRID):
+        # hourly citizen KPIs, the community peak is taken from them before they are aggregated
+        grid_profiles = [kpi["value"] for kpis in citizen_KPIs.values() for kpi in kpis
+                         if kpi["name"] == FINAL_ENERGY_ELECTRICITY_GRID]
+        if any(not isinstance(values, (list, tuple, np.ndarray)) or len(values) != hourly_length
+               for values in grid_profiles):
+            raise ValueError("The community peak needs the hourly grid electricity consumption, in the citizen "
+                             "KPIs or in the demand profiles (see recalculate_indicators)")
+        if resolution != HOURLY:
+            electricity_grid = np.sum(grid_profiles, axis=0)
+    if resolution != HOURLY:
+        # buildings kept hourly (hourly_buildings) are aggregated before summing them with the rest
+        citizen_KPIs = {building_id: aggregate_citizen_KPIs(kpis, resolution, hourly_length)
+                        for building_id, kpis in citizen_KPIs.items()}
+    # Reduce every KPI over the buildings in one vectorized pass
+    kpis_matrix = citizen_KPIs_matrix(citizen_KPIs)
+    kpi_totals = {kpi_name: kpis_matrix.total(kpi_name) for kpi_name in kpis_matrix.names()}
+    return community_KPIs_from_totals(kpi_totals, kpis_matrix.units, total_demand, resolution, electricity_grid)
+
+
+def has_demand_series(total_demand, demand_type):
+    if isinstance(total_demand, CommunityMatrix):
+        return demand_type in total_demand.names()
+    return demand_type in total_demand
+
+
+def get_demand_series(total_demand, demand_type):
+    """Returns the total of a demand type from the dictionary of totals or the CommunityMatrix."""
+    if isinstance(total_demand, CommunityMatrix):
+        return total_demand.total(demand_type)
+    return total_demand[demand_type]
+
+
+def community_KPIs_from_totals(kpi_totals, units, total_demand, resolution=HOURLY, electricity_grid=None):
+    """
+    Builds the community indicators from the KPIs already summed over the buildings.
+    :param kpi_totals: dictionary of KPI name: community total (array or number)
+    :param units: dictionary of KPI name: unit
+    :param total_demand: total demand per demand type (dictionary or CommunityMatrix)
+    :param resolution: resolution of the KPI totals in the output, the peaks are always hourly
+    :param electricity_grid: hourly grid electricity consumption of the community, by default it is taken from
+    the demand (when the citizen KPIs are aggregated) or from the KPI totals
+    """
+    # the peaks are taken from the hourly series, before the totals are aggregated
+    if electricity_grid is None:
+        if has_demand_series(total_demand, FINAL_ENERGY_ELECTRICITY_GRID):
+            # hourly grid consumption added to the demand profiles when the citizen KPIs are aggregated
+            electricity_grid = np.asarray(get_demand_series(total_demand, FINAL_ENERGY_ELECTRICITY_GRID))
+        else:
+            electricity_grid = kpi_totals[FINAL_ENERGY_ELECTRICITY_GRID]
+    hourly_length = len(get_demand_series(total_demand, HEATING_DEMAND))
+
+    aggregate_KPIs = {}
+    for kpi_name, kpi_value in kpi_totals.items():
+        if isinstance(kpi_value, np.ndarray):
+            if len(kpi_value) == hourly_length:
+                kpi_value = aggregate_time_series(kpi_value, resolution, mean=kpi_name in MEAN_KPIS)
+            if isinstance(kpi_value, np.ndarray):
+                kpi_value = kpi_value.tolist()
+        aggregate_KPIs[kpi_name] = {"value": kpi_value, "unit": units[kpi_name]}
+
+    aggregate_KPIs["KPI_peak_heat_demand_[kWh]"]={"value": get_peak(total_demand, HEATING_DEMAND),"unit": "kWh"}
+    aggregate_KPIs["KPI_peak_dhw_demand_[kWh]"]={"value": get_peak(total_demand, DHW_DEMAND),"unit": "kWh"}
+    aggregate_KPIs["KPI_peak_cooling_demand_[kWh]"]={"value": get_peak(total_demand, COOLING_DEMAND),"unit": "kWh"}
+    aggregate_KPIs["KPI_peak_elec_demand_[kWh]"]={"value": get_peak(total_demand, ELECTRICITY_DEMAND),"unit": "kWh"}
+    aggregate_KPIs["KPI_peak_electricity_consumption_[kWh]"]={
+        "value": float(np.max(electricity_grid)) if isinstance(electricity_grid, np.ndarray) else electricity_grid,
+        "unit": "kWh"}
     # `aggregate_KPIs` now contains the summed values for each KPI across all buildings
     return aggregate_KPIs
 
 
 def get_totals_per_building (KPIs,timestep_count,final_energy):
+    """
+    Totals of the KPIs of the energy carriers of a building, the citizen equivalences and the final energy per
+    energy carrier. The time series are numpy arrays, they are converted to lists for the output
+    (citizen_KPIs_to_lists) or aggregated (aggregate_citizen_KPIs).
+    """
     # Initialize totals for the current building
-    total_primary_energy= [0] * timestep_count
-    total_primary_energy_renewable = [0] * timestep_count
-    total_primary_energy_non_renewable = [0] * timestep_count
-    total_non_h_costs = [0] * timestep_count
-    total_h_costs = [0] * timestep_count
-    total_co2= [0] * timestep_count
+    total_primary_energy = np.zeros(timestep_count)
+    total_primary_energy_renewable = np.zeros(timestep_count)
+    total_primary_energy_non_renewable = np.zeros(timestep_count)
+    total_non_h_costs = np.zeros(timestep_count)
+    total_h_costs = np.zeros(timestep_count)
+    total_co2 = np.zeros(timestep_count)
     for id_carrier, energy_instance in KPIs.items():
         if energy_instance is not None:
-            # Use dot notation to access the energy instance attributes
-            total_primary_energy = [
-                total_primary_energy[i] + energy_instance.PEF_total[i]
-                for i in range(timestep_count)
-            ]
-
-            total_primary_energy_renewable = [
-                total_primary_energy_renewable[i] + energy_instance.PEF_ren[i]
-                for i in range(timestep_count)
-            ]
-
-            total_primary_energy_non_renewable = [
-                total_primary_energy_non_renewable[i] + energy_instance.PEF_nren[i]
-                for i in range(timestep_count)
-            ]
-
-            total_non_h_costs = [
-                total_non_h_costs[i] + energy_instance.non_h_costs[i]
-                for i in range(timestep_count)
-            ]
-
-            total_h_costs= [
-                total_h_costs[i] + energy_instance.household_costs[i]
-                for i in range(timestep_count)
-            ]
-
-            total_co2 = [
-                total_co2[i] + energy_instance.co2[i]
-                for i in range(timestep_count)
-            ]
+            total_primary_energy += energy_instance.PEF_total[:timestep_count]
+            total_primary_energy_renewable += energy_instance.PEF_ren[:timestep_count]
+            total_primary_energy_non_renewable += energy_instance.PEF_nren[:timestep_count]
+            total_non_h_costs += energy_instance.non_h_costs[:timestep_count]
+            total_h_costs += energy_instance.household_costs[:timestep_count]
+            total_co2 += energy_instance.co2[:timestep_count]
     total_primary_energy_kWh = total_primary_energy  # it is already in kWh unless we decide otherwise
-    total_co2_kg = [x / 1000 for x in total_co2]
-    # Extract dictionary of citizen_kpis_factors
-    citizen_kpis_factors = kpi_ctz_factors()
-    # KPI Equivalent TV hours
-    TV_h = tv_h(citizen_kpis_factors=citizen_kpis_factors,
-                total_primary_energy=total_primary_energy_kWh)
-    # KPI Equivalent streaming hours
-    streaming_hours = streaming_h(citizen_kpis_factors=citizen_kpis_factors,
-                                  total_primary_energy=total_primary_energy_kWh)
-    # KPI equivalent pizza items
-    Pizza_h = pizza_h(citizen_kpis_factors=citizen_kpis_factors,
-                      total_primary_energy=total_primary_energy_kWh)
-    # Equivalent battery usage estimation
-    Battery_charges = battery_charges(citizen_kpis_factors=citizen_kpis_factors,
-                                      total_primary_energy=total_primary_energy_kWh)
-    # Equivalent electric car charging times
-    ElCar_charges = el_car_charges(citizen_kpis_factors=citizen_kpis_factors,
-                                   total_primary_energy=total_primary_energy_kWh)
-    # Equivalent trees - - CO2
-    Trees_number = trees_number(citizen_kpis_factors=citizen_kpis_factors, total_co2=total_co2_kg)
-
-    # Equivalent Streaming impact in emissions - - CO2
-    streaming_emissionhours = streaming_emission_hours(citizen_kpis_factors=citizen_kpis_factors,
-                                                       total_co2=total_co2_kg)
-    # - - CO2
-    ICV_km = icv_km(citizen_kpis_factors=citizen_kpis_factors, total_co2=total_co2_kg)
-    # Equivalent wine bottles produced - - CO2
-    Wine_bottles = wine_bottles(citizen_kpis_factors=citizen_kpis_factors,
-                                total_primary_energy=total_primary_energy_kWh)
+    total_co2_kg = total_co2 / 1000
+    # All the citizen equivalences (TV hours, pizza, trees...) in one pass over the table of equivalences
+    equivalences = citizen_equivalences(citizen_kpis_factors=kpi_ctz_factors(),
+                                        bases={TOTAL_PRIMARY_ENERGY: total_primary_energy_kWh, TOTAL_CO2: total_co2_kg})
     FinalEnergy_dic = {}
 
     for key, energy_instance in final_energy.items():
         # Check if there"s any non-zero value in hourly_data
-        if any(value > 0 for value in energy_instance.hourly_data):
+        if np.any(energy_instance.hourly_data > 0):
             # Add to the dictionary with the appropriate name as key
             FinalEnergy_dic[f"final_energy_{energy_instance.name}"] = energy_instance.hourly_data
 
-    return (total_primary_energy_kWh, total_co2,total_primary_energy_non_renewable, total_primary_energy_renewable,
-            total_h_costs, total_non_h_costs, TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges, Trees_number,
-            streaming_emissionhours, ICV_km, Wine_bottles,FinalEnergy_dic)
-
-
-
-
-def recalculate_indicators (community_context):
-    rate_of_self_consumption={}
-    self_sufficiency={}
-    total_electricity_use={}
-    self_consumption={}
-    total_final_energy={}
-    total_PV={}
-    #groups
-    KPIs={}
-    citizen_KPIs={}
-    # Totals
-    total_primary_energy = {}
-    total_primary_energy_renewable = {}
-    total_primary_energy_non_renewable = {}
-    total_non_h_costs = {}
-    total_h_costs = {}
-    total_co2 = {}
-    hourly_KPIs = {}
-    demand_profiles_context=[]
+    return (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
+            total_h_costs, total_non_h_costs, equivalences, FinalEnergy_dic)
+
+
+
+
+def citizen_KPIs_to_lists(citizen_KPIs):
+    """Returns the citizen KPIs of a building with their time series (numpy arrays) as lists, for the output."""
+    return [{**kpi, "value": kpi["value"].tolist()} if isinstance(kpi["value"], np.ndarray) else kpi
+            for kpi in citizen_KPIs]
+
+
+def number_citizen_KPIs(citizen_KPIs):
+    """Returns the citizen KPIs of a building with consecutive ids (from 1) in their order."""
+    return [{"id": kpi_id, **kpi} for kpi_id, kpi in enumerate(citizen_KPIs, start=1)]
+
+
+def get_building_id(building_asset_context, idx):
+    # Handle building_id: If it doesn"t exist, assign an incremented id
+    return building_asset_context.get("id", f"building_{idx + 1}")  # Incremental ID if missing
+
+
+def calculate_building_citizen_KPIs(building_asset_context, timestep_count, idx=0, resolution=HOURLY,
+                                    electricity_grid_in_demand=False):
+    """
+    Calculates the citizen KPIs of one building of the building_asset_context. It only depends on the building, so
+    it can be run in a worker process.
+    :param building_asset_context: building of the community context
+    :param timestep_count: timestep count of the community context, if None it is taken from the consumption profile
+    :param idx: position of the building in the community context, used to name buildings without id
+    :param resolution: resolution of the time series of the citizen KPIs (HOURLY, DAILY, MONTHLY or YEARLY)
+    :param electricity_grid_in_demand: add the hourly grid electricity consumption to the returned demand profile,
+    so the community peak can be calculated when the citizen KPIs are aggregated
+    :return: building_id, citizen KPIs (list of dictionaries) and demand profile of the building
+    """
+    building_id = get_building_id(building_asset_context, idx)
+
+    # Handle consumption_profile: Raise an error if it doesn"t exist
+    if BUILDING_CONSUMPTION not in building_asset_context or building_asset_context[BUILDING_CONSUMPTION] is None:
+        raise ValueError(f"Consumption profile does not exist for building ID: {building_id}")
+
+    consumption_profile = building_asset_context[BUILDING_CONSUMPTION]
+
+    # Handle timestep_count: If null, use the length of any of the consumption profile arrays
+    if timestep_count is None:
+        if len(consumption_profile) > 0:
+            timestep_count = len(next(iter(consumption_profile.values())))  # Length of first consumption array
+        else:
+            raise ValueError(f"Timestep count could not be determined for building ID: {building_id}")
+
+    # Handle building_energy_asset: Assign None if it doesn"t exist
+    building_energy_asset = building_asset_context.get("building_energy_asset", None)
+
+    # Handle generation_system_profile: Assign None if it doesn"t exist
+    generation_system_profile = building_asset_context.get(GENERATION_SYSTEM_PROFILE, None)
+    demand_profile = handle_demand_profile(building_asset_context, generation_system_profile, consumption_profile)
+
+    # Calculate building indicators, the time series are kept as arrays until the output
+    (total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
+     total_final_energy, KPIs) = calculate_building_indicators_arrays(consumption_profile, generation_system_profile,
+                                                                      building_energy_asset, timestep_count)
+
+    (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
+     total_h_costs, total_non_h_costs, equivalences, FinalEnergy_dic) = get_totals_per_building(
+        KPIs, timestep_count=timestep_count, final_energy=total_final_energy)
+    # calculate peak heat demand
+    KPI_peak_heat_demand = max(demand_profile[HEATING_DEMAND])
+    # calculate peak cooling demand
+    KPI_peak_elec_demand = float(np.max(total_electricity_use))
+
+    # Store citizen KPIs for the building
+    citizen_KPIs = [
+        {"name": "KPI_peak_heat_demand_[kWh]", "value": KPI_peak_heat_demand, "unit": "kWh"},
+        {"name": "KPI_peak_elec_demand_[kWh]", "value": KPI_peak_elec_demand, "unit": "kWh"},
+        {"name": "total_primary_energy_[kWh]", "value": total_primary_energy_kWh, "unit": "kWh"},
+        {"name": "num_members", "value": 0, "unit": "a.u."},
+        # citizen equivalences, in the order of CITIZEN_EQUIVALENCES
+        *({"name": equivalence["name"], "value": equivalences[equivalence["name"]], "unit": equivalence["unit"]}
+          for equivalence in CITIZEN_EQUIVALENCES),
+        {"name": "Total_PV_[kWh]", "value": total_PV, "unit": "kWh"},
+        {"name": "Total_self_consumption", "value": self_consumption, "unit": "a.u."},
+        {"name": "Total_self_sufficiency", "value": self_sufficiency, "unit": "a.u."},
+        {"name": "rate_of_self_consumption", "value": rate_of_self_consumption, "unit": "%"},
+        {"name": "renewable_primary_energy_[kWh]", "value": float(total_primary_energy_renewable[building_id]), "unit": "kWh"},
+        {"name": "non_renewable_primary_energy_[kWh]", "value": float(total_primary_energy_non_renewable[building_id]), "unit": "kWh"},
+        {"name": "non_households_costs_[€]", "value": float(total_non_h_costs[building_id]), "unit": "€"},
+        {"name": "households_costs_[€]", "value": float(total_h_costs[building_id]), "unit": "€"},
+        {"name": "Total_co2", "value": float(total_co2[building_id]), "unit": "g"},
+    ]
+    for key, energy_instance in FinalEnergy_dic.items():
+        citizen_KPIs.append({"name": key, "value": energy_instance, "unit": "kWh"})
+    if electricity_grid_in_demand and FINAL_ENERGY_ELECTRICITY_GRID in FinalEnergy_dic:
+        # copy, the demand profile may be the one of the building asset context
+        demand_profile = {**demand_profile,
+                          FINAL_ENERGY_ELECTRICITY_GRID: FinalEnergy_dic[FINAL_ENERGY_ELECTRICITY_GRID].tolist()}
+    citizen_KPIs = number_citizen_KPIs(citizen_KPIs)
+    if resolution == HOURLY:
+        return building_id, citizen_KPIs_to_lists(citizen_KPIs), demand_profile
+    # the hourly arrays are aggregated directly, without hourly lists
+    return building_id, aggregate_citizen_KPIs(citizen_KPIs, resolution), demand_profile
+
+
+def _calculate_building_citizen_KPIs_task(task):
+    """Unpacks a (building_asset_context, timestep_count, idx) task, used as the process pool function."""
+    return calculate_building_citizen_KPIs(*task)
+
+
+def recalculate_indicators (community_context, max_workers=None, executor=None, resolution=HOURLY,
+                            hourly_buildings=None):
+    """
+    Calculates the citizen KPIs and demand profiles of every building in the community context. The buildings are
+    independent until community_KPIs sums them, so they can optionally be sharded across a process pool.
+    :param community_context: community context with building_asset_context
+    :param max_workers: number of worker processes. None or 1 calculates the buildings serially
+    :param executor: concurrent.futures executor to reuse across calls, it takes precedence over max_workers
+    :param resolution: resolution of the time series of the citizen KPIs (HOURLY, DAILY, MONTHLY or YEARLY). When it
+    is not HOURLY the hourly lists are not kept and the demand profiles also get the hourly grid electricity
+    consumption, which community_KPIs needs for the community peak
+    :param hourly_buildings: ids of the buildings whose citizen KPIs are kept hourly whatever the resolution
+    :return: citizen_KPIs (dictionary per building id) and demand_profiles_context (list), in the order of the
+    buildings in the context whatever the number of workers
+    """
+    citizen_KPIs = {}
+    demand_profiles_context = []
     if BUILDING_ASSET_CONTEXT in community_context and isinstance(community_context[BUILDING_ASSET_CONTEXT], list):
-        for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
-            idx=0
-            # Check if GENERATION_SYSTEM_PROFILE_ID is in the building_dic
-            if GENERATION_SYSTEM_PROFILE_ID in building_asset_context:
-                # Handle building_id: If it doesn"t exist, assign an incremented id
-                building_id = building_asset_context.get("id", f"building_{idx + 1}")  # Incremental ID if missing
-
-                # Handle consumption_profile: Raise an error if it doesn"t exist
-                if BUILDING_CONSUMPTION not in building_asset_context or building_asset_context[
-                    BUILDING_CONSUMPTION] is None:
-                    raise ValueError(f"Consumption profile does not exist for building ID: {building_id}")
-
-                consumption_profile = building_asset_context[BUILDING_CONSUMPTION]
-
-                # Handle timestep_count: If null, use the length of any of the consumption profile arrays
-                timestep_count = community_context.get("timestep_count")
-                if timestep_count is None:
-                    if len(consumption_profile) > 0:
-                        timestep_count = len(
-                            next(iter(consumption_profile.values())))  # Length of first consumption array
-                    else:
-                        raise ValueError(f"Timestep count could not be determined for building ID: {building_id}")
-
-                # Handle building_energy_asset: Assign None if it doesn"t exist
-                building_energy_asset = building_asset_context.get("building_energy_asset", None)
-
-                # Handle generation_system_profile: Assign None if it doesn"t exist
-                generation_system_profile = building_asset_context.get(GENERATION_SYSTEM_PROFILE, None)
-                demand_profile=handle_demand_profile(building_asset_context,generation_system_profile,consumption_profile)
-                demand_profiles_context.append({DEMAND_PROFILE: demand_profile})
-                # Further processing such as adding to KPIs, calculating other values, etc.
-                #timestep_count=community_context["timestep_count"]
-                #building_id = building_asset_context["id"]
-                #building_energy_asset = building_asset_context["building_energy_asset"]
-                #generation_system_profile = building_asset_context[GENERATION_SYSTEM_PROFILE]
-                #consumption_profile = building_asset_context[BUILDING_CONSUMPTION]
-                #demand_profile=building_asset_context[BUILDING][DEMANDPROFILE]
-                hourly_KPIs[building_id] = {}
-                # Calculate building indicators
-                (
-                    total_PV[building_id],
-                    rate_of_self_consumption[building_id],
-                    self_sufficiency[building_id],
-                    total_electricity_use[building_id],
-                    self_consumption[building_id],
-                    total_final_energy[building_id],
-                    KPIs[building_id]
-                ) = calculate_building_indicators(consumption_profile, generation_system_profile, building_energy_asset,
-                                                  timestep_count)
-
-                # Add consumption_profile and demand_profile
-                for key, value in consumption_profile.items():
-                    hourly_KPIs[building_id].update({
-                        f"consumption_profile_{key}": value})
-
-                for key, value in demand_profile.items():
-                    hourly_KPIs[building_id].update({
-                        f"demand_profile_{key}" : value})
-                idx+=1
-
-            (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
-             total_h_costs, total_non_h_costs, TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges,
-             Trees_number,
-             streaming_emissionhours, ICV_km, Wine_bottles, FinalEnergy_dic) = get_totals_per_building(KPIs[building_id],
-                                                                                                       timestep_count=timestep_count,
-                                                                                                       final_energy=total_final_energy[building_id])
-            # calculate peak heat demand
-            KPI_peak_heat_demand = max(demand_profile[HEATING_DEMAND])
-            # calculate peak cooling demand
-            KPI_peak_elec_demand = max(total_electricity_use[building_id])
-
-            # Store citizen KPIs for the building
-            citizen_KPIs[building_id] = [
-                {"id": 1, "name": "KPI_peak_heat_demand_[kWh]", "value": KPI_peak_heat_demand, "unit": "kWh"},
-                {"id": 2, "name": "KPI_peak_elec_demand_[kWh]", "value": KPI_peak_elec_demand, "unit": "kWh"},
-                {"id": 3, "name": "total_primary_energy_[kWh]", "value": total_primary_energy_kWh, "unit": "kWh"},
-                {"id": 4, "name": "num_members", "value": 0, "unit": "a.u."},
-                {"id": 5, "name": "EquivalentTVHours_[h]", "value": TV_h, "unit": "h"},
-                {"id": 6, "name": "EquivalentstreamingHours_[h]", "value": streaming_hours, "unit": "h"},
-                {"id": 7, "name": "PizzaConsumptionComparison_[pizza]", "value": Pizza_h, "unit": "pizza"},
-                {"id": 8, "name": "BatteryUsageEstimation_[charges]", "value": Battery_charges,
-                 "unit": "charges"},
-                {"id": 9, "name": "ElectricCarChargingEstimation_[charges]", "value": ElCar_charges,
-                 "unit": "charges"},
-                {"id": 10, "name": "WineBottlesProduction_[bottles]", "value": Wine_bottles, "unit": "bottles"},
-                {"id": 11, "name": "TreesRequiredForCarbonOffset_[trees]", "value": Trees_number,
-                 "unit": "trees"},
-                {"id": 12, "name": "streamingEmissionsImpact_[hours]", "value": streaming_emissionhours,
-                 "unit": "hours"},
-                {"id": 13, "name": "CarbonEmissionsPerKilometer_[km]", "value": ICV_km, "unit": "km"},
-                {"id": 14, "name": "Total_PV_[kWh]", "value": total_PV[building_id], "unit": "kWh"},
-                {"id": 15, "name": "Total_self_consumption", "value": self_consumption[building_id], "unit": "a.u."},
-                {"id": 16, "name": "Total_self_sufficiency", "value": self_sufficiency[building_id], "unit": "a.u."},
-                {"id": 17, "name": "rate_of_self_consumption", "value": rate_of_self_consumption[building_id], "unit": "%"},
-                {"id": 18, "name": "renewable_primary_energy_[kWh]", "value": total_primary_energy_renewable[building_id], "unit": "kWh"},
-                {"id": 19, "name": "non_renewable_primary_energy_[kWh]", "value": total_primary_energy_non_renewable[building_id], "unit": "kWh"},
-                {"id": 20, "name": "non_households_costs_[€]", "value": total_non_h_costs[building_id], "unit": "€"},
-                {"id": 21, "name": "households_costs_[€]", "value": total_h_costs[building_id], "unit": "€"},
-                {"id": 22, "name": "Total_co2", "value": total_co2[building_id], "unit": "g"},
-            ]
-            id_for_citizen_kpi = 23
-            for key, energy_instance in FinalEnergy_dic.items():
-                citizen_KPIs[building_id].append({"id": id_for_citizen_kpi, "name": key, "value": energy_instance, "unit": "kWh"})
-                id_for_citizen_kpi += 1
+        tasks = get_building_tasks(community_context)
+        if resolution != HOURLY:
+            hourly_buildings = set(hourly_buildings or ())
+            tasks = [(building_asset_context, timestep_count, idx,
+                      HOURLY if get_building_id(building_asset_context, idx) in hourly_buildings else resolution,
+                      True)
+                     for building_asset_context, timestep_count, idx in tasks]
+        results = map_tasks(_calculate_building_citizen_KPIs_task, tasks, max_workers, executor)
+        for building_id, building_citizen_KPIs, demand_profile in results:
+            demand_profiles_context.append({DEMAND_PROFILE: demand_profile})
+            citizen_KPIs[building_id] = building_citizen_KPIs
     return citizen_KPIs, demand_profiles_context
 
 
-def get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile):
+def get_building_tasks(community_context):
+    """
+    Returns the (building_asset_context, timestep_count, idx) tasks of the buildings of the community context.
+    Only buildings with a generation system profile id are calculated.
+    """
+    timestep_count = community_context.get("timestep_count")
+    return [(building_asset_context, timestep_count, idx)
+            for idx, building_asset_context in enumerate(community_context[BUILDING_ASSET_CONTEXT])
+            if GENERATION_SYSTEM_PROFILE_ID in building_asset_context]
+
+
+def map_tasks(function, tasks, max_workers=None, executor=None):
+    """
+    Runs function on every task serially or in a process pool, e.g. the citizen KPIs of the buildings in
+    recalculate_indicators or the actions of the buildings in get_new_context.resbased_generator_context_creation.
+    The function has to be picklable (defined at module level) and the results are returned in the order of the tasks.
+    :param max_workers: number of worker processes. None or 1 runs the tasks serially
+    :param executor: concurrent.futures executor to reuse across calls, it takes precedence over max_workers
+    """
+    if executor is not None:
+        return executor.map(function, tasks, chunksize=get_chunksize(len(tasks), max_workers or os.cpu_count()))
+    if max_workers is not None and max_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # map keeps the order of the tasks, so the output matches the serial mode
+            return list(pool.map(function, tasks, chunksize=get_chunksize(len(tasks), max_workers)))
+    return map(function, tasks)
+
+
+def get_chunksize(task_count, worker_count):
+    """Number of tasks sent to a worker at once, about four chunks per worker to balance the load."""
+    return max(1, -(-task_count // (4 * max(1, worker_count))))
+
+
+def _update_content_hash(hasher, value):
+    if isinstance(value, dict):
+        hasher.update(b"{")
+        for key in sorted(value, key=str):
+            hasher.update(repr(key).encode())
+            hasher.update(b":")
+            _update_content_hash(hasher, value[key])
+        hasher.update(b"}")
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        try:
+            # time series are hashed as a block of float64 values
+            values = np.asarray(value, dtype=np.float64)
+        except (TypeError, ValueError):
+            values = None
+        if values is not None:
+            hasher.update(b"a" + repr(values.shape).encode())
+            hasher.update(np.ascontiguousarray(values).tobytes())
+        else:
+            hasher.update(b"[")
+            for item in value:
+                _update_content_hash(hasher, item)
+            hasher.update(b"]")
+    else:
+        hasher.update(type(value).__name__.encode() + repr(value).encode())
+
+
+def building_content_hash(building_asset_context, timestep_count):
+    """
+    Content hash of the inputs of the KPIs of a building: consumption, generation_system_profile and
+    building_energy_asset. The id, the given demand profile and the timestep count of the building are included
+    too, as the citizen KPIs also depend on them.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    for value in (building_asset_context.get("id"), timestep_count,
+                  building_asset_context.get(BUILDING_CONSUMPTION),
+                  building_asset_context.get(GENERATION_SYSTEM_PROFILE),
+                  building_asset_context.get("building_energy_asset"),
+                  (building_asset_context.get(BUILDING) or {}).get(DEMANDPROFILE)):
+        _update_content_hash(hasher, value)
+        hasher.update(b"|")
+    return hasher.hexdigest()
+
+
+def compact_building_result(building_id, citizen_KPIs, demand_profile):
+    """Cache entry of a building: the time series of the citizen KPIs and the demand profile as float arrays."""
+    kpis = [(kpi["id"], kpi["name"],
+             np.asarray(kpi["value"], dtype=float) if isinstance(kpi["value"], (list, tuple, np.ndarray))
+             else kpi["value"],
+             kpi["unit"]) for kpi in citizen_KPIs]
+    demand = {demand_type: np.asarray(values, dtype=float) for demand_type, values in demand_profile.items()}
+    return {"building_id": building_id, "kpis": kpis, "demand": demand}
+
+
+def expand_building_result(entry, resolution=HOURLY):
+    """
+    Returns the citizen KPIs (list of dictionaries) and the demand profile of a cache entry, as lists.
+    The time series of the citizen KPIs are aggregated to the resolution.
+    """
+    citizen_KPIs = [{"id": kpi_id, "name": name,
+                     "value": value.tolist() if isinstance(value, np.ndarray) and resolution == HOURLY
+                     else aggregate_time_series(value, resolution, mean=name in MEAN_KPIS), "unit": unit}
+                    for kpi_id, name, value, unit in entry["kpis"]]
+    demand_profile = {demand_type: values.tolist() for demand_type, values in entry["demand"].items()}
+    return citizen_KPIs, demand_profile
+
+
+def _add_to_totals(totals, counts, values, sign):
+    for name, value in values:
+        if not isinstance(value, (np.ndarray, int, float)):
+            # same values as CommunityMatrix, anything else is not summed
+            continue
+        if sign > 0:
+            totals[name] = value.copy() if name not in totals and isinstance(value, np.ndarray) else (
+                totals[name] + value if name in totals else value)
+            counts[name] = counts.get(name, 0) + 1
+        else:
+            counts[name] -= 1
+            if counts[name] == 0:
+                del totals[name], counts[name]
+            else:
+                totals[name] = totals[name] - value
+
+
+def update_community_totals(state, entries, keys):
+    """
+    Community totals of the buildings with the given keys. When a previous state is given its totals are updated
+    with the buildings removed and added, otherwise they are summed from scratch.
+    :param state: community totals of another context (e.g. the parent) or None
+    :param entries: dictionary of key: cache entry, it has to include the keys removed from the state
+    :param keys: content hashes of the buildings of the context, in order
+    """
+    if state is None:
+        removed, added = {}, Counter(keys)
+        kpi_totals, kpi_counts, demand_totals, demand_counts = {}, {}, {}, {}
+    else:
+        removed = Counter(state["keys"]) - Counter(keys)
+        added = Counter(keys) - Counter(state["keys"])
+        # the arrays are updated out of place, so the state of the parent is not modified
+        kpi_totals, kpi_counts = dict(state["kpi_totals"]), dict(state["kpi_counts"])
+        demand_totals, demand_counts = dict(state["demand_totals"]), dict(state["demand_counts"])
+    for changes, sign in ((removed, -1), (added, 1)):
+        for key, count in changes.items():
+            entry = entries[key]
+            for _ in range(count):
+                _add_to_totals(kpi_totals, kpi_counts, [(kpi[1], kpi[2]) for kpi in entry["kpis"]], sign)
+                _add_to_totals(demand_totals, demand_counts, entry["demand"].items(), sign)
+    return {"keys": list(keys), "kpi_totals": kpi_totals, "kpi_counts": kpi_counts,
+            "demand_totals": demand_totals, "demand_counts": demand_counts}
+
+
+def community_state_key(keys):
+    """
+    Key of the community totals of a context: hash of the content hashes of its buildings. The totals do not depend
+    on the order of the buildings, nor on the id or id_temp of the context.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    for key in sorted(keys):
+        hasher.update(key.encode())
+    return hasher.hexdigest()
+
+
+def get_building_keys(tasks):
+    """
+    Content hashes of the building tasks. The inputs have to be hashed before the calculation, which may complete
+    the consumption profiles.
+    """
+    return [building_content_hash(building_asset_context, timestep_count)
+            for building_asset_context, timestep_count, idx in tasks]
+
+
+def resolve_building_entries(tasks, keys, kpi_cache, max_workers=None, executor=None):
+    """
+    Returns the cache entries of the building tasks (dictionary of key: entry). The buildings that are not in
+    kpi_cache are calculated once per distinct key, serially or in a process pool, and added to the cache.
+    """
+    entries = {}
+    dirty_tasks = []
+    dirty_keys = []
+    for key, task in zip(keys, tasks):
+        if key in entries:
+            continue
+        entry = kpi_cache.get(key)
+        if entry is None:
+            dirty_tasks.append(task)
+            dirty_keys.append(key)
+        entries[key] = entry
+    for key, (building_id, building_citizen_KPIs, demand_profile) in zip(
+            dirty_keys, map_tasks(_calculate_building_citizen_KPIs_task, dirty_tasks, max_workers, executor)):
+        entries[key] = compact_building_result(building_id, building_citizen_KPIs, demand_profile)
+        kpi_cache.put(key, entries[key])
+    return entries
+
+
+def expand_context_entries(entries, keys, resolution=HOURLY, hourly_buildings=None):
+    """
+    Returns the citizen_KPIs, demand_profiles_context and units of the KPIs of a context from the entries of its
+    buildings. The units keep the order of first appearance of the KPIs, as community_KPIs. The citizen KPIs are
+    aggregated to the resolution, except for the buildings in hourly_buildings.
+    """
+    citizen_KPIs = {}
+    demand_profiles_context = []
+    units = {}
+    for key in keys:
+        entry = entries[key]
+        building_resolution = HOURLY if hourly_buildings and entry["building_id"] in hourly_buildings else resolution
+        building_citizen_KPIs, demand_profile = expand_building_result(entry, building_resolution)
+        citizen_KPIs[entry["building_id"]] = building_citizen_KPIs
+        demand_profiles_context.append({DEMAND_PROFILE: demand_profile})
+        for kpi_id, name, value, unit in entry["kpis"]:
+            if isinstance(value, (np.ndarray, int, float)):
+                units.setdefault(name, unit)
+    return citizen_KPIs, demand_profiles_context, units
+
+
+def recalculate_indicators_incremental(community_context, kpi_cache, max_workers=None, executor=None,
+                                       resolution=HOURLY, hourly_buildings=None):
+    """
+    Calculates the citizen KPIs and the community indicators of a context reusing the results of kpi_cache.
+    Only the buildings whose content hash is not cached are calculated (e.g. the buildings of a child context
+    with a new system) and the community totals are obtained updating the totals of the parent context
+    (context_parent) with the buildings that changed.
+    :param community_context: community context with building_asset_context
+    :param kpi_cache: KPICache shared between the calls
+    :param max_workers: number of worker processes for the buildings that have to be calculated
+    :param executor: concurrent.futures executor to reuse across calls
+    :param resolution: resolution of the citizen KPIs and community indicators, as in recalculate_indicators
+    :param hourly_buildings: ids of the buildings whose citizen KPIs are kept hourly
+    :return: citizen_KPIs, demand_profiles_context and community_indicators, as calculate_indicators in main.py
+    """
+    if BUILDING_ASSET_CONTEXT not in community_context or not isinstance(community_context[BUILDING_ASSET_CONTEXT],
+                                                                         list):
+        return {}, [], {}
+    tasks = get_building_tasks(community_context)
+    keys = get_building_keys(tasks)
+    entries = resolve_building_entries(tasks, keys, kpi_cache, max_workers, executor)
+    citizen_KPIs, demand_profiles_context, units = expand_context_entries(entries, keys, resolution, hourly_buildings)
+
+    # start from the totals of the parent if every building removed from it is still cached
+    state = kpi_cache.get_community(community_context.get("context_parent"))
+    if state is not None:
+        for key in set(state["keys"]) - set(entries):
+            entry = kpi_cache.get(key)
+            if entry is None:
+                state = None
+                break
+            entries[key] = entry
+    state = update_community_totals(state, entries, keys)
+    kpi_cache.put_community(community_state_key(keys), state, community_context.get("id"))
+
+    # same order of the KPIs as community_KPIs (first appearance over the buildings)
+    kpi_totals = {name: state["kpi_totals"][name] for name in units}
+    community_indicators = community_KPIs_from_totals(kpi_totals, units, state["demand_totals"], resolution)
+    return citizen_KPIs, demand_profiles_context, community_indicators
+
+
+def calculate_indicators_batch(community_contexts, kpi_cache=None, max_workers=None, executor=None,
+                               resolution=HOURLY, hourly_buildings=None):
+    """
+    Calculates the citizen KPIs and community indicators of several community contexts (e.g. candidate scenarios
+    of the same baseline) in one call. The catalogues and energy carrier registry are loaded once, every distinct
+    building is calculated once for the whole batch and the community totals of all the scenarios are obtained
+    with one matrix product per KPI (scenarios x buildings counts by buildings x timesteps values).
+    :param community_contexts: list of community contexts
+    :param kpi_cache: KPICache to reuse results between batches, by default a cache only for this batch
+    :param max_workers: number of worker processes for the buildings that have to be calculated
+    :param executor: concurrent.futures executor to reuse across calls
+    :param resolution: resolution of the citizen KPIs and community indicators, as in recalculate_indicators
+    :param hourly_buildings: ids of the buildings whose citizen KPIs are kept hourly
+    :return: list with the (citizen_KPIs, community_indicators) of each context, in the same order
+    """
+    if kpi_cache is None:
+        kpi_cache = KPICache(max_buildings=None)
+    context_tasks = []
+    for community_context in community_contexts:
+        if BUILDING_ASSET_CONTEXT in community_context and isinstance(community_context[BUILDING_ASSET_CONTEXT],
+                                                                      list):
+            context_tasks.append(get_building_tasks(community_context))
+        else:
+            context_tasks.append([])
+    context_keys = [get_building_keys(tasks) for tasks in context_tasks]
+    entries = resolve_building_entries([task for tasks in context_tasks for task in tasks],
+                                       [key for keys in context_keys for key in keys],
+                                       kpi_cache, max_workers, executor)
+
+    # number of times each distinct building appears in each scenario
+    columns = {key: column for column, key in enumerate(entries)}
+    counts = np.zeros((len(community_contexts), len(columns)))
+    for row, keys in enumerate(context_keys):
+        for key in keys:
+            counts[row, columns[key]] += 1
+    kpi_totals = stack_scenario_totals(counts, [[(kpi[1], kpi[2]) for kpi in entry["kpis"]]
+                                                for entry in entries.values()])
+    demand_totals = stack_scenario_totals(counts, [list(entry["demand"].items()) for entry in entries.values()])
+
+    results = []
+    for row, keys in enumerate(context_keys):
+        citizen_KPIs, demand_profiles_context, units = expand_context_entries(entries, keys, resolution,
+                                                                              hourly_buildings)
+        if not keys:
+            results.append((citizen_KPIs, {}))
+            continue
+        scenario_kpi_totals = {name: kpi_totals[name][row] for name in units}
+        scenario_demand_totals = {name: totals[row] for name, totals in demand_totals.items()}
+        results.append((citizen_KPIs, community_KPIs_from_totals(scenario_kpi_totals, units, scenario_demand_totals,
+                                                                 resolution)))
+    return results
+
+
+def stack_scenario_totals(counts, building_values):
+    """
+    Totals of every series for all the scenarios at once.
+    :param counts: scenarios x buildings matrix with the number of times each building is in each scenario
+    :param building_values: for each building (column of counts), list of (name, array or number)
+    :return: dictionary of name: scenarios x timesteps array (or list of numbers for scalar values)
+    """
+    values = {}
+    for column, series in enumerate(building_values):
+        for name, value in series:
+            if isinstance(value, (np.ndarray, int, float)):
+                values.setdefault(name, []).append((column, value))
+    totals = {}
+    for name, columns in values.items():
+        first = columns[0][1]
+        if isinstance(first, np.ndarray):
+            matrix = np.zeros((counts.shape[1], len(first)))
+        else:
+            matrix = np.zeros(counts.shape[1])
+        for column, value in columns:
+            matrix[column] = value
+        scenario_totals = counts @ matrix
+        if not isinstance(first, np.ndarray):
+            # integer KPIs (e.g. num_members) stay integers, as when they are summed per community
+            if all(isinstance(value, int) for column, value in columns):
+                scenario_totals = scenario_totals.astype(int)
+            scenario_totals = scenario_totals.tolist()
+        totals[name] = scenario_totals
+    return totals
+
+
+def get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile, resolution=HOURLY,
+                                 hourly_buildings=None):
     """
 
     Parameters
@@ -682,9 +1042,14 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
     front_data = {
     data
     building_consumption_dict
+    resolution: resolution of the time series of the citizen KPIs (HOURLY, DAILY, MONTHLY or YEARLY)
+    hourly_buildings: ids of the buildings whose citizen KPIs are kept hourly whatever the resolution
 
     Returns
     -------
+    citizen_KPIs: dictionary of the citizen KPIs per building
+    electricity_grid: hourly grid electricity consumption of the community (None if no building uses the grid),
+    kept before the citizen KPIs are aggregated so community_KPIs can take the community peak from it
 
     """
     rate_of_self_consumption = {}
@@ -696,6 +1061,7 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
     # groups
     KPIs = {}
     citizen_KPIs = {}
+    electricity_grid = None
 
     # Define the number of hours for each month (non-leap year)
     hours_per_month = {
@@ -767,14 +1133,13 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
             self_consumption[building_id],
             total_final_energy[building_id],
             KPIs[building_id]
-        ) = calculate_building_indicators(consumption_profile=building_consumption,
-                                          generation_system_profile=generation_system_profile,
-                                          building_energy_asset=building_energy_asset,
-                                          timestep_count=len(dhw_consumption))
+        ) = calculate_building_indicators_arrays(consumption_profile=building_consumption,
+                                                 generation_system_profile=generation_system_profile,
+                                                 building_energy_asset=building_energy_asset,
+                                                 timestep_count=len(dhw_consumption))
 
         (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
-         total_h_costs, total_non_h_costs, TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges, Trees_number,
-         streaming_emissionhours, ICV_km, Wine_bottles, FinalEnergy_dic) = get_totals_per_building(KPIs[building_id],
+         total_h_costs, total_non_h_costs, equivalences, FinalEnergy_dic) = get_totals_per_building(KPIs[building_id],
                                                                                                    timestep_count=len(
                                                                                                        dhw_consumption),
                                                                                                    final_energy=
@@ -782,43 +1147,41 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
                                                                                                            building_id])
         KPI_peak_heat_demand = max(demand_profile_building[HEATING_DEMAND])
         # calculate peak cooling demand
-        KPI_peak_elec_demand = max(total_electricity_use[building_id])
+        KPI_peak_elec_demand = float(np.max(total_electricity_use[building_id]))
         # Store citizen KPIs for the building
         citizen_KPIs[building_id] = [
-            {"id": 1, "name": "KPI_peak_heat_demand_[kWh]", "value": KPI_peak_heat_demand, "unit": "kWh"},
-            {"id": 2, "name": "KPI_peak_elec_demand_[kWh]", "value": KPI_peak_elec_demand, "unit": "kWh"},
-            {"id": 3, "name": "total_primary_energy_[kWh]", "value": total_primary_energy_kWh,
+            {"name": "KPI_peak_heat_demand_[kWh]", "value": KPI_peak_heat_demand, "unit": "kWh"},
+            {"name": "KPI_peak_elec_demand_[kWh]", "value": KPI_peak_elec_demand, "unit": "kWh"},
+            {"name": "total_primary_energy_[kWh]", "value": total_primary_energy_kWh,
              "unit": "kWh"},
-            {"id": 4, "name": "num_members", "value": 0, "unit": "a.u."},
-            {"id": 5, "name": "EquivalentTVHours_[h]", "value": TV_h, "unit": "h"},
-            {"id": 6, "name": "EquivalentstreamingHours_[h]", "value": streaming_hours, "unit": "h"},
-            {"id": 7, "name": "PizzaConsumptionComparison_[pizza]", "value": Pizza_h, "unit": "pizza"},
-            {"id": 8, "name": "BatteryUsageEstimation_[charges]", "value": Battery_charges,
-             "unit": "charges"},
-            {"id": 9, "name": "ElectricCarChargingEstimation_[charges]", "value": ElCar_charges,
-             "unit": "charges"},
-            {"id": 10, "name": "WineBottlesProduction_[bottles]", "value": Wine_bottles, "unit": "bottles"},
-            {"id": 11, "name": "TreesRequiredForCarbonOffset_[trees]", "value": Trees_number,
-             "unit": "trees"},
-            {"id": 12, "name": "streamingEmissionsImpact_[hours]", "value": streaming_emissionhours,
-             "unit": "hours"},
-            {"id": 13, "name": "CarbonEmissionsPerKilometer_[km]", "value": ICV_km, "unit": "km"},
-            {"id": 14, "name": "Total_PV_[kWh]", "value": total_PV[building_id], "unit": "kWh"},
-            {"id": 15, "name": "Total_self_consumption", "value": self_consumption[building_id], "unit": "a.u."},
-            {"id": 16, "name": "Total_self_sufficiency", "value": self_sufficiency[building_id], "unit": "a.u."},
-            {"id": 17, "name": "rate_of_self_consumption", "value": rate_of_self_consumption[building_id],
+            {"name": "num_members", "value": 0, "unit": "a.u."},
+            # citizen equivalences, in the order of CITIZEN_EQUIVALENCES
+            *({"name": equivalence["name"], "value": equivalences[equivalence["name"]], "unit": equivalence["unit"]}
+              for equivalence in CITIZEN_EQUIVALENCES),
+            {"name": "Total_PV_[kWh]", "value": total_PV[building_id], "unit": "kWh"},
+            {"name": "Total_self_consumption", "value": self_consumption[building_id], "unit": "a.u."},
+            {"name": "Total_self_sufficiency", "value": self_sufficiency[building_id], "unit": "a.u."},
+            {"name": "rate_of_self_consumption", "value": rate_of_self_consumption[building_id],
              "unit": "%"},
-            {"id": 18, "name": "renewable_primary_energy_[kWh]",
-             "value": total_primary_energy_renewable[building_id], "unit": "kWh"},
-            {"id": 19, "name": "non_renewable_primary_energy_[kWh]",
-             "value": total_primary_energy_non_renewable[building_id], "unit": "kWh"},
-            {"id": 20, "name": "non_households_costs_[€]", "value": total_non_h_costs[building_id], "unit": "€"},
-            {"id": 21, "name": "households_costs_[€]", "value": total_h_costs[building_id], "unit": "€"},
-            {"id": 22, "name": "Total_co2", "value": total_co2, "unit": "g CO2eq"},
+            {"name": "renewable_primary_energy_[kWh]",
+             "value": float(total_primary_energy_renewable[building_id]), "unit": "kWh"},
+            {"name": "non_renewable_primary_energy_[kWh]",
+             "value": float(total_primary_energy_non_renewable[building_id]), "unit": "kWh"},
+            {"name": "non_households_costs_[€]", "value": float(total_non_h_costs[building_id]), "unit": "€"},
+            {"name": "households_costs_[€]", "value": float(total_h_costs[building_id]), "unit": "€"},
+            {"name": "Total_co2", "value": total_co2, "unit": "g CO2eq"},
         ]
-        id_for_citizen_kpi=23
         for key, energy_instance in FinalEnergy_dic.items():
-            citizen_KPIs[building_id].append({"id":id_for_citizen_kpi, "name": key, "value":energy_instance, "unit": "kWh"})
-            id_for_citizen_kpi +=1
+            citizen_KPIs[building_id].append({"name": key, "value": energy_instance, "unit": "kWh"})
+        citizen_KPIs[building_id] = number_citizen_KPIs(citizen_KPIs[building_id])
+        if FINAL_ENERGY_ELECTRICITY_GRID in FinalEnergy_dic:
+            # the community peak is taken from the hourly series, before the building is aggregated
+            building_grid = FinalEnergy_dic[FINAL_ENERGY_ELECTRICITY_GRID]
+            electricity_grid = building_grid.copy() if electricity_grid is None else electricity_grid + building_grid
+        if resolution == HOURLY or (hourly_buildings is not None and building_id in hourly_buildings):
+            citizen_KPIs[building_id] = citizen_KPIs_to_lists(citizen_KPIs[building_id])
+        else:
+            # the hourly arrays are aggregated directly, without hourly lists
+            citizen_KPIs[building_id] = aggregate_citizen_KPIs(citizen_KPIs[building_id], resolution)
 
-    return citizen_KPIs
\ No newline at end of file
+    return citizen_KPIs, electricity_grid
\ No newline at end of file
@@ -100,24 +100,12 @@ def inner_perform_kpis():
     citizen_kpis_factors=KPI_module.kpi_ctz_factors()
     #KPI number of members of the community
     num_members = KPI_module.kpi_scenario_objective(front_data=front_data)
-    #KPI Equivalent TV hours
-    TV_h = KPI_module.tv_h(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    #KPI Equivalent streaming hours
-    streaming_h = KPI_module.streaming_h(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    #KPI equivalent pizza items
-    Pizza_h = KPI_module.pizza_h(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    #Equivalent battery usage estimation
-    Battery_charges = KPI_module.battery_charges(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    #Equivalent electric car charging times
-    ElCar_charges = KPI_module.el_car_charges(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    #Equivalent trees
-    Trees_number = KPI_module.trees_number(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    # Equivalent Streaming impact in emissions
-    streaming_emissionhours = KPI_module.streaming_emission_hours(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    #
-    ICV_km = KPI_module.icv_km(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
-    #Equivalent wine bottels produced
-    Wine_bottles=KPI_module.wine_bottles(citizen_kpis_factors=citizen_kpis_factors, total_primary_energy=total_primary_energy)
+    #All the citizen equivalences (TV hours, streaming, pizza, battery and car charges, wine bottles, trees...)
+    #the CO2 emissions are not calculated here, the primary energy is also the basis of the CO2 equivalences
+    equivalences = KPI_module.citizen_equivalences(
+        citizen_kpis_factors=citizen_kpis_factors,
+        bases={KPI_module.TOTAL_PRIMARY_ENERGY: total_primary_energy, KPI_module.TOTAL_CO2: total_primary_energy})
+    equivalences = {name: values.tolist() for name, values in equivalences.items()}
     #All citizen KPIs outputs
     ctz_kpi_df, building_consumption_df = KPI_module.save_to_csv(
         demand_profile=demand_profile, 
@@ -126,15 +114,15 @@ def inner_perform_kpis():
         KPI_peak_heat_demand=KPI_peak_heat_demand,
         KPI_peak_elec_demand=KPI_peak_elec_demand,
         num_members=num_members,
-        TV_h=TV_h,
-        streaming_h=streaming_h,
-        Pizza_h=Pizza_h,
-        Battery_charges=Battery_charges,
-        ElCar_charges=ElCar_charges,
-        Trees_number=Trees_number,
-        streaming_emissionhours=streaming_emissionhours,
-        ICV_km=ICV_km,
-        Wine_bottles=Wine_bottles
+        TV_h=equivalences["EquivalentTVHours_[h]"],
+        streaming_h=equivalences["EquivalentstreamingHours_[h]"],
+        Pizza_h=equivalences["PizzaConsumptionComparison_[pizza]"],
+        Battery_charges=equivalences["BatteryUsageEstimation_[charges]"],
+        ElCar_charges=equivalences["ElectricCarChargingEstimation_[charges]"],
+        Trees_number=equivalences["TreesRequiredForCarbonOffset_[trees]"],
+        streaming_emissionhours=equivalences["streamingEmissionsImpact_[hours]"],
+        ICV_km=equivalences["CarbonEmissionsPerKilometer_[km]"],
+        Wine_bottles=equivalences["WineBottlesProduction_[bottles]"]
     )
     return ctz_kpi_df
 
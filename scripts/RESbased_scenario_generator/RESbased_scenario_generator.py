@@ -47,14 +47,20 @@ import geopandas as gpd
 from shapely import wkt
 from shapely.geometry import shape
 from shapely.ops import unary_union
-import pvlib
 from pvlib.location import Location
+from scripts.RESbased_scenario_generator.geometry import footprint_areas
+from scripts.RESbased_scenario_generator.weather_data import (get_fetcher, get_weather_provider, location_request,
+                                                             poa_irradiance, post_json, ORIENTATIONS)
 # ***********************************************************************************************
 
 # This part of the code gives a list based on user inputs: goal and country
 
 # ***********************************************************************************************
 
+# Environment variables of the ThermaGrid API; without them the example output is used
+THERMAGRID_API_URL_ENV = "THERMAGRID_API_URL"
+THERMAGRID_API_KEY_ENV = "THERMAGRID_API_KEY"
+
 building_use_mapping = {
         1: "residential",  # residential
         2: "residential",  # residential
@@ -537,19 +543,20 @@ def calculate_areas(geojson_file):
     Calculate the area of each polygon in a GeoJSON file.
 
     Parameters:
-    geojson_object (str): Path to the GeoJSON file containing polygons.
+    geojson_object (str): Path to the GeoJSON file containing polygons (EPSG 4326).
 
     Returns:
-    dict: A dictionary with polygon indices as keys and their respective areas as values.
+    dict: A dictionary with polygon indices as keys and their respective areas (m2) as values. The areas are
+    computed in the local projection of the community (UTM zone), all the polygons at once.
     """
 
     areas = {}
     heights = {}
     community_demand = []
 
+    footprints_areas = footprint_areas([shape(feature['geometry']) for feature in geojson_file['features']])
     for i, feature in enumerate(geojson_file['features']):
-        geom = shape(feature['geometry'])
-        area = geom.area
+        area = float(footprints_areas[i])
         height = feature['properties']['height']
         building_demand = {
             'id': feature['id'],
@@ -679,17 +686,18 @@ def fetch_geojson(geojson_object):
     dict: The GeoJSON object received from the API.
     """
     "INFORMATION FROM THE API NOT AVAILABLE, LICENSE FOR NOW IS COMMERCIAL"
-    # api_url = THERMAGRID_API_URL
-    # api_key = str(THERMAGRID_API_KEY)
-
-    # headers = {
-    #     'Content-Type': 'application/json',
-    #     'x-api-key': api_key
-    # }
     #inputs
     inputs_thermagrid = generate_demand_inputs(geojson_object=geojson_object)
 
-
+    # When the ThermaGrid API is configured, the request goes through the shared fetcher (bounded concurrency,
+    # retries with backoff and timing metrics)
+    api_url = os.environ.get(THERMAGRID_API_URL_ENV)
+    if api_url:
+        headers = {
+            'Content-Type': 'application/json',
+            'x-api-key': os.environ.get(THERMAGRID_API_KEY_ENV, "")
+        }
+        return get_fetcher().call("thermagrid", post_json, api_url, inputs_thermagrid, headers=headers)
 
     # params_json = json.dumps(inputs_thermagrid, indent=2)
     # response = requests.post(api_url, data=params_json, headers=headers, timeout=None)
@@ -830,7 +838,7 @@ def demand_thermagrid(front_data, geojson_file):
     return demand_profile
 
 
-def generate_demand_inputs(geojson_object):
+def generate_demand_inputs(geojson_object, weather_provider=None):
     """
     Calculate temperatures and radiations based on TMY data and return a JSON with
     the original GeoJSON, temperatures, and radiations.
@@ -839,14 +847,14 @@ def generate_demand_inputs(geojson_object):
     ----------
     geojson_input : dict
         The GeoJSON object containing the multipolygons.
+    weather_provider : WeatherProvider (PVGIS, local TMY/EPW files or recorded data), by default the
+        process-wide provider of weather_data.get_weather_provider()
 
     Returns
     -------
     dict
         A dictionary containing the original GeoJSON, temperatures, and calculated radiations.
     """
-    URL = 'https://re.jrc.ec.europa.eu/api/v5_2/'
-
     # Calculate the centroid of the provided multipolygons
     multipolygons = [shape(feature['geometry']) for feature in geojson_object['features']]
     union_multipolygon = unary_union(multipolygons)
@@ -865,12 +873,11 @@ def generate_demand_inputs(geojson_object):
     print(f"latitude: {latitude}")
     print(f"longitude: {longitude}")
 
-    # Call PVGIS API (with pvlib) to get TMY data
-    tmy_data, months_selected, inputs, meta = pvlib.iotools.get_pvgis_tmy(
-        latitude, longitude, map_variables=False, url=URL)
-
-    # Ensure 'tmy_data' index is in datetime format
-    tmy_data.index = pd.to_datetime(tmy_data.index)
+    # Get TMY data (index in datetime format)
+    if weather_provider is None:
+        weather_provider = get_weather_provider()
+    tmy_data, inputs = get_fetcher().call(f"tmy|{location_request(latitude, longitude)}",
+                                          weather_provider.get_tmy, latitude, longitude)
 
     # Define the location using 'inputs' data
     latitude = inputs['location']['latitude']
@@ -880,14 +887,6 @@ def generate_demand_inputs(geojson_object):
     # Get solar data
     solar_position = site.get_solarposition(times=tmy_data.index)
 
-    # Define orientations of vertical surfaces
-    orientations = {
-        'rad_n': 0,
-        'rad_s': 180,
-        'rad_e': 90,
-        'rad_o': 270  # 'rad_o' changed to 'rad_w' for clarity
-    }
-
     # Tilt angle (90 degrees for vertical surfaces)
     tilt_angle = 90
 
@@ -897,18 +896,12 @@ def generate_demand_inputs(geojson_object):
         "temperature": tmy_data['T2m'].tolist()  # Temperature list
     }
 
-    for orientation_name, azimuth_angle in orientations.items():
-        irradiance = pvlib.irradiance.get_total_irradiance(
-            surface_tilt=tilt_angle,
-            surface_azimuth=azimuth_angle,
-            solar_zenith=solar_position['apparent_zenith'],
-            solar_azimuth=solar_position['azimuth'],
-            dni=tmy_data['Gb(n)'],
-            ghi=tmy_data['G(h)'],
-            dhi=tmy_data['Gd(h)'],
-        )
-
-        inputs_thermagrid[orientation_name] = irradiance['poa_global'].tolist()  # Radiation list
+    # Orientations of vertical surfaces, in one pass (surfaces x hours)
+    surfaces = [(tilt_angle, azimuth_angle) for azimuth_angle in ORIENTATIONS.values()]
+    irradiance = poa_irradiance(surfaces, solar_position['apparent_zenith'], solar_position['azimuth'],
+                                dni=tmy_data['Gb(n)'], ghi=tmy_data['G(h)'], dhi=tmy_data['Gd(h)'])
+    for orientation_name, surface_irradiance in zip(ORIENTATIONS, irradiance):
+        inputs_thermagrid[orientation_name] = surface_irradiance.tolist()  # Radiation list
 
     # Create the "outputs" folder if it doesn't exist
     output_folder = "outputs"
@@ -8,6 +8,24 @@ Created on Wed Jun 12 11:52:35 2024
 import numpy as np
 
 
+def series_to_list(values):
+    """Time series as a list for the json context: lists are returned as they are and arrays converted."""
+    return values.tolist() if isinstance(values, np.ndarray) else values
+
+
+def normalized_series(series, scale):
+    """
+    Divides several time series by scale in one pass over a single buffer and returns them as lists. Series that are
+    neither lists nor arrays give an empty list.
+    """
+    arrays = [np.asarray(values, dtype=float) if isinstance(values, (list, np.ndarray)) else np.empty(0)
+              for values in series]
+    buffer = np.concatenate(arrays)
+    np.divide(buffer, scale, out=buffer)
+    bounds = np.cumsum([0] + [len(values) for values in arrays])
+    return [buffer[start:end].tolist() for start, end in zip(bounds[:-1], bounds[1:])]
+
+
 class BuildingEnergyAsset:
     def __init__(self, generation_system_id, pmaxmin_scalar,pmaxmax_scalar, building_asset_context_id, name):
         self.generation_system_id = generation_system_id
@@ -16,11 +34,12 @@ class BuildingEnergyAsset:
         self.building_asset_context_id = building_asset_context_id
         self.name = name
 
-        # Initialize time series data placeholders for input1, input2, output1, and output2
-        self.input1 = []  # Represents electricity or other input1
-        self.input2 = []  # Represents air or other input2
-        self.output1 = []  # Represents heating demand or other output1
-        self.output2 = []  # Empty by default
+        # Initialize time series data placeholders for input1, input2, output1, and output2 (lists or float arrays,
+        # normalised by pmaxmax_scalar in to_dict)
+        self.input1 = np.empty(0)  # Represents electricity or other input1
+        self.input2 = np.empty(0)  # Represents air or other input2
+        self.output1 = np.empty(0)  # Represents heating demand or other output1
+        self.output2 = np.empty(0)  # Empty by default
         self.generation_system_info={}
 
 
@@ -31,20 +50,21 @@ class BuildingEnergyAsset:
         """
         General method to calculate input1, input2 (e.g., electricity and air)
         based on demand and fuel_yield. You can specify the input_type as 'electricity' or another.
+        All the hours are calculated at once, the new values are appended to the series of the asset.
         """
-        for d in demand:
-            if type == "heat_pump":
-                input1_value = d / fuel_yield1
-                input2_value = (fuel_yield1 - 1) * input1_value
-            else:
-                input1_value = d / fuel_yield1
-                input2_value=0
-                if fuel_yield2 is not None:
-                    output2_value = d*fuel_yield2
-                    self.output2.append(output2_value)  # Store multiple values in output2
-
-            self.input1.append(input1_value)
-            self.input2.append(input2_value)
+        if fuel_yield1 == 0:
+            raise ZeroDivisionError("fuel_yield1 cannot be zero.")
+        demand_values = np.asarray(demand, dtype=float)
+        input1_values = demand_values / fuel_yield1
+        if type == "heat_pump":
+            input2_values = (fuel_yield1 - 1) * input1_values
+        else:
+            input2_values = np.zeros_like(input1_values)
+            if fuel_yield2 is not None:
+                # Store multiple values in output2
+                self.output2 = np.concatenate((np.asarray(self.output2, dtype=float), demand_values * fuel_yield2))
+        self.input1 = np.concatenate((np.asarray(self.input1, dtype=float), input1_values))
+        self.input2 = np.concatenate((np.asarray(self.input2, dtype=float), input2_values))
 
         # Store demand in output1 or output2 based on the context
         self.output1 = demand  # This could represent heating demand or another output
@@ -56,18 +76,14 @@ class BuildingEnergyAsset:
         """Convert the object to a dictionary matching the required JSON structure."""
         #when passing the dic, the inptus and ouputs are normalized
         if self.generation_system_id == 83:
-            value_input1 = self.input1
-            value_input2 = self.input2
-            value_output1 = self.output1
-            value_output2 = self.output2
+            value_input1 = series_to_list(self.input1)
+            value_input2 = series_to_list(self.input2)
+            value_output1 = series_to_list(self.output1)
+            value_output2 = series_to_list(self.output2)
         else:
             normalize_by_pmaxmax = self.pmaxmax_scalar if self.pmaxmax_scalar != 0 else 1
-            value_input1 = [x / normalize_by_pmaxmax for x in self.input1] if isinstance(self.input1, list) else []
-            value_input2 = [x / normalize_by_pmaxmax for x in self.input2] if isinstance(self.input2, list) else []
-            value_output1 = [x / normalize_by_pmaxmax for x in self.output1] if isinstance(self.output1,
-                                                                                           list) else []
-            value_output2 = [x / normalize_by_pmaxmax for x in self.output2] if isinstance(self.output2,
-                                                                                           list) else []
+            value_input1, value_input2, value_output1, value_output2 = normalized_series(
+                (self.input1, self.input2, self.output1, self.output2), normalize_by_pmaxmax)
 
         return {
                 "id_temp": None,
@@ -100,7 +116,7 @@ class CommunityEnergyAsset:
         self.output_node_geom= output_node_geom
         self.name = name
 
-        # Initialize time series data placeholders for input1, input2, output1, and output2
+        # Initialize time series data placeholders for input1, input2, output1, and output2 (lists or float arrays)
         self.input1 = []  # Represents electricity or other input1
         self.input2 = []  # Represents air or other input2
         self.output1 = []  # Represents heating demand or other output1
@@ -144,10 +160,10 @@ class CommunityEnergyAsset:
                 },
                 "availability_ts": {
                     "id_temp": None,
-                    "value_input1": self.input1,
-                    "value_input2": self.input2,
-                    "value_output1": self.output1,
-                    "value_output2": self.output2,
+                    "value_input1": series_to_list(self.input1),
+                    "value_input2": series_to_list(self.input2),
+                    "value_output1": series_to_list(self.output1),
+                    "value_output2": series_to_list(self.output2),
                     "testcase": "TC_0",
                     "name": "multi_time_series"
                 },
@@ -215,21 +231,112 @@ class BuildingConsumption:
             self.cool_consumption = output
 
 
+import copy
+import csv
 import json
+import math
 import os
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+
+def read_only_view(data):
+    """Returns a read-only copy of a parsed json structure: dictionaries become MappingProxyType and lists tuples."""
+    if isinstance(data, dict):
+        return MappingProxyType({key: read_only_view(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return tuple(read_only_view(value) for value in data)
+    return data
+
+
+class ProcessWideInstance:
+    def __init__(self, factory):
+        """
+        Process-wide instance (catalogue, registry, cache...) created by factory on the first call to get, once
+        even if several threads call it at the same time.
+        :param factory: callable without arguments that creates the instance
+        """
+        self.factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the instance, it is only created on the first call (or after reload)."""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self.factory()
+        return self._instance
+
+    def reload(self):
+        """Creates the instance again (e.g. after its file is updated) and returns it."""
+        with self._lock:
+            self._instance = self.factory()
+        return self._instance
+
+    def set(self, instance):
+        """Replaces the instance and returns it."""
+        with self._lock:
+            self._instance = instance
+        return instance
+
+
+class EnergySystemsCatalogue:
+    def __init__(self, json_file_path):
+        """
+        Generation systems catalogue parsed once from its json file and indexed by generation system id.
+        Iterating the catalogue or calling get returns read-only views of the systems, get_copy returns an
+        independent dictionary that can be modified or included in a context.
+        :param json_file_path: path of generation_systems_catalogue.json
+        """
+        self.json_file_path = json_file_path
+        with open(json_file_path, "r") as file:
+            systems = json.load(file)
+        self._systems = {}
+        for system in systems:
+            # the first system found with an id is kept, as in a linear search of the list
+            self._systems.setdefault(system["id"], system)
+        self._views = {system_id: read_only_view(system) for system_id, system in self._systems.items()}
+
+    def get(self, system_id, default=None):
+        """Returns a read-only view of the system with the given id, or default if it is not in the catalogue."""
+        return self._views.get(system_id, default)
+
+    def get_copy(self, system_id):
+        """Returns a copy of the system with the given id as a dictionary, or None if it is not in the catalogue."""
+        system = self._systems.get(system_id)
+        return copy.deepcopy(system) if system is not None else None
+
+    def ids(self):
+        return list(self._systems)
+
+    def __contains__(self, system_id):
+        return system_id in self._systems
+
+    def __iter__(self):
+        return iter(self._views.values())
 
+    def __len__(self):
+        return len(self._systems)
+
+
+# Number of hours per month in a non-leap year and index of the first hour of each month
+HOURS_PER_MONTH = [744, 672, 744, 720, 744, 720, 744, 744, 720, 744, 720, 744]
+MONTH_START_HOURS = np.cumsum([0] + HOURS_PER_MONTH[:-1])
 
 
 class FinalEnergy:
-    def __init__(self, id):
+    def __init__(self, id, hourly_data=None):
         self.id = id
         self.name = None
         self.final = False
-        self._hourly_data = [0] * 8760  # Using a leading underscore to indicate this is "private" and a method is assigned
-                                        #to recalculate monthly and yearly data every time hourly data is changed
-        self.monthly_data = [0] * 12
-        self.yearly_data = 0
-        self.recalculate()  # Initial calculation
+        # Preallocated array of 8760 values, consumptions are accumulated in place. Using a leading underscore
+        # to indicate this is "private", monthly and yearly data are computed lazily from it on first access
+        # and invalidated every time hourly data is changed
+        self._hourly_data = np.zeros(8760) if hourly_data is None else hourly_data
+        self._monthly_data = None
+        self._yearly_data = None
 
     @property
     def hourly_data(self):
@@ -240,29 +347,36 @@ class FinalEnergy:
         #the setter is used: e.g. energy_instance.hourly_data = new_hourly_data  # This triggers the setter
         if len(new_hourly_data) != 8760:
             raise ValueError("Hourly data must have 8760 entries.")
-        self._hourly_data =  [0 if value is None else value for value in new_hourly_data]
+        self._hourly_data = np.nan_to_num(np.array(new_hourly_data, dtype=float), nan=0.0, copy=False)
         self.recalculate()  # Recalculate monthly and yearly data when hourly data changes
 
+    @property
+    def monthly_data(self):
+        if self._monthly_data is None:
+            self._monthly_data = self.calculate_monthly(self._hourly_data)
+        return self._monthly_data
+
+    @property
+    def yearly_data(self):
+        if self._yearly_data is None:
+            self._yearly_data = float(self._hourly_data.sum())
+        return self._yearly_data
+
     def recalculate(self):
-        """ Recalculate the monthly and yearly data whenever hourly data is changed """
-        self.monthly_data = self.calculate_monthly(self._hourly_data)
-        self.yearly_data = sum(self._hourly_data)
+        """ Invalidates the monthly and yearly data whenever hourly data is changed, they are recalculated on
+        their next access """
+        self._monthly_data = None
+        self._yearly_data = None
 
     def calculate_monthly(self, hourly_data):
-        # Define the number of hours per month in a non-leap year
-        hours_per_month = [744, 672, 744, 720, 744, 720, 744, 744, 720, 744, 720, 744]
-        monthly_data = []
-        start = 0
-        for hours in hours_per_month:
-            monthly_data.append(sum(hourly_data[start:start + hours]))
-            start += hours
-        return monthly_data
+        # Sum the hours of each month in a non-leap year
+        return np.add.reduceat(np.asarray(hourly_data, dtype=float), MONTH_START_HOURS).tolist()
 
     def final_energy_to_dic(self):
         return {
             "name": self.name,
             "final": self.final,
-            "hour": self._hourly_data[:],  # return a copy of the list
+            "hour": self._hourly_data.tolist(),  # return a copy of the data as a list
             "month": self.monthly_data[:],  # return a copy of the list
             "year": self.yearly_data
         }
@@ -270,17 +384,322 @@ class FinalEnergy:
     def add_new_consumption(self, consumption):
         """
         Adds new fuels or electricity consumption to the current _hourly_data for the energy carrier
-        :param consumption: List of 8760 values representing the new consumption to add.
+        :param consumption: List or array of 8760 values representing the new consumption to add.
         """
         if len(consumption) != 8760:
             raise ValueError("Consumption data must have 8760 entries.")
+        consumption = np.asarray(consumption, dtype=float)
+        if np.isnan(consumption).any():
+            consumption = np.nan_to_num(consumption, nan=0.0)  # None values are not added
         # Add each hour's consumption to the existing _hourly_data
-        self._hourly_data =[self._hourly_data[i] + (consumption[i] if consumption[i] is not None else 0) for i in range(8760)]
-        # Recalculate monthly and yearly values after adding new consumption
+        self._hourly_data += consumption
+        # Monthly and yearly values are recalculated on their next access
         self.recalculate()
 
 
 
+class EnergyCarrierRegistry:
+    def __init__(self, json_file_path, timestep_count=8760):
+        """
+        Energy carriers parsed once from energy_carrier.json. It keeps the metadata of the carriers and hands
+        out fresh zeroed FinalEnergy accumulators for the final energy carriers.
+        :param json_file_path: path of energy_carrier.json
+        :param timestep_count: number of timesteps of the FinalEnergy accumulators
+        """
+        self.json_file_path = json_file_path
+        self.timestep_count = timestep_count
+        with open(json_file_path, "r") as file:
+            carriers = json.load(file)
+        self._carriers = {carrier["id"]: read_only_view(carrier) for carrier in carriers}
+        # ids, names and final flag of the carriers that get a FinalEnergy accumulator
+        self.final_carrier_ids = [carrier["id"] for carrier in carriers if carrier.get("final")]
+        # name and final are optional for the carriers, as in the json entries
+        self.names = {carrier["id"]: carrier.get("name") for carrier in carriers}
+        self.finals = {carrier["id"]: carrier.get("final") for carrier in carriers}
+        # zeroed block with one row of hourly data per final carrier, cloned for every building
+        self._template = np.zeros((len(self.final_carrier_ids), timestep_count))
+
+    def get(self, carrier_id, default=None):
+        """Returns a read-only view of the energy carrier with the given id."""
+        return self._carriers.get(carrier_id, default)
+
+    def new_final_energy(self):
+        """
+        Returns a dictionary of new FinalEnergy instances (one per final energy carrier) with zero consumption.
+        All the instances share one cloned array block, each of them accumulating in its own row.
+        """
+        block = self._template.copy()
+        total_final_energy = {}
+        for row, carrier_id in enumerate(self.final_carrier_ids):
+            final_energy = FinalEnergy(carrier_id, hourly_data=block[row])
+            final_energy.name = self.names[carrier_id]
+            final_energy.final = self.finals[carrier_id]
+            total_final_energy[carrier_id] = final_energy
+        return total_final_energy
+
+
+class WindPowerCurveRegistry:
+    def __init__(self, json_file_path, shear_exponent=1 / 7, reference_height=10):
+        """
+        Power curves of wind turbines parsed once from wind_turbine_power_curves.json and normalised to the nominal
+        power (kW per kW installed). A curve is given by its wind speeds (m/s) and powers (W), or as the mean of
+        other curves ("mean_of", on the wind speeds of the first one) set to zero above "cut_out_m_s".
+        :param json_file_path: path of wind_turbine_power_curves.json
+        :param shear_exponent: exponent of the power law that extrapolates the wind speed to the hub height
+        :param reference_height: height (m) of the measured wind speed (10 m for WS10m)
+        """
+        self.json_file_path = json_file_path
+        self.shear_exponent = shear_exponent
+        self.reference_height = reference_height
+        with open(json_file_path, "r") as file:
+            turbines = json.load(file)
+        self.hub_heights = {}
+        self._curves = {}
+        for turbine in turbines:
+            if "mean_of" in turbine:
+                wind_speeds = self._curves[turbine["mean_of"][0]][0]
+                power = np.mean([np.interp(wind_speeds, *self._curves[name]) for name in turbine["mean_of"]], axis=0)
+                if turbine.get("cut_out_m_s") is not None:
+                    power[wind_speeds > turbine["cut_out_m_s"]] = 0
+            else:
+                wind_speeds = np.asarray(turbine["wind_speed_m_s"], dtype=float)
+                power = np.asarray(turbine["power_w"], dtype=float) / turbine["nominal_power_w"]
+            wind_speeds.flags.writeable = False
+            power.flags.writeable = False
+            self._curves[turbine["name"]] = wind_speeds, power
+            self.hub_heights[turbine["name"]] = turbine.get("hub_height_m")
+
+    def names(self):
+        return list(self._curves)
+
+    def curve(self, name):
+        """Returns (wind speeds in m/s, power in kW per kW) of a turbine, as read-only arrays."""
+        return self._curves[name]
+
+    def hub_wind_speed(self, wind_speed, hub_height):
+        """Wind speed at the hub height, extrapolated from reference_height with the power law."""
+        return np.asarray(wind_speed, dtype=float) * (hub_height / self.reference_height) ** self.shear_exponent
+
+    def power(self, wind_speed, name, hub_height=None):
+        """
+        Power (kW per kW installed) of a turbine for an array of wind speeds (m/s, at reference_height).
+        :param hub_height: if given, the wind speed is extrapolated to this height (m) first
+        """
+        wind_speed = np.asarray(wind_speed, dtype=float)
+        if hub_height is not None:
+            wind_speed = self.hub_wind_speed(wind_speed, hub_height)
+        return np.interp(wind_speed, *self._curves[name])
+
+    def power_matrix(self, wind_speed, names=None, hub_heights=False):
+        """
+        Power (kW per kW installed) of several turbines at once, as an array turbines x hours.
+        :param names: turbines, by default all of them
+        :param hub_heights: if True, the wind speed is extrapolated to the hub height of each turbine (turbines
+        without hub height use the wind speed as given)
+        """
+        names = self.names() if names is None else names
+        return np.vstack([self.power(wind_speed, name, self.hub_heights[name] if hub_heights else None)
+                          for name in names])
+
+
+class GenerationSystemProfileIndex:
+    COMPONENTS = ("electricity_id", "dhw_id", "heating_id", "cooling_id")
+
+    def __init__(self, csv_file_path):
+        """
+        Generation system profiles of all_profiles.csv indexed once by the tuple of their component system ids
+        (electricity_id, dhw_id, heating_id, cooling_id). Empty values, NaN and None are the same id (None) and
+        integral floats are ints, so 3, 3.0 and "3" find the same profile. When several rows have the same
+        components the first one is kept.
+        :param csv_file_path: path of all_profiles.csv, with the columns id and COMPONENTS
+        """
+        self.csv_file_path = csv_file_path
+        self._profile_ids = {}
+        self._components = {}
+        with open(csv_file_path, "r", newline="") as file:
+            for row in csv.DictReader(file):
+                profile_id = self.canonical_id(row["id"])
+                components = tuple(self.canonical_id(row[column]) for column in self.COMPONENTS)
+                self._profile_ids.setdefault(components, profile_id)
+                self._components.setdefault(profile_id, components)
+
+    @staticmethod
+    def canonical_id(value):
+        """Normalised system id: None for empty values and NaN, int for integral numbers."""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = value.strip()
+            if value == "":
+                return None
+            try:
+                value = float(value)
+            except ValueError:
+                return value
+        if isinstance(value, (float, np.floating)):
+            if math.isnan(value):
+                return None
+            return int(value) if value.is_integer() else float(value)
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        return value
+
+    def key(self, electricity_id, dhw_id, heating_id, cooling_id):
+        return tuple(self.canonical_id(value) for value in (electricity_id, dhw_id, heating_id, cooling_id))
+
+    def get_id(self, electricity_id, dhw_id, heating_id, cooling_id):
+        """Returns the generation_system_profile_id of the components, or None if there is no such profile."""
+        return self._profile_ids.get(self.key(electricity_id, dhw_id, heating_id, cooling_id))
+
+    def get_components(self, profile_id):
+        """
+        Returns the component ids of a generation system profile as a dict with the keys COMPONENTS, or None if
+        the profile does not exist.
+        """
+        components = self._components.get(self.canonical_id(profile_id))
+        return None if components is None else dict(zip(self.COMPONENTS, components))
+
+    def __len__(self):
+        return len(self._components)
+
+    def __contains__(self, profile_id):
+        return self.canonical_id(profile_id) in self._components
+
+
+class ActionSystemLookup:
+    def __init__(self, rows):
+        """
+        Generation systems of each recommended action (actions_to_generation_systems.csv) compiled once into a
+        table action_key -> [(name_system_type, id)], in the order of the rows. Lookups by system kind ("dhw",
+        "electricity_system_id", "storage"...) match name_system_type by substring, as str.contains did, and are
+        memoised per (action_key, system).
+        :param rows: iterable of (action_key, name_system_type, id)
+        """
+        self._systems = {}
+        for action_key, name_system_type, system_id in rows:
+            if name_system_type is None or (isinstance(name_system_type, float) and math.isnan(name_system_type)):
+                continue
+            self._systems.setdefault(int(action_key), []).append((str(name_system_type), int(system_id)))
+        self._candidates = {}
+
+    @classmethod
+    def from_csv(cls, csv_file_path):
+        """Reads actions_to_generation_systems.csv (columns action_key, name_system_type and id)."""
+        with open(csv_file_path, "r", newline="", encoding="utf-8-sig") as file:
+            return cls((row["action_key"], row["name_system_type"] or None, row["id"])
+                       for row in csv.DictReader(file))
+
+    @classmethod
+    def from_frame(cls, actions_to_generation_systems):
+        """Compiles the table of a DataFrame with the columns action_key, name_system_type and id."""
+        return cls(zip(actions_to_generation_systems["action_key"], actions_to_generation_systems["name_system_type"],
+                       actions_to_generation_systems["id"]))
+
+    def candidates(self, action_key, system):
+        """Returns the ids of all the generation systems of an action whose type contains system, as a tuple."""
+        key = (int(action_key), system)
+        candidates = self._candidates.get(key)
+        if candidates is None:
+            candidates = tuple(system_id for name_system_type, system_id in self._systems.get(key[0], ())
+                               if system in name_system_type)
+            self._candidates[key] = candidates
+        return candidates
+
+    def first(self, action_key, system):
+        """Returns the first candidate generation system id of an action, or None if it has none."""
+        candidates = self.candidates(action_key, system)
+        return candidates[0] if candidates else None
+
+    def action_keys(self):
+        return list(self._systems)
+
+
+class AssetRegistry:
+    def __init__(self, node_id=1):
+        """
+        Energy assets of a new context, indexed so that adding an asset only if it is absent is a set lookup instead
+        of a scan of the asset lists. The building energy assets are indexed by (building id, generation_system_id,
+        system kind) and the community energy assets by generation_system_id and by input node. Community assets get
+        their id_temp (and the one of their availability_ts and nodes) when they are added, in insertion order.
+        :param node_id: id_temp of the nodes of the community assets (they are all connected to the same node)
+        """
+        self.node_id = node_id
+        self._building_assets = {}
+        self._building_keys = set()
+        self._community_assets = []
+        self._community_ids = {}
+        self._node_assets = {}
+
+    @staticmethod
+    def system_kind(energy_asset):
+        """Kind of system of an asset (dhw, heating, cooling, electricity, storage...) from its generation system type."""
+        system_type = (energy_asset.get("generation_system") or {}).get("system_type") or {}
+        name = system_type.get("name")
+        if isinstance(name, str) and name.endswith("_system"):
+            return name[:-len("_system")]
+        return name
+
+    @staticmethod
+    def node_key(energy_asset):
+        input_node = energy_asset.get("input_node")
+        return input_node.get("geom") if isinstance(input_node, dict) else None
+
+    def has_building_asset(self, building_id, generation_system_id, system):
+        return (building_id, generation_system_id, system) in self._building_keys
+
+    def add_building_asset(self, building_id, energy_asset, system=None):
+        """
+        Adds a building energy asset unless the building already has one of the same generation system and kind.
+        :param system: kind of system (dhw, heating, cooling...), by default the one of the generation system of
+        the asset. A heat pump used for heating and cooling gives two assets of different kinds
+        :return: True if the asset was added
+        """
+        system = self.system_kind(energy_asset) if system is None else system
+        key = (building_id, energy_asset.get("generation_system_id"), system)
+        if key in self._building_keys:
+            return False
+        self._building_keys.add(key)
+        self._building_assets.setdefault(building_id, []).append(energy_asset)
+        return True
+
+    def building_assets(self, building_id):
+        """Energy assets of a building, in insertion order."""
+        return self._building_assets.get(building_id, [])
+
+    def has_community_asset(self, generation_system_id, node=None):
+        """True if there is a community asset of the generation system (connected to the node, if given)."""
+        if node is None:
+            return generation_system_id in self._community_ids
+        return any(self.node_key(energy_asset) == node for energy_asset in self._community_ids.get(generation_system_id, ()))
+
+    def add_community_asset(self, energy_asset, unique=True):
+        """
+        Adds a community energy asset and gives it the next id_temp. Its availability_ts gets the same id_temp
+        and its input and output nodes node_id.
+        :param unique: if True the asset is not added when there is already one of the same generation system
+        :return: True if the asset was added
+        """
+        generation_system_id = energy_asset.get("generation_system_id")
+        if unique and self.has_community_asset(generation_system_id):
+            return False
+        energy_asset["id_temp"] = len(self._community_assets) + 1
+        if energy_asset.get("availability_ts") is not None:
+            energy_asset["availability_ts"]["id_temp"] = energy_asset["id_temp"]
+        for node in ("input_node", "output_node"):
+            if isinstance(energy_asset.get(node), dict):
+                energy_asset[node]["id_temp"] = self.node_id
+        self._community_assets.append(energy_asset)
+        self._community_ids.setdefault(generation_system_id, []).append(energy_asset)
+        self._node_assets.setdefault(self.node_key(energy_asset), []).append(energy_asset)
+        return True
+
+    def community_assets(self, node=None):
+        """Community energy assets in insertion order, all of them or those connected to a node (input node geom)."""
+        if node is None:
+            return list(self._community_assets)
+        return list(self._node_assets.get(node, ()))
+
+
 class BuildingKPIs:
     def __init__(self, final_energy_instance, kpi_data):
         """
@@ -330,13 +749,13 @@ class BuildingKPIs:
         Calculate the KPIs based on FinalEnergy's hourly data and the provided external factors.
         """
         # Perform element-wise calculation
-        hourly_data = self.final_energy._hourly_data
-        self.PEF_total = [hourly_data[i] * self.pef_tot for i in range(len(hourly_data))] #kWh
-        self.PEF_nren = [hourly_data[i] * self.pef_nren for i in range(len(hourly_data))] #kWh
-        self.PEF_ren = [hourly_data[i] * self.pef_ren for i in range(len(hourly_data))] #kWh
-        self.co2 = [hourly_data[i] * self.f_co2_eq_g_kwh for i in range(len(hourly_data))] #g
-        self.non_h_costs = [hourly_data[i] * self.non_h_costs_eur_kwh for i in range(len(hourly_data))] #euros
-        self.household_costs = [hourly_data[i] * self.house_costs_eur_kwh for i in range(len(hourly_data))] #euros
+        hourly_data = np.asarray(self.final_energy.hourly_data, dtype=float)
+        self.PEF_total = hourly_data * self.pef_tot #kWh
+        self.PEF_nren = hourly_data * self.pef_nren #kWh
+        self.PEF_ren = hourly_data * self.pef_ren #kWh
+        self.co2 = hourly_data * self.f_co2_eq_g_kwh #g
+        self.non_h_costs = hourly_data * self.non_h_costs_eur_kwh #euros
+        self.household_costs = hourly_data * self.house_costs_eur_kwh #euros
         # Monthly KPIs in appropriate units (MWh, tonnes, k€)
         self.PEF_total_monthly = [value * 1e-3 for value in
                                   self.calculate_monthly(self.PEF_total)]  # Convert kWh to MWh
@@ -349,12 +768,12 @@ class BuildingKPIs:
                                         self.calculate_monthly(self.household_costs)]  # Convert € to k€
 
         # Yearly KPIs in appropriate units (MWh, tonnes, k€)
-        self.PEF_total_yearly = sum(self.PEF_total) * 1e-3  # Convert kWh to MWh
-        self.PEF_nren_yearly = sum(self.PEF_nren) * 1e-3  # Convert kWh to MWh
-        self.PEF_ren_yearly = sum(self.PEF_ren) * 1e-3  # Convert kWh to MWh
-        self.co2_yearly = sum(self.co2) * 1e-6  # Convert grams to tonnes
-        self.non_h_costs_yearly = sum(self.non_h_costs) * 1e-3  # Convert € to k€
-        self.household_costs_yearly = sum(self.household_costs) * 1e-3  # Convert € to k€
+        self.PEF_total_yearly = float(self.PEF_total.sum()) * 1e-3  # Convert kWh to MWh
+        self.PEF_nren_yearly = float(self.PEF_nren.sum()) * 1e-3  # Convert kWh to MWh
+        self.PEF_ren_yearly = float(self.PEF_ren.sum()) * 1e-3  # Convert kWh to MWh
+        self.co2_yearly = float(self.co2.sum()) * 1e-6  # Convert grams to tonnes
+        self.non_h_costs_yearly = float(self.non_h_costs.sum()) * 1e-3  # Convert € to k€
+        self.household_costs_yearly = float(self.household_costs.sum()) * 1e-3  # Convert € to k€
 
     def calculate_monthly(self, hourly_data):
         """
@@ -362,13 +781,7 @@ class BuildingKPIs:
         :param hourly_data: Array of hourly data (8760 values)
         :return: Monthly data (12 values)
         """
-        hours_per_month = [744, 672, 744, 720, 744, 720, 744, 744, 720, 744, 720, 744]
-        monthly_data = []
-        start = 0
-        for hours in hours_per_month:
-            monthly_data.append(sum(hourly_data[start:start + hours]))
-            start += hours
-        return monthly_data
+        return np.add.reduceat(np.asarray(hourly_data, dtype=float), MONTH_START_HOURS).tolist()
 
     def to_dict(self):
         """
@@ -397,3 +810,150 @@ class BuildingKPIs:
             "household_costs_monthly": self.household_costs_monthly,
             "household_costs_yearly": self.household_costs_yearly
         }
+
+
+class CommunityMatrix:
+    def __init__(self):
+        """
+        Columnar store of the time series of a community. For each series name (e.g. heating_demand or
+        final_energy_electricity_grid) the values of every building are kept as one row of a
+        buildings x timesteps matrix, so the community totals and peaks are obtained with one vectorized reduction.
+        Scalar values (e.g. num_members) are kept per building and summed.
+        """
+        self.building_ids = []
+        self.units = {}
+        self._names = {}  # series names in order of first appearance
+        self._rows = {}  # name: list of (building row, np.array)
+        self._scalars = {}  # name: list of numbers
+        self._totals = {}  # cache of the totals, invalidated when a building is added
+
+    def add_building(self, building_id, series, units=None):
+        """
+        Adds the time series of one building.
+        :param building_id: id of the building, it defines the row of the building in the matrices.
+        :param series: dictionary of name: list/array of timestep values or single number.
+        :param units: optional dictionary of name: unit.
+        """
+        row = len(self.building_ids)
+        self.building_ids.append(building_id)
+        for name, values in series.items():
+            if isinstance(values, (list, tuple, np.ndarray)):
+                self._rows.setdefault(name, []).append((row, np.asarray(values, dtype=float)))
+            elif isinstance(values, (int, float)):
+                self._scalars.setdefault(name, []).append(values)
+            else:
+                continue
+            self._names.setdefault(name, None)
+            if units is not None and name not in self.units:
+                self.units[name] = units.get(name)
+            self._totals.pop(name, None)
+
+    def names(self):
+        return list(self._names)
+
+    def matrix(self, name):
+        """Returns the buildings x timesteps matrix of a series, buildings without the series are rows of zeros."""
+        rows = self._rows[name]
+        matrix = np.zeros((len(self.building_ids), len(rows[0][1])))
+        for row, values in rows:
+            matrix[row] = values
+        return matrix
+
+    def total(self, name):
+        """Returns the community total of a series (sum over buildings): an array for time series or a number."""
+        if name not in self._totals:
+            if name in self._rows:
+                rows = self._rows[name]
+                if len(rows) == 1:
+                    self._totals[name] = rows[0][1].copy()
+                else:
+                    self._totals[name] = np.stack([values for row, values in rows]).sum(axis=0)
+            else:
+                self._totals[name] = sum(self._scalars[name])
+        return self._totals[name]
+
+    def peak(self, name):
+        """Returns the maximum timestep value of the community total of a series."""
+        total = self.total(name)
+        return float(np.max(total)) if isinstance(total, np.ndarray) else total
+
+    def totals(self):
+        """Returns the community totals of every series as a dictionary, time series are returned as lists."""
+        totals = {}
+        for name in self._names:
+            total = self.total(name)
+            totals[name] = total.tolist() if isinstance(total, np.ndarray) else total
+        return totals
+
+
+class KPICache:
+    def __init__(self, max_buildings=1024, max_communities=64):
+        """
+        Cache of the KPI results of the buildings, keyed by the content hash of the building inputs, and of the
+        community totals of the last calculated contexts. A child context only recalculates the buildings whose
+        inputs changed and updates the totals of its parent with the difference.
+        The least recently used entries are discarded when the limits are reached.
+        :param max_buildings: maximum number of building results kept, None for no limit
+        :param max_communities: maximum number of community totals kept
+        """
+        self.max_buildings = max_buildings
+        self.max_communities = max_communities
+        self._buildings = OrderedDict()
+        self._communities = OrderedDict()
+        # context id: key of its community totals
+        self._context_keys = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the building result stored with the key, or None."""
+        entry = self._buildings.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._buildings.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._buildings[key] = entry
+        self._buildings.move_to_end(key)
+        while self.max_buildings is not None and len(self._buildings) > self.max_buildings:
+            self._buildings.popitem(last=False)
+
+    def get_community(self, context_id):
+        """Returns the community totals of the context with the id, or None."""
+        key = self._context_keys.get(context_id)
+        if key is None or key not in self._communities:
+            return None
+        self._communities.move_to_end(key)
+        return self._communities[key]
+
+    def put_community(self, key, state, context_id=None):
+        """
+        Stores the community totals of a context.
+        :param key: content hash of its buildings (community_state_key), so contexts that share an id_temp (e.g.
+        the unsaved children of the same parent) never overwrite each other
+        :param context_id: id of the context, if it has one, so its children can find its totals (context_parent)
+        """
+        self._communities[key] = state
+        self._communities.move_to_end(key)
+        if context_id is not None:
+            self._context_keys[context_id] = key
+        while len(self._communities) > self.max_communities:
+            evicted, _ = self._communities.popitem(last=False)
+            for evicted_id in [alias for alias, alias_key in self._context_keys.items() if alias_key == evicted]:
+                del self._context_keys[evicted_id]
+
+    def clear(self):
+        self._buildings.clear()
+        self._communities.clear()
+        self._context_keys.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._buildings
+
+    def __len__(self):
+        return len(self._buildings)
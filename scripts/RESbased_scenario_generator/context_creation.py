@@ -38,18 +38,23 @@ import pandas as pd
 from pathlib import Path
 import json
 import numpy as np
-from scripts.RESbased_scenario_generator.classes_database import BuildingEnergyAsset, BuildingConsumption, CommunityEnergyAsset
+from scripts.RESbased_scenario_generator.classes_database import (BuildingEnergyAsset, BuildingConsumption, CommunityEnergyAsset,
+                                                                  ActionSystemLookup, GenerationSystemProfileIndex,
+                                                                  ProcessWideInstance, WindPowerCurveRegistry)
 import os
 from scripts.KPI_module.key_performance_indicators import load_energy_system_catalogue, filter_energy_systems_catalogue
-from pvlib.iotools.pvgis import get_pvgis_hourly
-from pvlib.iotools import get_pvgis_tmy
-from pvlib.irradiance import get_total_irradiance
+from functools import partial
 import geopandas as gpd
-from shapely import wkt
+import shapely
 # from shapely.geometry import shape
 # from shapely.ops import unary_union
-from shapely.errors import GEOSException
-from pvlib.location import Location
+from scripts.RESbased_scenario_generator.geometry import footprint_metrics, geometries_from_wkt
+from scripts.RESbased_scenario_generator.sizing import (load_duration_curve, signature_demand, size_capacities,
+                                                        system_capacity, PEAK_FRACTION)
+from scripts.RESbased_scenario_generator.weather_data import (get_fetcher, get_location_arrays, get_pvgis_cache,
+                                                             get_weather_provider, location_request, poa_irradiance,
+                                                             solar_elevation_from_arrays,
+                                                             solar_elevation_to_arrays, ORIENTATIONS, TMY_IRRADIANCE)
 
 BUILDING_ASSET_CONTEXT="building_asset_context"
 def ungroup_buildings_to_context(grouped_buildings):
@@ -72,51 +77,6 @@ def ungroup_buildings_to_context(grouped_buildings):
 
 
 
-def handle_new_system_id(new_system_id):
-    """The purpose of this function is to handle the update of the buildings_generation_system
-    with a new system ID (new_system_id).  It checks the type of new_system_id and
-    updates buildings_generation_system accordingly, depending on whether the new_system_id is a dictionary,
-    a list (or numpy array), or an integer. If the type is unexpected, it logs a message.
-    Parameters
-    ----------
-    new_system_id
-
-    Returns
-    -------
-    corrected_new_system_id
-    """
-    if isinstance(new_system_id, dict):
-        if len(new_system_id) > 0:  # Check if the dictionary is not empty
-            # Update the system id in buildings_generation_system with the first value from new_system_id
-            first_key = next(iter(new_system_id))
-            #It retrieves the first key of the dictionary using next(iter(new_system_id)).
-            # THIS IS DONE BECAUSE the dictionary contains multiple key-value pairs, but the code only uses the first one (for now)
-            corrected_new_system_id = int(new_system_id[first_key])
-            # print(f"Updated system with value {new_system_id[first_key]} from new_system_id dictionary")
-        else:
-            # print("new_system_id is an empty dictionary")
-            corrected_new_system_id = None
-    elif isinstance(new_system_id, (list, np.ndarray)):
-        if len(new_system_id) > 0:  # Check if the list is not empty
-            # Update the system id in buildings_generation_system with the first value from new_system_id
-            corrected_new_system_id = int(new_system_id[0])
-            # print(f"Updated system with value {new_system_id[0]} from new_system_id list")
-        else:
-            # print("new_system_id is an empty list")
-            corrected_new_system_id = None
-
-    elif isinstance(new_system_id, int):
-        # Directly use the integer value to update the system id
-        corrected_new_system_id = int(new_system_id)
-        # print(f"Updated system with value {new_system_id} from new_system_id integer")
-
-    else:
-        # print("new_system_id is of an unexpected type")
-        # Handle unexpected type
-        type(new_system_id)
-        corrected_new_system_id=None
-    return corrected_new_system_id
-
 # Function to group buildings by 'generation_system_profile_id'
 def group_buildings_by_generation_system(bd):
     """
@@ -146,7 +106,7 @@ def group_buildings_by_generation_system(bd):
                     grouped_buildings[gen_id] = []
                 grouped_buildings[gen_id].append(building_dic)
             else:
-                print(f"No 'generation_system_profile_id' found in building_dic with id {building_dic.get("id", "unknown")}")
+                print(f"No 'generation_system_profile_id' found in building_dic with id {building_dic.get('id', 'unknown')}")
     else:
         print("BUILDING_ASSET_CONTEXT is not a valid list in bd")
     
@@ -155,77 +115,72 @@ def group_buildings_by_generation_system(bd):
 
 
 def peak_load_distribution_curve (demand):
-
-    # Sort the demand data in descending order to create the load distribution curve
-    sorted_demand = sorted(demand, reverse=True)
-
-    # Calculate the peak
-    max_peak=max(sorted_demand)
-
-    # Capacity at 80% and 90% demand
-    capacity_70 =  0.7 * max_peak
-    capacity_90 = 0.9 * max_peak
-
-    # print(f"Capacity to meet 80% of demand: {capacity_70:.2f}")
-    # print(f"Capacity to meet 90% of demand: {capacity_90:.2f}")
+    """
+    Capacities at 70% and 90% of the peak demand and the load distribution curve (demand sorted in descending order,
+    as a list). To size a system without the curve use the sizing module (size_capacities or system_capacity).
+    """
+    capacity_70, capacity_90 = size_capacities(demand, PEAK_FRACTION, (0.7, 0.9)).tolist()
+    sorted_demand = load_duration_curve(demand).tolist()
     return capacity_70, capacity_90, sorted_demand
 
 def obtain_energy_signature (outdoor_temperatures,demand, mode):
-    if mode ==0:
-        #This is for heating
-        # Filter heating demand for temperatures below 18°C
-        filtered_demand = [demand[i] for i in range(len(outdoor_temperatures)) if outdoor_temperatures[i] < 18]
-    else:
-        # Filter cooling demand for temperatures above 26°C
-        filtered_demand = [demand[i] for i in range(len(outdoor_temperatures)) if outdoor_temperatures[i] > 26]
+    """
+    Capacities at 70% and 90% of the peak of the demand of the hours below 18°C (heating, mode 0) or above 26°C
+    (cooling), and the load duration curve of these hours.
+    """
+    filtered_demand = signature_demand(outdoor_temperatures, demand, mode)
+    capacity_70, capacity_90 = size_capacities(filtered_demand, PEAK_FRACTION, (0.7, 0.9)).tolist()
+    sorted_demand = load_duration_curve(filtered_demand).tolist()
+    return capacity_70, capacity_90, sorted_demand
 
-    # Sort the demands to create load duration curves (in descending order)
-    sorted_demand = sorted(filtered_demand, reverse=True)
-    # Calculate the peak
-    max_peak = max(sorted_demand)
+# Generation system profiles, indexed on the first call to load_generation_system_profiles
+GENERATION_SYSTEM_PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogues",
+                                               "all_profiles.csv")
+_generation_system_profiles = ProcessWideInstance(
+    lambda: GenerationSystemProfileIndex(GENERATION_SYSTEM_PROFILES_PATH))
 
-    # Capacity at 80% and 90% demand
-    capacity_70 =  0.7 * max_peak
-    capacity_90 = 0.9 * max_peak
 
-    # print(f"Capacity to meet 80% of demand: {capacity_70:.2f}")
-    # print(f"Capacity to meet 90% of demand: {capacity_90:.2f}")
-    return capacity_70, capacity_90, sorted_demand
+def load_generation_system_profiles():
+    """Returns the process-wide GenerationSystemProfileIndex. The csv file is only read on the first call."""
+    return _generation_system_profiles.get()
+
 
 def get_generation_system_profile_id(electricity_id, dhw_id, heating_id, cooling_id):
     """
     This function takes in system type IDs for electricity, DHW, heating, and cooling,
-    looks them up in the DataFrame, and returns the corresponding generation_system_profile_id.
+    looks them up in the profiles index, and returns the corresponding generation_system_profile_id.
 
     Parameters:
     - electricity_id: The ID of the electricity system type.
-    - dhw_id: The ID of the DHW system type.
-    - heating_id: The ID of the heating system type.
-    - cooling_id: The ID of the cooling system type.
-    - df: DataFrame containing the system types and generation_system_profile_id.
+    - dhw_id: The ID of the DHW system type (None if there is none).
+    - heating_id: The ID of the heating system type (None if there is none).
+    - cooling_id: The ID of the cooling system type (None if there is none).
 
     Returns:
     - generation_system_profile_id if a match is found, otherwise None.
     """
-    system_profile_combinations_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                                   "catalogues", "all_profiles.csv")
-    system_profile_combinations=pd.read_csv(system_profile_combinations_csv)
-    # Filter the DataFrame to match the provided system type IDs
-    # Filtrar el DataFrame para que coincida con los valores proporcionados, considerando NaN
-    matched_row = system_profile_combinations[
-        (system_profile_combinations["electricity_id"] == electricity_id) &
-        ((system_profile_combinations["dhw_id"] == dhw_id) | (pd.isna(system_profile_combinations["dhw_id"]) & (dhw_id is None))) &
-        ((system_profile_combinations["heating_id"] == heating_id) | (pd.isna(system_profile_combinations["heating_id"]) & (heating_id is None))) &
-        ((system_profile_combinations["cooling_id"] == cooling_id) | (pd.isna(system_profile_combinations["cooling_id"]) & (cooling_id is None)))
-    ]
-
-    # Check if we found a match
-    if not matched_row.empty:
-        return int(matched_row.iloc[0]["id"])  # This column contains the generation_system_profile_id
-    else:
-        return None
+    return load_generation_system_profiles().get_id(electricity_id, dhw_id, heating_id, cooling_id)
+
+
+def get_generation_system_components(generation_system_profile_id):
+    """
+    Reverse lookup of get_generation_system_profile_id: returns a dict with the electricity_id, dhw_id, heating_id
+    and cooling_id of a generation system profile (None for missing systems), or None if the profile does not exist.
+    """
+    return load_generation_system_profiles().get_components(generation_system_profile_id)
+
+
+
+# Generation systems of the recommended actions, compiled on the first call to load_action_systems
+ACTIONS_TO_GENERATION_SYSTEMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                                                  "actions_to_generation_systems.csv")
+_action_systems = ProcessWideInstance(lambda: ActionSystemLookup.from_csv(ACTIONS_TO_GENERATION_SYSTEMS_PATH))
 
 
+def load_action_systems():
+    """Returns the process-wide ActionSystemLookup. The csv file is only read on the first call."""
+    return _action_systems.get()
+
 
 def get_system_type_for_action(actions_to_generation_systems, action_key,system):
     """
@@ -237,27 +192,18 @@ def get_system_type_for_action(actions_to_generation_systems, action_key,system)
       and then updates the system profile for the building with the new ID.
     Parameters
     ----------
-    actions_to_generation_systems is a DataFrame that contains action information, including the action_key and name_system_type columns.
+    actions_to_generation_systems is an ActionSystemLookup (see load_action_systems), or a DataFrame that contains
+    action information, including the action_key, name_system_type and id columns (compiled on each call).
     action_key represents an identifier for a recommended action.
     system represents the type of system (electricity, dhw, cooling, heating)
 
     Returns
     -------
-    new_system_id
+    new_system_id: the first generation system id of the action for this system (ActionSystemLookup.first), or None
     """
-    # Create a mask to filter the DataFrame where action_key matches and name_system_type contains the system key
-    mask = (actions_to_generation_systems["action_key"] == action_key) & (
-        actions_to_generation_systems["name_system_type"].str.contains(system))
-    # Get the 'id' values from the filtered DataFrame
-    try:
-        new_system_id = actions_to_generation_systems.loc[mask, "id"].values
-        if new_system_id.size == 0:
-            new_system_id = None
-    except ValueError as e:
-        # print(f"Error retrieving new_system_id: {e}")
-        new_system_id = None
-    corrected_id=handle_new_system_id(new_system_id)
-    return corrected_id
+    if not isinstance(actions_to_generation_systems, ActionSystemLookup):
+        actions_to_generation_systems = ActionSystemLookup.from_frame(actions_to_generation_systems)
+    return actions_to_generation_systems.first(action_key, system)
 
 def get_centroid(group_of_geoms,target_epsg=4326):
 
@@ -278,87 +224,78 @@ def get_centroid(group_of_geoms,target_epsg=4326):
     community centroid
     """
 
-    geoms_list = []
-    names_list = []
-    ids_list = []
+    ids_list = list(group_of_geoms)
+    # Convert the string geometries (WKT) to Shapely geometry objects, invalid geometries are fixed by buffering them
+    geometries = geometries_from_wkt([data["geom"] for data in group_of_geoms.values()])
+    loaded = ~shapely.is_missing(geometries)
+    for building_id in np.asarray(ids_list, dtype=object)[~loaded]:
+        # If there's an issue loading the geometry, log it and skip
+        print(f"Error loading geometry for building {building_id}")
+    ids_list = [building_id for building_id, ok in zip(ids_list, loaded) if ok]
+    names_list = [data["name"] for data, ok in zip(group_of_geoms.values(), loaded) if ok]
+    geometries = geometries[loaded]
+
+    # Areas and centroids in the local projection of the community (UTM zone), in one vectorized pass
+    metrics = footprint_metrics(geometries)
+
+    # Create the GeoDataFrame
+    gdf = gpd.GeoDataFrame({"id": ids_list, "name": names_list, "geometry": geometries}, crs="EPSG:4326")
+    gdf["centroid"] = gpd.GeoSeries(metrics["centroids"], crs="EPSG:4326")
+    gdf["area_m2"] = metrics["areas"]
+    community_centroid = metrics["community_centroid"]
 
-    for building_id, data in group_of_geoms.items():
-        try:
-            # Try converting the string geometry (WKT) to a Shapely geometry object
-            geometry = wkt.loads(data["geom"])
+    # ------------------------------------------------------
+    # ASSUMES INPUT AND OUTPUT CRS IS EPSG 4326
+    # IF NOT, IT MUST BE MODIFIED
+    # ------------------------------------------------------
+    return gdf, community_centroid
 
-            # Check if the geometry is valid
-            if not geometry.is_valid:
-                # print(f"Warning: Geometry for building {building_id} is invalid, attempting to fix...")
-                geometry = geometry.buffer(0)  # Try to fix the geometry by buffering it
 
-            # Append the valid geometry to the list
-            geoms_list.append(geometry)
-            names_list.append(data["name"])
-            ids_list.append(building_id)
+# Power curves of the wind turbines, loaded on the first call to load_wind_power_curves
+WIND_POWER_CURVES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                                      "wind_turbine_power_curves.json")
+# Mean of the e200 (https://www.enair.es/en/small-wind-turbines/e200, nominal power of 20 kW) and 030pro curves,
+# starts functioning at 1.85 m/s and stops above 15 m/s
+DEFAULT_WIND_TURBINE = "small_wind_mean"
+_wind_power_curves = ProcessWideInstance(lambda: WindPowerCurveRegistry(WIND_POWER_CURVES_PATH))
 
-        except GEOSException as e:
-            # If there's an issue loading the geometry, log it and skip
-            print(f"Error loading geometry for building {building_id}: {e}")
 
-    # Create the GeoDataFrame
-    gdf = gpd.GeoDataFrame({"id": ids_list, "name": names_list, "geometry": geoms_list}, crs="EPSG:4326")
+def load_wind_power_curves():
+    """Returns the process-wide WindPowerCurveRegistry. The json file is only parsed on the first call."""
+    return _wind_power_curves.get()
 
-    # Convert to a projected CRS (use an appropriate UTM zone if possible)
-    projected_crs = 3857  # Web Mercator; replace with a UTM zone for better accuracy
-    gdf_projected = gdf.to_crs(epsg=projected_crs)
 
-    # Compute centroids in the projected CRS
-    gdf_projected["centroid"] = gdf_projected.geometry.centroid
+def wind_power(wind_speed, turbine=DEFAULT_WIND_TURBINE, hub_height=None):
+    """
+    Wind potential (kWh per kW installed) of each wind speed, interpolated on the power curve of the turbine.
 
-    # Compute the community centroid in projected CRS
-    community_centroid_projected = gdf_projected.unary_union.centroid
+    Parameters
+    ----------
+    wind_speed : array of wind speeds (m/s) at 10 m, e.g. tmy_data['WS10m']
+    turbine : name of the power curve in data/wind_turbine_power_curves.json
+    hub_height : if given, the wind speed is extrapolated from 10 m to this height (m) with the power law
 
-    # Reproject centroids back to EPSG:4326
-    gdf["centroid"] = gdf_projected["centroid"].to_crs(epsg=4326)
-    community_centroid = gpd.GeoSeries([community_centroid_projected], crs=projected_crs).to_crs(epsg=4326).iloc[0]
+    Returns
+    -------
+    numpy array with the wind potential of each wind speed
+    """
+    return load_wind_power_curves().power(wind_speed, turbine, hub_height)
 
 
-    # ------------------------------------------------------
-    # ASSUMES INPUT AND OUTPUT CRS IS EPSG 4326
-    # IF NOT, IT MUST BE MODIFIED
-    # ------------------------------------------------------
-    return gdf, community_centroid
-def wind_power(wind_speed):
-    import numpy as np
-
-    # Define wind speed and power from the technology (in this case wind turbine e200 https://www.enair.es/en/small-wind-turbines/e200)
-    #18 meters height, nominal power of 20 kW, starts functioning at 1.85 m/s
-    wind_speed_table = [0, 1.85, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20,20.01]
-    power_table = [0, 0, 80, 500, 1350, 2800, 4700, 7000, 9600, 12300, 15500, 17800, 18500, 18000,
-                   17500, 17500, 17500, 17500, 17500, 17500, 17500, 0]
-    wind_speed_table_030pro=[0, 1.85, 2, 3, 4, 5, 7, 8, 9, 10, 11, 12,  15, 15.01]
-    power_table_030pro=[0, 0, 0, 10, 100, 300, 1000, 1450, 1850, 2100, 2300, 2500,2500,0]
-    # Scaling power values
-    power_table = [p / 20000 for p in power_table]
-    power_table_030pro = [p / 3000 for p in power_table_030pro]
-    # Interpolating power values for the second dataset to match the wind_speed_table of the first dataset
-    interpolated_power_table_030pro = np.interp(wind_speed_table, wind_speed_table_030pro, power_table_030pro)
-    # Calculating mean values
-    mean_power = [(p1 + p2) / 2 for p1, p2 in zip(power_table, interpolated_power_table_030pro)]
-    # Setting mean power values to 0 for wind speeds above 15 m/s
-    mean_power_adjusted = [0 if wind_speed > 15 else power for wind_speed, power in zip(wind_speed_table, mean_power)]
-
-    # Interpolate power for each wind speed in tmy_data['WS10m']
-    wind_potential_kWh_per_kWp = np.interp(wind_speed, wind_speed_table, mean_power_adjusted).tolist()
-
-
-    return wind_potential_kWh_per_kWp
-
-
-def call_PVGIS(longitude, latitude,tilt_angle):
+def call_PVGIS(longitude, latitude,tilt_angle, pvgis_cache=None, weather_provider=None):
         """
         Calculate temperatures and radiations based on TMY data and return a JSON for
         the given centroid returning temperatures, and radiations.
+        The location is snapped to the grid of the weather provider (cells of about 5 km for PVGIS) and the derived
+        arrays are kept in the local PVGIS cache (see weather_data.PVGISCache), so PVGIS is only called the first
+        time a cell is used and the communities of the same cell share its data.
 
         Parameters
         ----------
         centroid : point (X Y)
+        pvgis_cache : PVGISCache, by default the process-wide cache of weather_data.get_pvgis_cache()
+        weather_provider : WeatherProvider (PVGIS, local TMY/EPW files or recorded data), by default the
+            process-wide provider of weather_data.get_weather_provider()
 
         Returns
         -------
@@ -378,18 +315,46 @@ def call_PVGIS(longitude, latitude,tilt_angle):
                        surface azimuth 180º which is south, 0=fixed
 
         """
-        URL = 'https://re.jrc.ec.europa.eu/api/v5_3/'
-        pv_data=get_pvgis_hourly (latitude, longitude, start=2023, end=2023,components=True,
-                                surface_tilt=tilt_angle, surface_azimuth=180,
-                                outputformat='json',
-                                usehorizon=True,  pvcalculation=True,
-                                peakpower=1, pvtechchoice='crystSi',
-                                mountingplace='free', loss=0, trackingtype=0,
-                                optimal_surface_tilt=False, optimalangles=False,
-                                url=URL, map_variables=True, timeout=30)
-        pv_profile_in_kWh_kWp=pv_data[0]['P'].tolist() # PV system power (W)
-        pv_profile_in_kWh_kWp = [x/1000 for x in pv_profile_in_kWh_kWp]  # PV system power in kW/kWp
-        solar_elevation=pv_data[0]['solar_elevation'].copy() #     Sun height / elevation(degrees) dataframe
+        if pvgis_cache is None:
+            pvgis_cache = get_pvgis_cache()
+        if weather_provider is None:
+            weather_provider = get_weather_provider()
+        # the locations of the same cell of the weather grid share the data (one fetch and one cache entry)
+        latitude, longitude = weather_provider.snap(latitude, longitude)
+        arrays = pvgis_cache.get_or_fetch(latitude, longitude, tilt_angle,
+                                          partial(fetch_PVGIS_arrays, weather_provider=weather_provider,
+                                                  pvgis_cache=pvgis_cache),
+                                          weather_provider.source)
+
+        pv_profile_in_kWh_kWp = arrays["pv_profile_kWh_per_kWp"].tolist()
+        solar_elevation_midday_values = solar_elevation_from_arrays(arrays)
+        T2m = arrays["T2m"].tolist()
+        wind_potential_kWh_per_kWp = arrays["wind_potential_kWh_per_kWp"].tolist()
+        irradiance_dic = {name: arrays[name].tolist() for name in list(ORIENTATIONS) + TMY_IRRADIANCE}
+        irradiance_dic_with_tmy_data = irradiance_dic
+
+        return irradiance_dic, pv_profile_in_kWh_kWp, solar_elevation_midday_values, T2m, wind_potential_kWh_per_kWp, irradiance_dic_with_tmy_data
+
+
+def fetch_PVGIS_arrays(latitude, longitude, tilt_angle, weather_provider=None, pvgis_cache=None):
+        """
+        Gets the hourly PV production and the TMY data of a location from the weather provider (PVGIS by default)
+        and returns the derived arrays stored in the PVGIS cache: pv_profile_kWh_per_kWp, T2m, WS10m,
+        wind_potential_kWh_per_kWp, the irradiance of the vertical surfaces (ORIENTATIONS), the TMY irradiances and
+        the midday solar elevation. The PV and TMY requests are independent and run at the same time. The TMY data
+        and solar position do not depend on the tilt angle and are cached once per location
+        (weather_data.get_location_arrays).
+        """
+        if weather_provider is None:
+            weather_provider = get_weather_provider()
+        request = location_request(latitude, longitude)
+        fetched = get_fetcher().fetch_all({
+            f"pv_hourly|{request}": partial(weather_provider.get_pv_hourly, latitude, longitude, tilt_angle),
+            f"location|{request}": partial(get_location_arrays, latitude, longitude, pvgis_cache, weather_provider),
+        })
+        pv_data = fetched[f"pv_hourly|{request}"]
+        pv_profile_in_kWh_kWp = pv_data['P'].to_numpy(dtype=float) / 1000  # PV system power in kW/kWp
+        solar_elevation=pv_data['solar_elevation'].copy() #     Sun height / elevation(degrees) dataframe
         solar_elevation = solar_elevation.reset_index()  # Converts the index to a column
         solar_elevation['time'] = pd.to_datetime(solar_elevation['time'])
         date_filter = (solar_elevation['time'].dt.date == pd.to_datetime('2023-12-12').date())
@@ -398,56 +363,65 @@ def call_PVGIS(longitude, latitude,tilt_angle):
                       (solar_elevation['time'].dt.time <= pd.to_datetime('14:00').time())
         filtered_rows = solar_elevation[date_filter & time_filter]
         solar_elevation_midday_values = filtered_rows[['time', 'solar_elevation']]
-        # Call PVGIS API (with pvlib) to get TMY data
-        tmy_data, months_selected, inputs, meta = get_pvgis_tmy(latitude, longitude, map_variables=False, url=URL)
-
-        # Ensure 'tmy_data' index is in datetime format
-        tmy_data.index = pd.to_datetime(tmy_data.index)
-        #get other data
-        T2m = tmy_data['T2m'].tolist()
-        WS10m = tmy_data['WS10m'].tolist()
+        # TMY data and solar position (apparent zenith and azimuth, in degrees) of the location
+        location_arrays = fetched[f"location|{request}"]
         #get wind potential at 10 meters height
-        wind_potential_kWh_per_kWp=wind_power(WS10m)
-        # Define the location using 'inputs' data
-        latitude = inputs['location']['latitude']
-        longitude = inputs['location']['longitude']
-        site = Location(latitude, longitude,altitude=inputs['location']['elevation'])  # Use Location class directly
-        #Location class sets times as UTC
-
-        # The angles apparent zenith and azimuth are obtained
-        solar_position = site.get_solarposition(times=tmy_data.index)
-
-        # Define orientations of vertical surfaces
-        orientations = {
-            'rad_n': 0,
-            'rad_s': 180,
-            'rad_e': 90,
-            'rad_o': 270  # 'rad_o' changed to 'rad_w' for clarity
+        wind_potential_kWh_per_kWp=wind_power(location_arrays['WS10m'])
+
+        arrays = {
+            "pv_profile_kWh_per_kWp": pv_profile_in_kWh_kWp,
+            "T2m": location_arrays['T2m'],
+            "WS10m": location_arrays['WS10m'],
+            "wind_potential_kWh_per_kWp": wind_potential_kWh_per_kWp,
         }
+        # Orientations of vertical surfaces, with the tilt angle, in one pass (surfaces x hours)
+        surfaces = [(tilt_angle, azimuth_angle) for azimuth_angle in ORIENTATIONS.values()]
+        irradiance = poa_irradiance(surfaces, location_arrays['apparent_zenith'], location_arrays['azimuth'],
+                                    dni=location_arrays['Gb(n)'], ghi=location_arrays['G(h)'],
+                                    dhi=location_arrays['Gd(h)'])
+        for orientation_name, surface_irradiance in zip(ORIENTATIONS, irradiance):
+            arrays[orientation_name] = surface_irradiance  # Radiation
 
-        # Tilt angle (90 degrees for vertical surfaces)
-        tilt_angle = tilt_angle
-        irradiance_dic={}
-        for orientation_name, azimuth_angle in orientations.items():
-            irradiance = get_total_irradiance(
-                surface_tilt=tilt_angle,
-                surface_azimuth=azimuth_angle,
-                solar_zenith=solar_position['apparent_zenith'], #The angles are in degrees.
-                solar_azimuth=solar_position['azimuth'],#The angles are in degrees.
-                dni=tmy_data['Gb(n)'], #units': 'W/m2
-                ghi=tmy_data['G(h)'],
-                dhi=tmy_data['Gd(h)'],
-            )
-
-            irradiance_dic[orientation_name] = irradiance['poa_global'].tolist()  # Radiation list
-
-        irradiance_dic_with_tmy_data=irradiance_dic
-        irradiance_dic_with_tmy_data['Gb(n)']=tmy_data['Gb(n)'].tolist()
-        irradiance_dic_with_tmy_data['G(h)']=tmy_data['G(h)'].tolist()
-        irradiance_dic_with_tmy_data['Gd(h)']=tmy_data['Gd(h)'].tolist()
+        for name in TMY_IRRADIANCE:
+            arrays[name] = location_arrays[name]
+        arrays.update(solar_elevation_to_arrays(solar_elevation_midday_values))
+        return arrays
 
-        return irradiance_dic, pv_profile_in_kWh_kWp, solar_elevation_midday_values, T2m, wind_potential_kWh_per_kWp, irradiance_dic_with_tmy_data
 
+def prefetch_PVGIS(locations, tilt_angle, pvgis_cache=None, weather_provider=None):
+        """
+        Fills the PVGIS cache with the data of many locations at once (e.g. all the communities of a study), so
+        the contexts are later generated without waiting for the weather data.
+
+        Parameters
+        ----------
+        locations : iterable of (longitude, latitude), as the arguments of call_PVGIS
+        tilt_angle : tilt angle of the PV systems
+        pvgis_cache : PVGISCache, by default the process-wide cache
+        weather_provider : WeatherProvider, by default the process-wide provider
+
+        Returns
+        -------
+        list
+            Cache keys of the locations, once per cell of the weather grid
+        """
+        if pvgis_cache is None:
+            pvgis_cache = get_pvgis_cache()
+        if weather_provider is None:
+            weather_provider = get_weather_provider()
+        fetch = partial(fetch_PVGIS_arrays, weather_provider=weather_provider, pvgis_cache=pvgis_cache)
+        keys = {}
+        calls = {}
+        for longitude, latitude in locations:
+            latitude, longitude = weather_provider.snap(latitude, longitude)
+            request = location_request(latitude, longitude)
+            if request not in keys:
+                keys[request] = pvgis_cache.key(latitude, longitude, tilt_angle, weather_provider.source)
+                calls[f"location|{request}"] = partial(pvgis_cache.get_or_fetch, latitude, longitude, tilt_angle,
+                                                       fetch, weather_provider.source)
+        # the cells are fetched concurrently, bounded by the process-wide fetcher
+        get_fetcher().fetch_all(calls)
+        return list(keys.values())
 
 
 def handle_storage_system(action_key, actions_to_generation_systems,community_node, energy_systems_catalogue):
@@ -573,10 +547,11 @@ def handle_dhw_system(updated_generation_system_profile, new_gen_system_id,
                       dhw_demand, energy_systems_catalogue,building_id,
                       ):
 
-    capacity_70, capacity_90, sorted_demand = peak_load_distribution_curve(dhw_demand)
+    # 70% of the peak by default, see SYSTEM_SIZING
+    capacity = system_capacity(dhw_demand, "dhw")
     new_building_energy_asset_dic,updated_generation_system_profile["dhw_system"]=add_new_building_energy_asset_system (system_id=new_gen_system_id,
                                                                         energy_systems_catalogue=energy_systems_catalogue,
-                                                                        capacity=capacity_70,
+                                                                        capacity=capacity,
                                                                         building_id=building_id,
                                                                         system="dhw",
                                                                         demand=dhw_demand)
@@ -587,23 +562,25 @@ def handle_dhw_system(updated_generation_system_profile, new_gen_system_id,
 
 def handle_cooling_system(updated_generation_system_profile, new_gen_system_id, cooling_demand, energy_systems_catalogue,building_id):
 
-    capacity_70, capacity_90, sorted_demand = peak_load_distribution_curve(cooling_demand)
+    # 90% of the peak by default, see SYSTEM_SIZING
+    capacity = system_capacity(cooling_demand, "cooling")
     new_building_energy_asset_dic,updated_generation_system_profile["cooling_system"]=add_new_building_energy_asset_system (system_id=new_gen_system_id,
                                                                         energy_systems_catalogue=energy_systems_catalogue,
-                                                                        capacity=capacity_90,
+                                                                        capacity=capacity,
                                                                         building_id=building_id,
                                                                         system="cooling",
                                                                         demand=cooling_demand)
     return updated_generation_system_profile, new_building_energy_asset_dic
 
-def handle_cooling_system(updated_generation_system_profile, new_gen_system_id,
+def handle_heating_system(updated_generation_system_profile, new_gen_system_id,
                           heating_demand, energy_systems_catalogue,building_id
                           ):
 
-    capacity_70, capacity_90, sorted_demand = peak_load_distribution_curve(heating_demand)
+    # 70% of the peak by default, see SYSTEM_SIZING
+    capacity = system_capacity(heating_demand, "heating")
     new_building_energy_asset_dic,updated_generation_system_profile["heating_system"]=add_new_building_energy_asset_system (system_id=new_gen_system_id,
                                                                         energy_systems_catalogue=energy_systems_catalogue,
-                                                                        capacity=capacity_70,
+                                                                        capacity=capacity,
                                                                         building_id=building_id,
                                                                         system="heating",
                                                                         demand=heating_demand)
@@ -644,8 +621,8 @@ def update_building_system(goal, building_id,building_geom, demandprofile,pvprof
         The dictionary within the list can represent the current energy asset for the building (if available).
         If no asset is present, this is `None` or []
 
-    actions_to_generation_systems : pd.DataFrame
-        A DataFrame that maps action keys to corresponding system types and system IDs. This is used to look up
+    actions_to_generation_systems : ActionSystemLookup (or pd.DataFrame)
+        Table that maps action keys to corresponding system types and system IDs. This is used to look up
         the new system IDs based on the action being applied.
 
     action_key : int
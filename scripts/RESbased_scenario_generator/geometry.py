@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies:
+    python 3.12
+    numpy                     1.26.4
+    shapely                    2.0.4
+    pyproj                     3.6.1
+License: GNU GPLv3
+The GNU General Public License is a free, copyleft license for software and other kinds of works.
+https://www.gnu.org/licenses/gpl-3.0.html
+You may copy, distribute and modify the software as long as you track changes/dates in source files.
+ Any modifications to or software including (via compiler) GPL-licensed code must also be made
+ available under the GPL along with build & install instructions.
+ This means, you must:
+     - Include original
+     - State Changes
+     - Disclose source
+     - Include the same license -- to make sure it remains free software for all its users.
+     - Include copyright
+     - Include install instructions
+
+You cannot: sublicense or hold liable.
+
+Copyright @CARTIF 2024
+
+***********************************************************************************************
+
+This part of the code computes the areas (m2) and centroids of the building footprints of a community in a local
+projection (UTM zone or Lambert azimuthal equal-area), with vectorized shapely functions
+
+***********************************************************************************************
+
+"""
+import threading
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+
+# Beyond these latitudes UTM is not defined and a Lambert azimuthal equal-area projection is used
+UTM_MAX_LATITUDE = 84
+GEOGRAPHIC_EPSG = 4326
+
+# Transformers per projection and thread (pyproj transformers must not be shared between threads)
+_transformers = threading.local()
+
+
+def local_projection(longitude, latitude):
+    """
+    Local projected CRS of a location: its UTM zone (WGS 84) or, near the poles, a Lambert azimuthal equal-area
+    projection centred on it. Distances and areas are in meters.
+    :return: pyproj CRS
+    """
+    if abs(latitude) > UTM_MAX_LATITUDE:
+        return CRS.from_proj4(f"+proj=laea +lat_0={latitude:.4f} +lon_0={longitude:.4f} +datum=WGS84 +units=m")
+    zone = min(int((longitude + 180) // 6) + 1, 60)
+    return CRS.from_epsg((32600 if latitude >= 0 else 32700) + zone)
+
+
+def get_transformers(crs):
+    """Returns the (geographic to projected, projected to geographic) transformers of a CRS, cached per thread."""
+    cache = getattr(_transformers, "cache", None)
+    if cache is None:
+        cache = _transformers.cache = {}
+    key = crs.to_wkt()
+    if key not in cache:
+        cache[key] = (Transformer.from_crs(GEOGRAPHIC_EPSG, crs, always_xy=True),
+                      Transformer.from_crs(crs, GEOGRAPHIC_EPSG, always_xy=True))
+    return cache[key]
+
+
+def geometries_from_wkt(wkt_strings):
+    """
+    Shapely geometries of WKT strings, in one call. Invalid geometries are fixed with a zero buffer and WKT
+    strings that cannot be read give None.
+    :return: array of geometries
+    """
+    geometries = shapely.from_wkt(np.asarray(wkt_strings, dtype=object), on_invalid="ignore")
+    invalid = ~shapely.is_valid(geometries) & ~shapely.is_missing(geometries)
+    if invalid.any():
+        geometries[invalid] = shapely.buffer(geometries[invalid], 0)
+    return geometries
+
+
+def project(geometries, transformer):
+    """Transforms all the coordinates of the geometries at once with a pyproj transformer."""
+    return shapely.transform(geometries, lambda coordinates: np.column_stack(
+        transformer.transform(coordinates[:, 0], coordinates[:, 1])))
+
+
+def has_coordinates(geometries):
+    """Mask of the geometries that are neither missing (None) nor empty."""
+    return ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+
+
+def footprint_metrics(geometries, crs=None):
+    """
+    Areas and centroids of building footprints (EPSG:4326) and the centroid of the community, computed in a local
+    projection for thousands of footprints in one call.
+    :param geometries: sequence of shapely geometries in EPSG:4326
+    :param crs: projected CRS, by default local_projection of the centre of the footprints
+    :return: dict with
+        areas: array of areas (m2)
+        centroids: array of shapely points (EPSG:4326), centroid of each footprint
+        community_centroid: shapely point (EPSG:4326), centroid of the union of the footprints, None if there are
+        no footprints with coordinates
+        crs: projected CRS used
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    if not has_coordinates(geometries).any():
+        # no footprints (e.g. an empty GeoJSON), there is no location to choose a projection from
+        return {
+            "areas": shapely.area(geometries),
+            "centroids": shapely.centroid(geometries),
+            "community_centroid": None,
+            "crs": crs,
+        }
+    if crs is None:
+        xmin, ymin, xmax, ymax = shapely.total_bounds(geometries)
+        crs = local_projection((xmin + xmax) / 2, (ymin + ymax) / 2)
+    to_projected, to_geographic = get_transformers(crs)
+    projected = project(geometries, to_projected)
+    areas = shapely.area(projected)
+    projected_centroids = shapely.centroid(projected)
+    return {
+        "areas": areas,
+        "centroids": project(projected_centroids, to_geographic),
+        "community_centroid": project(union_centroid(projected, areas, projected_centroids), to_geographic),
+        "crs": crs,
+    }
+
+
+def union_centroid(geometries, areas=None, centroids=None):
+    """
+    Centroid of the union of the geometries. When their interiors do not overlap (footprints may share walls) it
+    is the area-weighted mean of their centroids, which avoids computing the union.
+    """
+    # missing and empty geometries have no centroid to weight
+    present = has_coordinates(geometries)
+    geometries = geometries[present]
+    areas = shapely.area(geometries) if areas is None else areas[present]
+    centroids = shapely.centroid(geometries) if centroids is None else centroids[present]
+    if len(geometries) == 0:
+        return shapely.Point()
+    tree = shapely.STRtree(geometries)
+    first, second = tree.query(geometries, predicate="intersects")
+    pairs = first < second
+    overlapping = pairs.any() and not shapely.touches(geometries[first[pairs]], geometries[second[pairs]]).all()
+    if overlapping or areas.sum() <= 0:
+        return shapely.centroid(shapely.union_all(geometries))
+    coordinates = shapely.get_coordinates(centroids)
+    return shapely.Point(np.average(coordinates, axis=0, weights=areas))
+
+
+def footprint_areas(geometries, crs=None):
+    """Areas (m2) of building footprints in EPSG:4326, computed in a local projection."""
+    geometries = np.asarray(geometries, dtype=object)
+    if not has_coordinates(geometries).any():
+        return shapely.area(geometries)
+    if crs is None:
+        xmin, ymin, xmax, ymax = shapely.total_bounds(geometries)
+        crs = local_projection((xmin + xmax) / 2, (ymin + ymax) / 2)
+    return shapely.area(project(geometries, get_transformers(crs)[0]))
@@ -34,14 +34,13 @@ This part of the code is changes the
 ***********************************************************************************************
 
 """
-import pandas as pd
-import os
 from scripts.RESbased_scenario_generator.context_creation import (update_building_system, get_centroid, call_PVGIS, update_community_energy_assets,
                               create_grid_community_asset, convert_geometries_to_strings,
-                              update_building_consumption, get_system_type_for_action,add_new_building_energy_asset_system)
-from scripts.RESbased_scenario_generator.classes_database import BuildingConsumption
+                              update_building_consumption, get_system_type_for_action,add_new_building_energy_asset_system,
+                              load_action_systems)
+from scripts.RESbased_scenario_generator.classes_database import AssetRegistry, BuildingConsumption
 from datetime import datetime
-from scripts.KPI_module.key_performance_indicators import handle_demand_profile
+from scripts.KPI_module.key_performance_indicators import handle_demand_profile, map_tasks
 
 # Define constants for recurring string literals
 AVAILABILITY_TS = "availability_ts"
@@ -51,6 +50,7 @@ GENERATION_SYSTEM_PROFILE="generation_system_profile"
 GENERATION_SYSTEM_PROFILE_ID="generation_system_profile_id"
 BUILDING = "building"
 BUILDING_CONSUMPTION="building_consumption"
+BUILDING_ENERGY_ASSET="building_energy_asset"
 DEMANDPROFILE = "demandprofile"
 HEATING_SYSTEM = "heating_system"
 COOLING_SYSTEM = "cooling_system"
@@ -79,24 +79,6 @@ COOLING_SYSTEM_ID="cooling_system_id"
 ELECTRICITY_SYSTEM_ID="electricity_system_id"
 
 
-def assign_incremental_ids_to_community_assets(community_energy_asset):
-    current_id = 1  # Start with an initial id value
-    nodes_id=1
-    # Loop through each building in the list
-    for assets in community_energy_asset:
-        # Loop through each energy asset within the building
-            assets["id_temp"] = current_id
-            if assets[AVAILABILITY_TS] is not None:
-                assets[AVAILABILITY_TS]["id_temp"]= current_id
-            assets["input_node"]["id_temp"] = nodes_id #DE MOMENTO MIRA AL MISMO ID, CAMBIAR SI SE CAMBIA GEOMETRIA
-            # nodes_id+=1
-            if "output_node" in assets:
-                assets["output_node"]["id_temp"] = nodes_id
-                # nodes_id += 1
-            # Increment the id for the next asset
-            current_id += 1
-
-    return community_energy_asset
 def assign_incremental_ids(building_asset_context):
     current_id = 1  # Start with an initial id value
 
@@ -112,49 +94,224 @@ def assign_incremental_ids(building_asset_context):
 
     return building_asset_context
 
-# Check if the asset exists by generation_system_id
-def asset_exists(community_context, new_gen_system_id):
-    for node in community_context.get("node", []):
-        for asset_data in node.get("community_energy_asset_input", []):
-            if asset_data.get("generation_system_id") == new_gen_system_id:
-                return True
-    return False
-def remove_duplicates(old_systems, assets_list):
+def copy_on_write_energy_asset(energy_asset):
+    """Copy of an energy asset whose ids can be rewritten: its availability_ts and nodes are copied one level."""
+    energy_asset = dict(energy_asset)
+    for key in (AVAILABILITY_TS, "input_node", "output_node"):
+        if isinstance(energy_asset.get(key), dict):
+            energy_asset[key] = dict(energy_asset[key])
+    return energy_asset
+
+
+def copy_on_write_building_asset_context(building_asset_context):
+    """
+    Copy of a building asset context for a child scenario. Only the containers that scenario generation writes are
+    copied (the context itself, its generation_system_profile, building_consumption and building_energy_asset); the
+    building, its geometry and the hourly profiles are shared with the parent.
     """
-    Removes duplicates from the assets_list based on system IDs in old_systems.
+    building_asset_context = dict(building_asset_context)
+    for key in (GENERATION_SYSTEM_PROFILE, BUILDING_CONSUMPTION):
+        if isinstance(building_asset_context.get(key), dict):
+            building_asset_context[key] = dict(building_asset_context[key])
+    if isinstance(building_asset_context.get(BUILDING_ENERGY_ASSET), list):
+        building_asset_context[BUILDING_ENERGY_ASSET] = [copy_on_write_energy_asset(energy_asset)
+                                                         for energy_asset in building_asset_context[BUILDING_ENERGY_ASSET]]
+    return building_asset_context
 
-    Args:
-        old_systems (dict): Dictionary containing system IDs (e.g., 'electricity_system_id', 'heating_system_id').
-        assets_list (list): List of dictionaries representing building energy assets.
 
-    Returns:
-        list: A new list of assets with duplicates removed.
+def copy_on_write_context(community_context):
     """
-    # Extract relevant system IDs from old_systems
-    old_system_ids = {
-        'electricity_system_id': old_systems.get('electricity_system_id'),
-        'heating_system_id': old_systems.get('heating_system_id'),
-        'cooling_system_id': old_systems.get('cooling_system_id'),
-        'dhw_system_id': old_systems.get('dhw_system_id'),
-    }
+    Copy of a community context that can be modified by resbased_generator_context_creation without changing
+    community_context. Instead of a deep copy, the buildings and community energy assets are copied with
+    copy_on_write_building_asset_context and copy_on_write_energy_asset, so ten scenarios of a community share
+    its unchanged data and hourly arrays instead of holding ten copies of them.
+    """
+    community_context = dict(community_context)
+    if isinstance(community_context.get(BUILDING_ASSET_CONTEXT), list):
+        community_context[BUILDING_ASSET_CONTEXT] = [copy_on_write_building_asset_context(building_asset_context)
+                                                     for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]]
+    if isinstance(community_context.get("node"), list):
+        nodes = []
+        for node in community_context["node"]:
+            node = dict(node)
+            if isinstance(node.get("community_energy_asset_input"), list):
+                node["community_energy_asset_input"] = [copy_on_write_energy_asset(energy_asset)
+                                                        for energy_asset in node["community_energy_asset_input"]]
+            nodes.append(node)
+        community_context["node"] = nodes
+    return community_context
+
+
+def prepare_context_creation(community_context, weather_provider=None, pvgis_cache=None):
+    """
+    Preparation shared by all the scenarios of a community: the centroid of the buildings, the weather and PV data
+    of the centroid (call_PVGIS) and the table of the generation systems of each action.
 
-    # Filter out duplicates
-    filtered_assets = []
-    for asset in assets_list:
-        asset_ids = {
-            'electricity_system_id': asset.get('electricity_system_id'),
-            'heating_system_id': asset.get('heating_system_id'),
-            'cooling_system_id': asset.get('cooling_system_id'),
-            'dhw_system_id': asset.get('dhw_system_id'),
+    Parameters
+    ----------
+    community_context: The context input of the energy community
+    weather_provider : WeatherProvider of the weather data, by default the process-wide one
+    pvgis_cache : PVGISCache, by default the process-wide one
+
+    Returns
+    -------
+    preparation : dict with community_centroid, pv_profile_kWh_per_kWp, solar_elevation, T2m,
+        wind_potential_kWh_per_kWp and actions_to_generation_systems, or None if the context has no list of
+        building_asset_context
+    """
+    if not (BUILDING_ASSET_CONTEXT in community_context and isinstance(community_context[BUILDING_ASSET_CONTEXT], list)):
+        return None
+    group_of_geoms = {}
+    for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
+        # get group of geoms
+        group_of_geoms[building_asset_context["building"]["id"]] = {
+            "geom": building_asset_context["building"]["geom"],
+            "name": building_asset_context["name"]
         }
+    # get gdf and centroids
+    gdf, community_centroid = get_centroid(group_of_geoms)
+    longitude, latitude = community_centroid.x, community_centroid.y
+    # get pv_profile, wind profile and temperature for the centroid of the community
+    irradiance_dic, pv_profile_kWh_per_kWp, solar_elevation, T2m, wind_potential_kWh_per_kWp, irradiance_dic_with_tmy_data= call_PVGIS(
+        longitude, latitude, tilt_angle=35, pvgis_cache=pvgis_cache, weather_provider=weather_provider)
+    return {
+        "community_centroid": community_centroid,
+        "pv_profile_kWh_per_kWp": pv_profile_kWh_per_kWp,
+        "solar_elevation": solar_elevation,
+        "T2m": T2m,
+        "wind_potential_kWh_per_kWp": wind_potential_kWh_per_kWp,
+        # translate actions to new generation systems (table compiled once per process)
+        "actions_to_generation_systems": load_action_systems(),
+    }
 
-        # Check if the asset does not match any of the old_system IDs
-        if not any(old_system_ids[key] == asset_ids[key] for key in old_system_ids if old_system_ids[key] is not None):
-            filtered_assets.append(asset)
 
-    return filtered_assets
+def apply_actions_to_building(building_asset_context, temp_id, goal, recommendations_dic, context_id,
+                              pv_profile_kWh_per_kWp, solar_elevation, actions_to_generation_systems):
+    """
+    Applies the recommended actions of a scenario to one building asset context (see
+    resbased_generator_context_creation). The buildings are independent once the preparation is done, so this can
+    run in a worker process.
 
-def resbased_generator_context_creation(goal, community_context,recommendations_dic):
+    Parameters
+    ----------
+    building_asset_context : building asset context with a generation_system_profile_id, modified in place
+    temp_id : building_consumption_id_temp of the building, its position among the buildings that are modified
+    context_id : id_temp of the new context
+    pv_profile_kWh_per_kWp, solar_elevation, actions_to_generation_systems : from prepare_context_creation
+
+    Returns
+    -------
+    building_asset_context : the modified building asset context
+    actions_applied : dictionary action_key: action_name of the building level actions applied
+    """
+    actions_applied = {}
+    # energy assets of the building, indexed to add each of them only once
+    asset_registry = None
+    building_id_geom=None
+    for i, actions in recommendations_dic.items():
+        #get the action key
+        if "id" in actions:
+            action_key = int(actions["id"])
+            #Action key is demand reduction then:
+            if action_key ==1:
+                # print("these actions are not yet populated")
+                # geojson_object = generate_geojson(front_data=front_data)
+                # geojson_file = fetch_geojson(geojson_object=geojson_object)
+                # demand_profile = demand_thermagrid(data=data, front_data=front_data,
+                #                                    geojson_file=geojson_file)
+                new_system=False
+                pass
+            elif action_key == 2:
+                # print("these actions are not yet populated")
+                new_system=False
+                pass
+            elif action_key in [4,15,14,16,21]:
+                # print("this action is populated at community level")
+                new_system=False
+                pass
+            else:
+                if action_key not in actions_applied:
+                    actions_applied[action_key] = actions["action_name"]
+                old_systems = building_asset_context[GENERATION_SYSTEM_PROFILE]
+                # get building_id
+                building_id_geom = building_asset_context["building"]["id"]
+                if asset_registry is None:
+                    # register the existing building energy assets
+                    asset_registry = AssetRegistry()
+                    for energy_asset in building_asset_context[BUILDING_ENERGY_ASSET] or []:
+                        asset_registry.add_building_asset(building_id_geom, energy_asset)
+                # print(f"Processing action_key {action_key} with name {actions["action_name"]}")
+                # get generation system profile dics
+                generation_system = building_asset_context[GENERATION_SYSTEM_PROFILE]
+                # get building footprint
+                building_geom = float(building_asset_context["building"]["area_conditioned"])
+                # get connsumption profile
+                consumption_profile = building_asset_context["building_consumption"]
+                # get building demand profile
+                demandprofile = handle_demand_profile(building_asset_context, generation_system,
+                                                      consumption_profile)
+                type_of_systems = ["dhw", "cooling", "heating"]
+                for system in type_of_systems:
+                    # Check if the key ends with '_id' and the value is not None
+                    old_system_id = old_systems[f"{system}_system_id"]
+                    if (old_system_id is not None and action_key != 3
+                            and not asset_registry.has_building_asset(building_id_geom, old_system_id, system)):
+                        new_building_energy_asset_dic, updated_building_energy_asset_old_systems = add_new_building_energy_asset_system(
+                            system_id=old_system_id,
+                            energy_systems_catalogue=None,
+                            capacity=max(demandprofile[f"{system}_demand"]),
+                            building_id=building_id_geom,
+                            system=system,
+                            demand=demandprofile[f"{system}_demand"])
+                        asset_registry.add_building_asset(building_id_geom, new_building_energy_asset_dic, system)
+                # change building system
+                (updated_generation_system_profile,
+                 updated_building_energy_asset,
+                 new_system) = update_building_system(goal=goal,
+                                                      building_id=building_id_geom,
+                                                      building_geom=building_geom,
+                                                      demandprofile=demandprofile,
+                                                      pvprofile=pv_profile_kWh_per_kWp,
+                                                      buildings_generation_system=generation_system,
+                                                      building_energy_asset=asset_registry.building_assets(building_id_geom),
+                                                      actions_to_generation_systems=actions_to_generation_systems,
+                                                      action_key=action_key,
+                                                      solar_elevation=solar_elevation)
+                # update building energy assets, the assets already registered are not added again
+                for energy_asset in updated_building_energy_asset:
+                    asset_registry.add_building_asset(building_id_geom, energy_asset)
+                # update generation_system_profile_dic
+                building_asset_context[GENERATION_SYSTEM_PROFILE] = updated_generation_system_profile.copy()
+        else:
+            print("error encountered with action id")
+            pass
+    if asset_registry is not None and asset_registry.building_assets(building_id_geom):
+        building_asset_context[BUILDING_ENERGY_ASSET] = asset_registry.building_assets(building_id_geom)
+    if building_id_geom:
+        building_asset_context["id_temp"]=building_id_geom
+    # print(temp_id)
+
+    building_asset_context["context_id"]=context_id
+    # print(action_key)
+    # print(building_asset_context["name"])
+    if building_asset_context["name"] is not None:
+        building_asset_context["name"]=building_asset_context["name"]+f" with action {action_key}_ "
+    # print(f"  Building id {building_asset_context["id_temp"]} changed its generation system profile"
+    #       f"to {building_asset_context[GENERATION_SYSTEM_PROFILE_ID]}")
+    building_asset_context["building_consumption_id_temp"]=temp_id
+    if new_system:  # Only check if new_system is True
+        updated_building_dic=update_building_consumption(temp_id,demandprofile,building_asset_context)
+        building_asset_context["building_consumption"] = updated_building_dic
+    return building_asset_context, actions_applied
+
+
+def _apply_actions_to_building_task(task):
+    """Unpacks an apply_actions_to_building task, used as the process pool function."""
+    return apply_actions_to_building(*task)
+
+
+def resbased_generator_context_creation(goal, community_context,recommendations_dic, weather_provider=None, pvgis_cache=None,
+                                        preparation=None, max_workers=None, executor=None, id_temp=None):
     """
     Modifies the systems of each building, according to the list of recommended actions for one scenario
 
@@ -169,6 +326,16 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
             "6": "E-mobility",
     community_context: The context input of the energy community
     recommendations_dic : ids of the recommended actions
+    weather_provider : WeatherProvider of the weather data, by default the process-wide one. The community centroid
+        is snapped to its grid, so the communities of the same cell share the weather data
+    pvgis_cache : PVGISCache, by default the process-wide one
+    preparation : result of prepare_context_creation for this community, computed if not given (weather_provider and
+        pvgis_cache are then not used)
+    max_workers : number of worker processes that apply the actions to the buildings (apply_actions_to_building).
+        None or 1 applies them serially. The result does not depend on the number of workers
+    executor : concurrent.futures executor to reuse across calls, it takes precedence over max_workers
+    id_temp : id_temp of the new context, its buildings are tied to it (context_id). By default the id of
+        community_context + 1; the contexts created from the same community need different ones
 
     Returns
     -------
@@ -179,138 +346,43 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
     #Esto es solo una prueba, falta: que sea aplicable para varias action keys,y que permita
     #añadir nuevos energy assets
 
+    if preparation is None:
+        preparation = prepare_context_creation(community_context, weather_provider=weather_provider,
+                                               pvgis_cache=pvgis_cache)
+    # the buildings and assets that are modified below are copied on write, community_context is not modified and the
+    # new context shares the unchanged data and hourly arrays with it
+    community_context = copy_on_write_context(community_context)
     # Call the function and get the grouped buildings
     community_context_updated = community_context.copy()
-    group_of_geoms = {}
     community_context_updated["context_parent"]=community_context.get("id")
-    community_context_updated["id_temp"]= community_context_updated["context_parent"]+1
+    if id_temp is None:
+        id_temp = community_context_updated["context_parent"]+1
+    community_context_updated["id_temp"]= id_temp
     if "id" in community_context_updated:
         del(community_context_updated["id"])
     name_of_actions_applied="scenario_"
     if BUILDING_ASSET_CONTEXT in community_context and isinstance(community_context[BUILDING_ASSET_CONTEXT], list):
         new_buildings_asset_contexts=[]
-        temp_id = 1
-        for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
-            # get group of geoms
-            group_of_geoms[building_asset_context["building"]["id"]] = {
-                "geom": building_asset_context["building"]["geom"],
-                "name": building_asset_context["name"]
-            }
-        # get gdf and centroids
-        gdf, community_centroid = get_centroid(group_of_geoms)
-        longitude, latitude = community_centroid.x, community_centroid.y
-        # get pv_profile, wind profile and temperature for the centroid of the community
-        irradiance_dic, pv_profile_kWh_per_kWp, solar_elevation, T2m, wind_potential_kWh_per_kWp, irradiance_dic_with_tmy_data= call_PVGIS(longitude, latitude, tilt_angle=35)
-        # translate actions to new generation systems
-        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
-                                 "actions_to_generation_systems.csv")
-        actions_to_generation_systems = pd.read_csv(file_path)
+        community_centroid = preparation["community_centroid"]
+        pv_profile_kWh_per_kWp = preparation["pv_profile_kWh_per_kWp"]
+        solar_elevation = preparation["solar_elevation"]
+        wind_potential_kWh_per_kWp = preparation["wind_potential_kWh_per_kWp"]
+        actions_to_generation_systems = preparation["actions_to_generation_systems"]
         actions_applied = {}
-        building_energy_assets = []
-        building_id_geom=None
-        old_systems=None
-        for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
-            # Check if GENERATION_SYSTEM_PROFILE_ID is in the building_dic
-            if GENERATION_SYSTEM_PROFILE_ID in building_asset_context:
-                for i, actions in recommendations_dic.items():
-                    #get the action key
-                    if "id" in actions:
-                        action_key = int(actions["id"])
-                        #Action key is demand reduction then:
-                        if action_key ==1:
-                            # print("these actions are not yet populated")
-                            # geojson_object = generate_geojson(front_data=front_data)
-                            # geojson_file = fetch_geojson(geojson_object=geojson_object)
-                            # demand_profile = demand_thermagrid(data=data, front_data=front_data,
-                            #                                    geojson_file=geojson_file)
-                            new_system=False
-                            pass
-                        elif action_key == 2:
-                            # print("these actions are not yet populated")
-                            new_system=False
-                            pass
-                        elif action_key in [4,15,14,16,21]:
-                            # print("this action is populated at community level")
-                            new_system=False
-                            pass
-                        else:
-                            if action_key not in actions_applied:
-                                actions_applied[action_key] = actions["action_name"]
-                            old_systems = building_asset_context[GENERATION_SYSTEM_PROFILE]
-                            # get existing building energy assets
-                            building_energy_asset = building_asset_context["building_energy_asset"]
-                            # get building_id
-                            building_id_geom = building_asset_context["building"]["id"]
-                            # print(f"Processing action_key {action_key} with name {actions["action_name"]}")
-                            # get generation system profile dics
-                            generation_system = building_asset_context[GENERATION_SYSTEM_PROFILE]
-                            # get building footprint
-                            building_geom = float(building_asset_context["building"]["area_conditioned"])
-                            # get connsumption profile
-                            consumption_profile = building_asset_context["building_consumption"]
-                            # get building demand profile
-                            demandprofile = handle_demand_profile(building_asset_context, generation_system,
-                                                                  consumption_profile)
-                            if building_energy_asset is not None:
-                                building_energy_assets = building_energy_asset
-                            else:
-                                building_energy_assets = []
-                            type_of_systems = ["dhw", "cooling", "heating"]
-                            for system in type_of_systems:
-                                # Check if the key ends with '_id' and the value is not None
-                                if old_systems[f"{system}_system_id"] is not None and action_key != 3:
-                                    old_system_id = old_systems[f"{system}_system_id"]
-                                    new_building_energy_asset_dic, updated_building_energy_asset_old_systems = add_new_building_energy_asset_system(
-                                        system_id=old_system_id,
-                                        energy_systems_catalogue=None,
-                                        capacity=max(demandprofile[f"{system}_demand"]),
-                                        building_id=building_id_geom,
-                                        system=system,
-                                        demand=demandprofile[f"{system}_demand"])
-                                    building_energy_assets.append(new_building_energy_asset_dic)
-                            # change building system
-                            (updated_generation_system_profile,
-                             updated_building_energy_asset,
-                             new_system) = update_building_system(goal=goal,
-                                                                  building_id=building_id_geom,
-                                                                  building_geom=building_geom,
-                                                                  demandprofile=demandprofile,
-                                                                  pvprofile=pv_profile_kWh_per_kWp,
-                                                                  buildings_generation_system=generation_system,
-                                                                  building_energy_asset=building_energy_assets,
-                                                                  actions_to_generation_systems=actions_to_generation_systems,
-                                                                  action_key=action_key,
-                                                                  solar_elevation=solar_elevation)
-                          # update building energy assetsupdated_generation_system_profile, building_energy_assets, new_system
-                            building_energy_assets.extend(updated_building_energy_asset)
-                            # update generation_system_profile_dic
-                            building_asset_context[GENERATION_SYSTEM_PROFILE] = updated_generation_system_profile.copy()
-                    else:
-                        print("error encountered with action id")
-                        pass
-                if building_energy_assets:
-                    building_asset_context["building_energy_asset"] = building_energy_assets
-                    if old_systems:
-                        building_asset_context["building_energy_asset"] = remove_duplicates(old_systems,
-                                                                                            building_asset_context[
-                                                                                                "building_energy_asset"])
-                if building_id_geom:
-                    building_asset_context["id_temp"]=building_id_geom
-                # print(temp_id)
-
-                building_asset_context["context_id"]=community_context_updated["id_temp"]
-                # print(action_key)
-                # print(building_asset_context["name"])
-                if building_asset_context["name"] is not None:
-                    building_asset_context["name"]=building_asset_context["name"]+f" with action {action_key}_ "
-                # print(f"  Building id {building_asset_context["id_temp"]} changed its generation system profile"
-                #       f"to {building_asset_context[GENERATION_SYSTEM_PROFILE_ID]}")
-                building_asset_context["building_consumption_id_temp"]=temp_id
-                if new_system:  # Only check if new_system is True
-                    updated_building_dic=update_building_consumption(temp_id,demandprofile,building_asset_context)
-                    building_asset_context["building_consumption"] = updated_building_dic
-                new_buildings_asset_contexts.append(building_asset_context)
-                temp_id+=1
+        # the buildings with a generation system profile are modified, temp_id is their position among them
+        indexes = [idx for idx, building_asset_context in enumerate(community_context[BUILDING_ASSET_CONTEXT])
+                   if GENERATION_SYSTEM_PROFILE_ID in building_asset_context]
+        tasks = [(community_context[BUILDING_ASSET_CONTEXT][idx], temp_id, goal, recommendations_dic,
+                  community_context_updated["id_temp"], pv_profile_kWh_per_kWp, solar_elevation,
+                  actions_to_generation_systems)
+                 for temp_id, idx in enumerate(indexes, start=1)]
+        results = map_tasks(_apply_actions_to_building_task, tasks, max_workers, executor)
+        for idx, (building_asset_context, building_actions_applied) in zip(indexes, results):
+            # a worker process returns a new building asset context, which replaces the one of the context
+            community_context[BUILDING_ASSET_CONTEXT][idx] = building_asset_context
+            new_buildings_asset_contexts.append(building_asset_context)
+            for action_key, action_name in building_actions_applied.items():
+                actions_applied.setdefault(action_key, action_name)
     else:
         print("building_asset_context is not a valid list in bd")
 
@@ -329,20 +401,15 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
         del (building_asset_context["building_consumption_id"])
         del (building_asset_context["id"])
         building_asset_context[GENERATION_SYSTEM_PROFILE_ID] = None
-    existing_community_assets = []
-
+    # community energy assets of the new context: the existing ones, the grid and those of the community actions.
+    # The registry gives them their ids as they are added
+    asset_registry = AssetRegistry()
     for node in community_context.get("node", []):
-        assets = node.get("community_energy_asset_input", [])
-        if assets:
-            existing_community_assets.extend(assets)
-
-    if existing_community_assets:
-        updated_community_energy_asset = existing_community_assets
-    else:
-        updated_community_energy_asset = []
+        for energy_asset in node.get("community_energy_asset_input", None) or []:
+            asset_registry.add_community_asset(energy_asset, unique=False)
 
     community_centroid_string=convert_geometries_to_strings(community_centroid)
-    updated_community_energy_asset.append(create_grid_community_asset(community_centroid_string))
+    asset_registry.add_community_asset(create_grid_community_asset(community_centroid_string), unique=False)
     for i, actions in recommendations_dic.items():
         # get the action key
         action_key = int(actions["id"])
@@ -351,17 +418,14 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
             # Determine the system type based on action_key
             system = "storage" if action_key == 15 else "electricity_system_id"
             new_gen_system_id = get_system_type_for_action(actions_to_generation_systems, action_key, system)
-
-            # updated_community_energy_asset.append(update_community_energy_assets(community_centroid_string, action_key,actions_to_generation_systems,wind_potential_kWh_per_kWp))
             # Add a new asset only if it doesn't already exist
-            if not asset_exists(community_context, new_gen_system_id):
-                updated_community_energy_asset.append(
+            if not asset_registry.has_community_asset(new_gen_system_id):
+                asset_registry.add_community_asset(
                     update_community_energy_assets(
                         community_centroid_string, action_key, actions_to_generation_systems, wind_potential_kWh_per_kWp
                     )
                 )
-
-    updated_community_energy_asset=assign_incremental_ids_to_community_assets(community_energy_asset=updated_community_energy_asset)
+    updated_community_energy_asset = asset_registry.community_assets()
                                    #create new context (id=2) with context_parent=bd.get("id")
     community_context["building_asset_context"]=assign_incremental_ids(new_buildings_asset_contexts)
     #update community assets and nodes (Alberto)
@@ -383,3 +447,39 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
     return community_context_updated
 
 
+def single_action_scenarios(goal, recommendations_dic):
+    """
+    One scenario per recommended action: [(goal, {key: action})] in the order of recommendations_dic, to be
+    used as the scenarios of resbased_generator_contexts_creation.
+    """
+    return [(goal, {key: action}) for key, action in recommendations_dic.items()]
+
+
+def resbased_generator_contexts_creation(community_context, scenarios, weather_provider=None, pvgis_cache=None,
+                                         max_workers=None, executor=None):
+    """
+    Creates the new context of several scenarios of the same community in one call. The centroid, weather and PV
+    data and the action table are prepared once (prepare_context_creation) and shared by all the scenarios. The
+    scenarios are copies on write of community_context (copy_on_write_context), which is not modified.
+
+    Parameters
+    ----------
+    community_context: The context input of the energy community
+    scenarios : list of (goal, recommendations_dic), e.g. single_action_scenarios(goal, recommendations_dic)
+    weather_provider : WeatherProvider of the weather data, by default the process-wide one
+    pvgis_cache : PVGISCache, by default the process-wide one
+    max_workers : number of worker processes that apply the actions to the buildings of each scenario
+    executor : concurrent.futures executor to reuse across the scenarios, it takes precedence over max_workers
+
+    Returns
+    -------
+    new_contexts : list with the new context of each scenario, in the order of scenarios. Each one gets its own
+        id_temp: the id of community_context + 1 + the position of its scenario
+    """
+    preparation = prepare_context_creation(community_context, weather_provider=weather_provider,
+                                           pvgis_cache=pvgis_cache)
+    first_id_temp = community_context.get("id") + 1
+    return [resbased_generator_context_creation(goal, community_context, recommendations_dic,
+                                                preparation=preparation, max_workers=max_workers, executor=executor,
+                                                id_temp=first_id_temp + position)
+            for position, (goal, recommendations_dic) in enumerate(scenarios)]
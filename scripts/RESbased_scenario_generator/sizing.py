@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies:
+    python 3.12
+    numpy                     1.26.4
+License: GNU GPLv3
+The GNU General Public License is a free, copyleft license for software and other kinds of works.
+https://www.gnu.org/licenses/gpl-3.0.html
+You may copy, distribute and modify the software as long as you track changes/dates in source files.
+ Any modifications to or software including (via compiler) GPL-licensed code must also be made
+ available under the GPL along with build & install instructions.
+ This means, you must:
+     - Include original
+     - State Changes
+     - Disclose source
+     - Include the same license -- to make sure it remains free software for all its users.
+     - Include copyright
+     - Include install instructions
+
+You cannot: sublicense or hold liable.
+
+Copyright @CARTIF 2024
+
+***********************************************************************************************
+
+This part of the code sizes the capacity (kW) of the building systems from their hourly demand, for many systems at
+once with numpy. The load duration curve (sorted demand) is only computed when a rule or a caller needs it
+
+***********************************************************************************************
+
+"""
+import numpy as np
+
+# Sizing rules, the level of each rule is a fraction between 0 and 1
+# capacity = level x peak demand
+PEAK_FRACTION = "peak_fraction"
+# capacity that covers the demand of a share (level) of the hours, i.e. the level quantile of the hourly demand
+PERCENTILE = "percentile"
+# capacity of a base load system that supplies a share (level) of the yearly demand
+ENERGY_SHARE = "energy_share"
+SIZING_RULES = (PEAK_FRACTION, PERCENTILE, ENERGY_SHARE)
+
+# Rule and level used to size each kind of building system (see handle_dhw_system, handle_heating_system and
+# handle_cooling_system in context_creation.py)
+SYSTEM_SIZING = {
+    "dhw": (PEAK_FRACTION, 0.7),
+    "heating": (PEAK_FRACTION, 0.7),
+    "cooling": (PEAK_FRACTION, 0.9),
+}
+
+
+def size_capacities(demands, rule=PEAK_FRACTION, levels=(0.7, 0.9)):
+    """
+    Capacities of one or many systems for several levels of a sizing rule, in one call.
+    :param demands: hourly demand of one system (1-D) or of many systems with the same number of hours
+    (systems x hours)
+    :param rule: PEAK_FRACTION, PERCENTILE or ENERGY_SHARE
+    :param levels: levels of the rule, fractions between 0 and 1
+    :return: array of capacities, levels (1-D demand) or systems x levels
+    """
+    matrix = np.asarray(demands, dtype=float)
+    single = matrix.ndim == 1
+    matrix = np.atleast_2d(matrix)
+    levels = np.asarray(levels, dtype=float)
+    if matrix.shape[1] == 0:
+        raise ValueError("The demand has no values to size a system.")
+    if rule == PEAK_FRACTION:
+        capacities = matrix.max(axis=1)[:, None] * levels
+    elif rule == PERCENTILE:
+        # np.quantile partitions the hours instead of sorting them
+        capacities = np.quantile(matrix, levels, axis=1).T
+    elif rule == ENERGY_SHARE:
+        capacities = energy_share_capacities(matrix, levels)
+    else:
+        raise ValueError(f"Unknown sizing rule {rule}, use one of {SIZING_RULES}")
+    return capacities[0] if single else capacities
+
+
+def energy_share_capacities(matrix, levels):
+    """
+    Smallest capacity C of each system such that sum(min(demand, C)) reaches level x sum(demand).
+    :param matrix: demand, systems x hours
+    :return: array systems x levels
+    """
+    hours = matrix.shape[1]
+    curves = -np.sort(-matrix, axis=1)
+    # energy supplied with a capacity equal to the k-th highest demand: k x curve[k] + demand below it
+    tails = np.concatenate((np.cumsum(curves[:, ::-1], axis=1)[:, ::-1], np.zeros((len(matrix), 1))), axis=1)
+    ranks = np.arange(hours)
+    supplied = ranks * curves + tails[:, :-1]
+    targets = tails[:, :1] * levels
+    capacities = np.empty((len(matrix), len(levels)))
+    for j in range(len(levels)):
+        # supplied decreases with k, the capacity is in the segment below the last curve value that reaches the target
+        k = np.maximum((supplied >= targets[:, j:j + 1]).sum(axis=1) - 1, 0)
+        rows = np.arange(len(matrix))
+        capacities[:, j] = (targets[:, j] - tails[rows, k + 1]) / (k + 1)
+    return capacities
+
+
+def system_capacity(demand, system, sizing=None):
+    """
+    Capacity (kW) of a building system from its hourly demand, with the rule and level of SYSTEM_SIZING.
+    :param system: kind of system, dhw, heating or cooling
+    :param sizing: dictionary system: (rule, level) replacing SYSTEM_SIZING
+    """
+    rule, level = (SYSTEM_SIZING if sizing is None else sizing)[system]
+    return float(size_capacities(demand, rule, (level,))[0])
+
+
+def load_duration_curve(demand):
+    """Load duration curve of an hourly demand: the demand sorted in descending order, as an array."""
+    return -np.sort(-np.asarray(demand, dtype=float))
+
+
+def signature_demand(outdoor_temperatures, demand, mode):
+    """
+    Hourly demand of the hours that need heating (mode 0, outdoor temperature below 18 C) or cooling (otherwise,
+    above 26 C), selected with a mask.
+    """
+    outdoor_temperatures = np.asarray(outdoor_temperatures, dtype=float)
+    demand = np.asarray(demand, dtype=float)[:len(outdoor_temperatures)]
+    mask = outdoor_temperatures < 18 if mode == 0 else outdoor_temperatures > 26
+    return demand[mask[:len(demand)]]
@@ -0,0 +1,791 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies:
+    python 3.12
+    numpy                     1.26.4
+    pandas                     2.2.2
+    pvlib                     0.10.4
+License: GNU GPLv3
+The GNU General Public License is a free, copyleft license for software and other kinds of works.
+https://www.gnu.org/licenses/gpl-3.0.html
+You may copy, distribute and modify the software as long as you track changes/dates in source files.
+ Any modifications to or software including (via compiler) GPL-licensed code must also be made
+ available under the GPL along with build & install instructions.
+ This means, you must:
+     - Include original
+     - State Changes
+     - Disclose source
+     - Include the same license -- to make sure it remains free software for all its users.
+     - Include copyright
+     - Include install instructions
+
+You cannot: sublicense or hold liable.
+
+Copyright @CARTIF 2024
+
+***********************************************************************************************
+
+This part of the code provides the weather data of a location (PVGIS, local TMY/EPW files or recorded data),
+runs the requests to the external services concurrently and keeps the weather and PV data in a local cache, so the
+contexts of the same community are generated without calling PVGIS again
+
+***********************************************************************************************
+
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+import requests
+from pvlib.iotools import get_pvgis_hourly, get_pvgis_tmy, read_epw, read_pvgis_tmy
+from pvlib.irradiance import get_total_irradiance
+from pvlib.location import Location
+from pvlib.temperature import faiman
+from scripts.RESbased_scenario_generator.classes_database import ProcessWideInstance
+
+PVGIS_API_VERSION = "v5_3"
+PVGIS_URL = f"https://re.jrc.ec.europa.eu/api/{PVGIS_API_VERSION}/"
+PVGIS_SOURCE = f"pvgis|{PVGIS_API_VERSION}"
+# Resolution (degrees) of the PVGIS radiation databases (PVGIS-SARAH3, about 5 km); the locations are snapped to the
+# centre of their cell, so the communities of the same cell share one download
+PVGIS_GRID_RESOLUTION = 0.05
+# Decimals of the coordinates in the cache key (0.001 degrees is about 100 m) and of the tilt angle
+CACHE_COORDINATE_DECIMALS = 3
+CACHE_TILT_DECIMALS = 1
+# Environment variables to change the cache folder and to run without network (only cached locations)
+WEATHER_CACHE_DIR_ENV = "LOCALRES_WEATHER_CACHE_DIR"
+WEATHER_OFFLINE_ENV = "LOCALRES_WEATHER_OFFLINE"
+# Environment variable with a local TMY/EPW file (or several, separated by os.pathsep) to use instead of PVGIS
+WEATHER_FILE_ENV = "LOCALRES_WEATHER_FILE"
+DEFAULT_WEATHER_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "localres", "weather")
+
+# Keys of the irradiance dictionary returned by call_PVGIS
+ORIENTATIONS = {
+    "rad_n": 0,
+    "rad_s": 180,
+    "rad_e": 90,
+    "rad_o": 270,
+}
+TMY_IRRADIANCE = ["Gb(n)", "G(h)", "Gd(h)"]
+# Columns of the EPW files renamed to the PVGIS TMY names
+EPW_TO_PVGIS_COLUMNS = {
+    "temp_air": "T2m",
+    "relative_humidity": "RH",
+    "ghi": "G(h)",
+    "dni": "Gb(n)",
+    "dhi": "Gd(h)",
+    "ghi_infrared": "IR(h)",
+    "wind_speed": "WS10m",
+    "wind_direction": "WD10m",
+    "atmospheric_pressure": "SP",
+}
+# Concurrent requests to the external services, retries of the failed ones and exponential backoff between them
+FETCH_MAX_WORKERS = 4
+FETCH_RETRIES = 3
+FETCH_BACKOFF_SECONDS = 1.0
+FETCH_MAX_BACKOFF_SECONDS = 30.0
+# HTTP status codes retried (too many requests and server errors); other errors (e.g. a location over the sea)
+# are raised at once
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# pvlib raises the JSON error messages of PVGIS as requests.HTTPError without the response, so their status code is
+# lost. Those messages are retried when they name a RETRY_STATUS_CODES or look like an overloaded service; the rest
+# (e.g. "Location over the sea") are raised at once
+RETRY_MESSAGE_PATTERN = re.compile(
+    r"\b(?:%s)\b|too many requests|rate limit|unavailable|overloaded|try again|timed? ?out" %
+    "|".join(str(code) for code in RETRY_STATUS_CODES), re.IGNORECASE)
+# Albedo of the ground in the plane of array irradiance (default of pvlib.irradiance.get_total_irradiance)
+DEFAULT_ALBEDO = 0.25
+# Year of the hourly PV profile (the midday solar elevation of call_PVGIS is filtered on 2023-12-12)
+PV_PROFILE_YEAR = 2023
+# Temperature coefficient of the power of crystalline silicon modules (1/ºC), for the profiles computed locally
+CRYST_SI_GAMMA_PDC = -0.004
+
+
+class WeatherCacheMiss(LookupError):
+    """Raised in offline mode when a location is not in the weather cache."""
+
+
+class ConcurrentFetcher:
+    def __init__(self, max_workers=FETCH_MAX_WORKERS, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF_SECONDS,
+                 max_backoff=FETCH_MAX_BACKOFF_SECONDS, max_metrics=1000):
+        """
+        Runs independent requests to the external services (PVGIS, ThermaGrid...) at the same time, with at most
+        max_workers requests in flight, retrying connection errors, timeouts and RETRY_STATUS_CODES with exponential
+        backoff. The time and attempts of each request are kept in metrics.
+        :param max_workers: requests in flight at the same time
+        :param retries: retries of a failed request (0 to never retry)
+        :param backoff: seconds before the first retry, doubled at each retry up to max_backoff
+        :param max_metrics: number of requests kept in metrics (the oldest are dropped)
+        """
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # dicts with name, seconds (including the retries), attempts and ok
+        self.metrics = deque(maxlen=max_metrics)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._worker = threading.local()
+
+    @staticmethod
+    def is_retryable(error):
+        """
+        True for errors that may succeed later: connection errors, timeouts and RETRY_STATUS_CODES. HTTP errors
+        without a response (the JSON messages of PVGIS raised by pvlib) are classified by their message
+        (RETRY_MESSAGE_PATTERN).
+        """
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(error, requests.HTTPError):
+            if error.response is None:
+                return RETRY_MESSAGE_PATTERN.search(str(error)) is not None
+            return error.response.status_code in RETRY_STATUS_CODES
+        return False
+
+    def call(self, name, function, *args, **kwargs):
+        """Calls function(*args, **kwargs) in this thread, with the retries, and records its metrics."""
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = function(*args, **kwargs)
+            except Exception as error:
+                if attempt > self.retries or not self.is_retryable(error):
+                    self.metrics.append({"name": name, "seconds": time.perf_counter() - start,
+                                         "attempts": attempt, "ok": False})
+                    raise
+                delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+                # jitter, so parallel requests that failed together do not retry together
+                time.sleep(delay * random.uniform(0.5, 1.0))
+            else:
+                self.metrics.append({"name": name, "seconds": time.perf_counter() - start,
+                                     "attempts": attempt, "ok": True})
+                return result
+
+    def fetch_all(self, calls):
+        """
+        Runs the calls at the same time and waits for all of them.
+        :param calls: dict name -> callable without arguments (e.g. functools.partial)
+        :return: dict name -> result; if some call fails, its error is raised once all the calls are done
+        """
+        if len(calls) <= 1 or getattr(self._worker, "active", False):
+            # a single call, or calls made from a request already running in the pool (waiting for the pool from
+            # inside it could exhaust the workers), run in this thread
+            return {name: self.call(name, function) for name, function in calls.items()}
+        futures = {name: self._get_executor().submit(self._call_in_worker, name, function)
+                   for name, function in calls.items()}
+        results = {}
+        first_error = None
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as error:
+                if first_error is None:
+                    first_error = error
+        if first_error is not None:
+            raise first_error
+        return results
+
+    def summary(self):
+        """
+        Number of requests, failed requests, retries and mean and maximum seconds of each kind of request (the
+        names are "kind|details", e.g. "tmy|41.650|-4.720").
+        """
+        summary = {}
+        for metric in list(self.metrics):
+            stats = summary.setdefault(metric["name"].split("|")[0], {"requests": 0, "failed": 0, "retries": 0,
+                                                        "mean_seconds": 0.0, "max_seconds": 0.0})
+            stats["requests"] += 1
+            stats["failed"] += not metric["ok"]
+            stats["retries"] += metric["attempts"] - 1
+            stats["mean_seconds"] += metric["seconds"]
+            stats["max_seconds"] = max(stats["max_seconds"], metric["seconds"])
+        for stats in summary.values():
+            stats["mean_seconds"] /= stats["requests"]
+        return summary
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _call_in_worker(self, name, function):
+        self._worker.active = True
+        try:
+            return self.call(name, function)
+        finally:
+            self._worker.active = False
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="weather_fetch")
+            return self._executor
+
+
+def post_json(url, payload, headers=None, timeout=None):
+    """POST request of a JSON payload (e.g. the ThermaGrid inputs), returning the JSON response."""
+    response = requests.post(url, data=json.dumps(payload), headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+class PVGISCache:
+    def __init__(self, cache_dir=None, offline=None, memory_entries=64):
+        """
+        Content-addressed cache of the PVGIS data of a location. Each entry is a compressed npz file named after
+        the hash of the rounded (latitude, longitude, tilt angle, PVGIS API version) and holds the derived arrays
+        (PV profile, temperatures, wind, irradiances and midday solar elevation). The last entries used are also kept
+        in memory as read-only arrays, shared by all the contexts of the same location.
+        :param cache_dir: folder of the cache, by default LOCALRES_WEATHER_CACHE_DIR or ~/.cache/localres/weather
+        :param offline: if True a location that is not cached raises WeatherCacheMiss instead of calling PVGIS,
+        by default LOCALRES_WEATHER_OFFLINE
+        :param memory_entries: entries kept in memory (0 to always read the files)
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get(WEATHER_CACHE_DIR_ENV, DEFAULT_WEATHER_CACHE_DIR)
+        if offline is None:
+            offline = os.environ.get(WEATHER_OFFLINE_ENV, "").lower() in ("1", "true", "yes")
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # one lock per key being fetched, so concurrent contexts of the same location wait for a single fetch
+        self._fetch_locks = {}
+
+    @staticmethod
+    def key(latitude, longitude, tilt_angle, source=PVGIS_SOURCE):
+        """
+        Returns the cache key of a location: hash of the rounded coordinates, tilt angle (None for the data that
+        does not depend on it) and weather source (WeatherProvider.source, e.g. the PVGIS API version).
+        """
+        if tilt_angle is None:
+            tilt = "location"
+        else:
+            tilt = f"{round(float(tilt_angle), CACHE_TILT_DECIMALS):.{CACHE_TILT_DECIMALS}f}"
+        request = f"{source}|{location_request(latitude, longitude)}|{tilt}"
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        """Returns the dictionary of arrays stored with the key, or None if it is not cached."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        try:
+            with np.load(self.path(key), allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            # missing or unreadable (e.g. partially written by an old version) entries are fetched again
+            return None
+        return self._remember(key, arrays)
+
+    def save(self, key, arrays):
+        """Stores the dictionary of arrays. The file is written aside and renamed, so readers never see it half done."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temporary_path, self.path(key))
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return self._remember(key, arrays)
+
+    def get_or_fetch(self, latitude, longitude, tilt_angle, fetch, source=PVGIS_SOURCE):
+        """
+        Returns the cached arrays of the location, calling fetch(latitude, longitude, tilt_angle) and caching its
+        result when they are not cached.
+        """
+        key = self.key(latitude, longitude, tilt_angle, source)
+        arrays = self.load(key)
+        if arrays is not None:
+            return arrays
+        if self.offline:
+            raise WeatherCacheMiss(f"Weather data of latitude {latitude}, longitude {longitude} and tilt angle "
+                                   f"{tilt_angle} is not in the weather cache {self.cache_dir} (offline mode)")
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:
+            # another thread may have fetched it while waiting
+            arrays = self.load(key)
+            if arrays is None:
+                arrays = self.save(key, fetch(latitude, longitude, tilt_angle))
+        with self._lock:
+            self._fetch_locks.pop(key, None)
+        return arrays
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key, arrays):
+        """Keeps the arrays in memory as read-only arrays and returns them."""
+        for array in arrays.values():
+            array.flags.writeable = False
+        if self.memory_entries:
+            with self._lock:
+                self._memory[key] = arrays
+                self._memory.move_to_end(key)
+                while len(self._memory) > self.memory_entries:
+                    self._memory.popitem(last=False)
+        return arrays
+
+
+def snap_to_grid(latitude, longitude, grid_resolution):
+    """Centre of the grid cell (of grid_resolution degrees) of a location, or the location if grid_resolution is None."""
+    if not grid_resolution:
+        return latitude, longitude
+    return (round(float((np.floor(latitude / grid_resolution) + 0.5) * grid_resolution), 6),
+            round(float((np.floor(longitude / grid_resolution) + 0.5) * grid_resolution), 6))
+
+
+def location_request(latitude, longitude):
+    """Rounded coordinates of a location, as used in the cache keys."""
+    return (f"{round(float(latitude), CACHE_COORDINATE_DECIMALS):.{CACHE_COORDINATE_DECIMALS}f}"
+            f"|{round(float(longitude), CACHE_COORDINATE_DECIMALS):.{CACHE_COORDINATE_DECIMALS}f}")
+
+
+# Process-wide fetcher, created on the first call to get_fetcher
+_fetcher = ProcessWideInstance(ConcurrentFetcher)
+
+
+def get_fetcher():
+    """Returns the process-wide ConcurrentFetcher, shared so the concurrency to the services is bounded."""
+    return _fetcher.get()
+
+
+def set_fetcher(fetcher):
+    """Replaces the process-wide ConcurrentFetcher, e.g. to change the concurrency or the retries."""
+    return _fetcher.set(fetcher)
+
+
+# Process-wide cache, created on the first call to get_pvgis_cache
+_pvgis_cache = ProcessWideInstance(PVGISCache)
+
+
+def get_pvgis_cache():
+    """Returns the process-wide PVGISCache, configured with the environment variables."""
+    return _pvgis_cache.get()
+
+
+def set_pvgis_cache(cache):
+    """Replaces the process-wide PVGISCache, e.g. to use another folder or the offline mode."""
+    return _pvgis_cache.set(cache)
+
+
+def solar_elevation_to_arrays(solar_elevation_midday_values):
+    """Arrays of the midday solar elevation dataframe (index, time and solar_elevation) to store them in the cache."""
+    times = solar_elevation_midday_values["time"]
+    utc = times.dt.tz is not None
+    if utc:
+        times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+    return {
+        "solar_elevation_index": solar_elevation_midday_values.index.to_numpy(dtype=np.int64),
+        "solar_elevation_time": times.to_numpy(),
+        "solar_elevation_utc": np.array(utc),
+        "solar_elevation": solar_elevation_midday_values["solar_elevation"].to_numpy(dtype=float),
+    }
+
+
+def solar_elevation_from_arrays(arrays):
+    """Midday solar elevation dataframe, as returned by call_PVGIS, from the cached arrays."""
+    times = pd.to_datetime(arrays["solar_elevation_time"])
+    if bool(arrays["solar_elevation_utc"]):
+        times = times.tz_localize("UTC")
+    return pd.DataFrame({"time": times, "solar_elevation": arrays["solar_elevation"]},
+                        index=arrays["solar_elevation_index"])
+
+
+class WeatherProvider:
+    """
+    Source of the weather data of a location. The TMY data uses the PVGIS column names (T2m, WS10m, G(h), Gb(n),
+    Gd(h)...) and the hourly PV data the columns P (W per kWp) and solar_elevation (degrees) of pvlib, so the
+    pipeline does not depend on where the data comes from.
+    """
+    # Identifies the data in the PVGIS cache keys, so data of different sources is never mixed
+    source = "weather"
+    # Resolution (degrees) of the native grid of the data, None if the data is not gridded
+    grid_resolution = None
+
+    def snap(self, latitude, longitude):
+        """Location whose data is used for (latitude, longitude): the centre of its grid cell. All the locations
+        of a cell get the same data, so they share one fetch and one entry of the PVGIS cache."""
+        return snap_to_grid(latitude, longitude, self.grid_resolution)
+
+    def get_tmy(self, latitude, longitude):
+        """Returns (tmy_data, inputs): the hourly TMY dataframe and a dict with inputs['location'] (latitude,
+        longitude and elevation of the data)."""
+        raise NotImplementedError
+
+    def get_pv_hourly(self, latitude, longitude, tilt_angle):
+        """Returns the hourly dataframe (index time) of a free-standing 1 kWp crystalline silicon system facing south
+        with the tilt angle, with the columns P and solar_elevation."""
+        raise NotImplementedError
+
+    def prefetch(self, locations, tilt_angle=None):
+        """
+        Gets the data of many locations at once.
+        :param locations: iterable of (latitude, longitude); the locations are snapped to their grid cell and each
+        cell is fetched once
+        :param tilt_angle: if given, the hourly PV data is fetched as well
+        :return: dict snapped (latitude, longitude) -> (tmy_data, inputs) or, with tilt_angle,
+        (tmy_data, inputs, pv_data)
+        """
+        calls = {}
+        unique_locations = {}
+        for latitude, longitude in locations:
+            latitude, longitude = self.snap(latitude, longitude)
+            request = location_request(latitude, longitude)
+            if request in unique_locations:
+                continue
+            unique_locations[request] = latitude, longitude
+            calls[f"tmy|{request}"] = partial(self.get_tmy, latitude, longitude)
+            if tilt_angle is not None:
+                calls[f"pv_hourly|{request}"] = partial(self.get_pv_hourly, latitude, longitude, tilt_angle)
+        # all the requests run concurrently, bounded by the process-wide fetcher
+        results = get_fetcher().fetch_all(calls)
+        fetched = {}
+        for request, location in unique_locations.items():
+            if tilt_angle is None:
+                fetched[location] = results[f"tmy|{request}"]
+            else:
+                fetched[location] = results[f"tmy|{request}"] + (results[f"pv_hourly|{request}"],)
+        return fetched
+
+
+class PVGISWeatherProvider(WeatherProvider):
+    def __init__(self, api_version=PVGIS_API_VERSION, timeout=30, grid_resolution=PVGIS_GRID_RESOLUTION):
+        """
+        Weather data of the PVGIS API (called with pvlib).
+        :param api_version: version of the PVGIS API, e.g. "v5_3"
+        :param timeout: seconds to wait for each PVGIS response
+        :param grid_resolution: cell size (degrees) the locations are snapped to, None to use the exact locations
+        """
+        self.api_version = api_version
+        self.grid_resolution = grid_resolution
+        self.url = f"https://re.jrc.ec.europa.eu/api/{api_version}/"
+        self.timeout = timeout
+        self.source = f"pvgis|{api_version}"
+
+    def get_tmy(self, latitude, longitude):
+        result = get_pvgis_tmy(latitude, longitude, map_variables=False, url=self.url, timeout=self.timeout)
+        if len(result) == 4:
+            tmy_data, months_selected, inputs, meta = result
+        else:
+            # pvlib >= 0.13 returns (data, meta) with the inputs inside the metadata
+            tmy_data, meta = result
+            inputs = meta["inputs"]
+        # Ensure 'tmy_data' index is in datetime format
+        tmy_data.index = pd.to_datetime(tmy_data.index)
+        return tmy_data, inputs
+
+    def get_pv_hourly(self, latitude, longitude, tilt_angle):
+        pv_data = get_pvgis_hourly(latitude, longitude, start=PV_PROFILE_YEAR, end=PV_PROFILE_YEAR, components=True,
+                                   surface_tilt=tilt_angle, surface_azimuth=180,
+                                   outputformat='json',
+                                   usehorizon=True, pvcalculation=True,
+                                   peakpower=1, pvtechchoice='crystSi',
+                                   mountingplace='free', loss=0, trackingtype=0,
+                                   optimal_surface_tilt=False, optimalangles=False,
+                                   url=self.url, map_variables=True, timeout=self.timeout)
+        return pv_data[0]
+
+
+class FileWeatherProvider(WeatherProvider):
+    def __init__(self, paths):
+        """
+        Weather data of local TMY files: EPW files or TMY files downloaded from PVGIS (csv, json or epw). Each
+        location uses the file of the nearest site, so one file serves a whole community. The hourly PV data is
+        computed from the TMY data (plane of array irradiance, Faiman cell temperature and PVWatts model, without
+        losses).
+        :param paths: path of a file or list of paths
+        """
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        self.paths = [os.fspath(path) for path in paths]
+        if not self.paths:
+            raise ValueError("FileWeatherProvider needs at least one weather file")
+        self._files = [self._read(path) for path in self.paths]
+        digest = hashlib.sha256()
+        for path in self.paths:
+            with open(path, "rb") as file:
+                digest.update(file.read())
+        self.source = f"file|{digest.hexdigest()}"
+
+    @staticmethod
+    def _read(path):
+        """Reads a weather file and returns (tmy_data, inputs) with the PVGIS column names."""
+        if path.lower().endswith(".epw"):
+            tmy_data, meta = read_epw(path)
+            tmy_data = tmy_data.rename(columns=EPW_TO_PVGIS_COLUMNS)
+            location = {"latitude": meta["latitude"], "longitude": meta["longitude"], "elevation": meta["altitude"]}
+        else:
+            result = read_pvgis_tmy(path, map_variables=False)
+            if len(result) == 4:
+                tmy_data, months_selected, inputs, meta = result
+            else:
+                tmy_data, meta = result
+                inputs = meta["inputs"]
+            location = inputs["location"]
+        tmy_data.index = pd.to_datetime(tmy_data.index)
+        if tmy_data.index.tz is not None:
+            tmy_data.index = tmy_data.index.tz_convert("UTC")
+        return tmy_data, {"location": location}
+
+    def _nearest(self, latitude, longitude):
+        distances = [(inputs["location"]["latitude"] - latitude) ** 2 + (inputs["location"]["longitude"] - longitude) ** 2
+                     for _, inputs in self._files]
+        return self._files[int(np.argmin(distances))]
+
+    def snap(self, latitude, longitude):
+        """The data of a location is the data of the nearest file, so the locations are snapped to its site."""
+        location = self._nearest(latitude, longitude)[1]["location"]
+        return location["latitude"], location["longitude"]
+
+    def get_tmy(self, latitude, longitude):
+        tmy_data, inputs = self._nearest(latitude, longitude)
+        return tmy_data.copy(), {"location": dict(inputs["location"])}
+
+    def get_pv_hourly(self, latitude, longitude, tilt_angle):
+        tmy_data, inputs = self._nearest(latitude, longitude)
+        location = inputs["location"]
+        site = Location(location["latitude"], location["longitude"], altitude=location["elevation"])
+        solar_position = site.get_solarposition(times=tmy_data.index)
+        irradiance = get_total_irradiance(
+            surface_tilt=tilt_angle,
+            surface_azimuth=180,
+            solar_zenith=solar_position['apparent_zenith'],
+            solar_azimuth=solar_position['azimuth'],
+            dni=tmy_data['Gb(n)'],
+            ghi=tmy_data['G(h)'],
+            dhi=tmy_data['Gd(h)'],
+        )
+        poa_global = irradiance['poa_global'].fillna(0).clip(lower=0)
+        cell_temperature = faiman(poa_global, tmy_data['T2m'], tmy_data['WS10m'])
+        # PVWatts DC model of 1 kWp (1000 W at 1000 W/m2)
+        power = poa_global * (1 + CRYST_SI_GAMMA_PDC * (cell_temperature - 25))
+        # The TMY months come from different years, the profile is placed in PV_PROFILE_YEAR
+        times = pd.DatetimeIndex([time.replace(year=PV_PROFILE_YEAR) for time in tmy_data.index], name="time")
+        pv_data = pd.DataFrame({"P": power.to_numpy(dtype=float),
+                                "solar_elevation": solar_position['elevation'].to_numpy(dtype=float)}, index=times)
+        return pv_data.sort_index()
+
+
+class ReplayWeatherProvider(WeatherProvider):
+    def __init__(self, record_dir, provider=None):
+        """
+        Replays weather data recorded in a folder, e.g. to run the tests or the same studies without network.
+        :param record_dir: folder of the recorded data
+        :param provider: if given, the locations that are not recorded are fetched from it and recorded; if None, a
+        location that is not recorded raises WeatherCacheMiss
+        """
+        self.record_dir = record_dir
+        self.provider = provider
+        self._records = PVGISCache(record_dir)
+        # The replayed data keeps the source and grid of the recorded provider, so it shares its PVGIS cache entries
+        description_path = os.path.join(record_dir, "provider.json")
+        if provider is not None:
+            self.source = provider.source
+            self.grid_resolution = provider.grid_resolution
+            os.makedirs(record_dir, exist_ok=True)
+            with open(description_path, "w") as file:
+                json.dump({"source": self.source, "grid_resolution": self.grid_resolution}, file)
+        elif os.path.exists(description_path):
+            with open(description_path) as file:
+                description = json.load(file)
+            self.source = description["source"]
+            self.grid_resolution = description["grid_resolution"]
+        else:
+            self.source = f"replay|{os.path.abspath(record_dir)}"
+
+    def snap(self, latitude, longitude):
+        if self.provider is not None:
+            return self.provider.snap(latitude, longitude)
+        return snap_to_grid(latitude, longitude, self.grid_resolution)
+
+    def get_tmy(self, latitude, longitude):
+        key = hashlib.sha256(f"tmy|{location_request(latitude, longitude)}".encode()).hexdigest()
+        arrays = self._replay(key, latitude, longitude, lambda: frame_to_arrays(*self.provider.get_tmy(latitude, longitude)))
+        return frame_from_arrays(arrays)
+
+    def get_pv_hourly(self, latitude, longitude, tilt_angle):
+        key = PVGISCache.key(latitude, longitude, tilt_angle, "pv")
+        arrays = self._replay(key, latitude, longitude,
+                              lambda: frame_to_arrays(self.provider.get_pv_hourly(latitude, longitude, tilt_angle)))
+        return frame_from_arrays(arrays)[0]
+
+    def _replay(self, key, latitude, longitude, record):
+        arrays = self._records.load(key)
+        if arrays is not None:
+            return arrays
+        if self.provider is None:
+            raise WeatherCacheMiss(f"Weather data of latitude {latitude} and longitude {longitude} is not recorded "
+                                   f"in {self.record_dir}")
+        arrays = record()
+        self._records.save(key, arrays)
+        return arrays
+
+
+def frame_to_arrays(frame, inputs=None):
+    """Arrays of a weather dataframe (numeric columns and datetime index) and its inputs, to record them."""
+    frame = frame.select_dtypes("number")
+    index = frame.index
+    utc = index.tz is not None
+    if utc:
+        index = index.tz_convert("UTC").tz_localize(None)
+    arrays = {
+        "index": index.to_numpy(),
+        "index_name": np.array(index.name or ""),
+        "utc": np.array(utc),
+        "columns": np.array(list(frame.columns), dtype=str),
+        "inputs": np.array(json.dumps(inputs if inputs is not None else {})),
+    }
+    for position, column in enumerate(frame.columns):
+        arrays[f"column_{position}"] = frame[column].to_numpy(dtype=float)
+    return arrays
+
+
+def frame_from_arrays(arrays):
+    """Weather dataframe and inputs (frame, inputs) from the recorded arrays."""
+    index = pd.DatetimeIndex(arrays["index"], name=str(arrays["index_name"]) or None)
+    if bool(arrays["utc"]):
+        index = index.tz_localize("UTC")
+    frame = pd.DataFrame({column: arrays[f"column_{position}"] for position, column in enumerate(arrays["columns"])},
+                         index=index)
+    return frame, json.loads(str(arrays["inputs"]))
+
+
+def default_weather_provider():
+    """FileWeatherProvider of the LOCALRES_WEATHER_FILE files if the variable is set, otherwise PVGIS."""
+    weather_files = os.environ.get(WEATHER_FILE_ENV)
+    if weather_files:
+        return FileWeatherProvider(weather_files.split(os.pathsep))
+    return PVGISWeatherProvider()
+
+
+# Process-wide weather provider, created on the first call to get_weather_provider
+_weather_provider = ProcessWideInstance(default_weather_provider)
+
+
+def get_weather_provider():
+    """
+    Returns the process-wide WeatherProvider: a FileWeatherProvider of the LOCALRES_WEATHER_FILE files if the
+    variable is set, otherwise PVGIS.
+    """
+    return _weather_provider.get()
+
+
+def set_weather_provider(provider):
+    """Replaces the process-wide WeatherProvider."""
+    return _weather_provider.set(provider)
+
+
+def poa_irradiance(surfaces, solar_zenith, solar_azimuth, dni, ghi, dhi, albedo=DEFAULT_ALBEDO):
+    """
+    Global irradiance on the plane of array of many surfaces in one pass, with the isotropic sky model of
+    pvlib.irradiance.get_total_irradiance (its default model): beam on the surface, isotropic sky diffuse and ground
+    reflected irradiance. The terms of the sun are computed once for all the surfaces.
+    :param surfaces: sequence of (tilt, azimuth) in degrees
+    :param solar_zenith: hourly apparent solar zenith (degrees)
+    :param solar_azimuth: hourly solar azimuth (degrees)
+    :param dni: hourly direct normal irradiance (W/m2), e.g. Gb(n)
+    :param ghi: hourly global horizontal irradiance (W/m2), e.g. G(h)
+    :param dhi: hourly diffuse horizontal irradiance (W/m2), e.g. Gd(h)
+    :param albedo: albedo of the ground
+    :return: array surfaces x hours (W/m2)
+    """
+    surfaces = np.asarray(surfaces, dtype=float).reshape(-1, 2)
+    surface_tilt = np.radians(surfaces[:, 0])[:, np.newaxis]
+    surface_azimuth = np.radians(surfaces[:, 1])[:, np.newaxis]
+    solar_zenith = np.radians(np.asarray(solar_zenith, dtype=float))
+    solar_azimuth = np.radians(np.asarray(solar_azimuth, dtype=float))
+    dni = np.asarray(dni, dtype=float)
+    ghi = np.asarray(ghi, dtype=float)
+    dhi = np.asarray(dhi, dtype=float)
+    cos_tilt = np.cos(surface_tilt)
+    sin_tilt = np.sin(surface_tilt)
+    # cos(solar_azimuth - surface_azimuth) = cos(solar) cos(surface) + sin(solar) sin(surface)
+    sin_zenith = np.sin(solar_zenith)
+    projection = (cos_tilt * np.cos(solar_zenith)
+                  + sin_tilt * (sin_zenith * np.cos(solar_azimuth)) * np.cos(surface_azimuth)
+                  + sin_tilt * (sin_zenith * np.sin(solar_azimuth)) * np.sin(surface_azimuth))
+    np.clip(projection, -1, 1, out=projection)
+    poa_direct = np.maximum(dni * projection, 0)
+    poa_sky_diffuse = dhi * (1 + cos_tilt) * 0.5
+    poa_ground_diffuse = ghi * albedo * (1 - cos_tilt) * 0.5
+    return poa_direct + poa_sky_diffuse + poa_ground_diffuse
+
+
+def fetch_location_arrays(latitude, longitude, tilt_angle=None, weather_provider=None):
+    """
+    TMY data (T2m, WS10m and the TMY irradiances) and solar position (apparent_zenith and azimuth) of a location,
+    the inputs of the irradiance of any surface. They do not depend on the tilt angle, so they are stored once per
+    location in the PVGIS cache.
+    """
+    if weather_provider is None:
+        weather_provider = get_weather_provider()
+    tmy_data, inputs = get_fetcher().call(f"tmy|{location_request(latitude, longitude)}",
+                                          weather_provider.get_tmy, latitude, longitude)
+    location = inputs['location']
+    site = Location(location['latitude'], location['longitude'], altitude=location['elevation'])
+    solar_position = site.get_solarposition(times=tmy_data.index)
+    arrays = {name: tmy_data[name].to_numpy(dtype=float) for name in ["T2m", "WS10m"] + TMY_IRRADIANCE}
+    arrays["apparent_zenith"] = solar_position['apparent_zenith'].to_numpy(dtype=float)
+    arrays["azimuth"] = solar_position['azimuth'].to_numpy(dtype=float)
+    return arrays
+
+
+def get_location_arrays(latitude, longitude, pvgis_cache=None, weather_provider=None):
+    """Cached arrays of fetch_location_arrays of a location, snapped to the grid of the weather provider."""
+    if pvgis_cache is None:
+        pvgis_cache = get_pvgis_cache()
+    if weather_provider is None:
+        weather_provider = get_weather_provider()
+    latitude, longitude = weather_provider.snap(latitude, longitude)
+    return pvgis_cache.get_or_fetch(latitude, longitude, None,
+                                    partial(fetch_location_arrays, weather_provider=weather_provider),
+                                    weather_provider.source)
+
+
+def get_poa_irradiance(latitude, longitude, surfaces, albedo=DEFAULT_ALBEDO, pvgis_cache=None, weather_provider=None):
+    """
+    Hourly global irradiance of any set of surfaces of a location (e.g. the facades for PV studies), as an array
+    surfaces x hours (W/m2). The result is cached per location and set of surfaces.
+    :param surfaces: sequence of (tilt, azimuth) in degrees
+    """
+    if pvgis_cache is None:
+        pvgis_cache = get_pvgis_cache()
+    if weather_provider is None:
+        weather_provider = get_weather_provider()
+    latitude, longitude = weather_provider.snap(latitude, longitude)
+    surfaces = np.asarray(surfaces, dtype=float).reshape(-1, 2)
+    surfaces_digest = hashlib.sha256(np.append(surfaces.ravel(), albedo).tobytes()).hexdigest()
+
+    key = pvgis_cache.key(latitude, longitude, None, f"{weather_provider.source}|poa|{surfaces_digest}")
+    arrays = pvgis_cache.load(key)
+    if arrays is None:
+        # computed from the cached data of the location, so it is available in offline mode as well
+        location_arrays = get_location_arrays(latitude, longitude, pvgis_cache, weather_provider)
+        arrays = pvgis_cache.save(key, {"poa_global": poa_irradiance(
+            surfaces, location_arrays["apparent_zenith"], location_arrays["azimuth"], location_arrays["Gb(n)"],
+            location_arrays["G(h)"], location_arrays["Gd(h)"], albedo)})
+    return arrays["poa_global"]
+
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies:
+    python 3.11
+    numpy                     1.26.4
+    pytest                    8.0.0
+License: GNU GPLv3
+The GNU General Public License is a free, copyleft license for software and other kinds of works.
+https://www.gnu.org/licenses/gpl-3.0.html
+You may copy, distribute and modify the software as long as you track changes/dates in source files.
+ Any modifications to or software including (via compiler) GPL-licensed code must also be made
+ available under the GPL along with build & install instructions.
+ This means, you must:
+     - Include original
+     - State Changes
+     - Disclose source
+     - Include the same license -- to make sure it remains free software for all its users.
+     - Include copyright
+     - Include install instructions
+
+You cannot: sublicense or hold liable.
+
+Copyright @CARTIF 2025
+
+***********************************************************************************************
+
+This part of the code checks the new contexts created from the dummy community (get_new_context.py). The weather
+data is replayed from scripts/data_example/weather_replay (see README_dumy_example_data.md), so no network is used
+
+***********************************************************************************************
+"""
+import json
+import os
+import pytest
+from scripts.RESbased_scenario_generator.get_new_context import resbased_generator_contexts_creation
+from scripts.RESbased_scenario_generator.weather_data import PVGISCache, ReplayWeatherProvider
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "data_example")
+CONTEXT_PATH = os.path.join(DATA_PATH, "dummy_data_example.json")
+REPLAY_DIR = os.path.join(DATA_PATH, "weather_replay")
+SCENARIOS = [(2, {0: {"id": 3, "action_name": "solar_fleet"}}),
+             (1, {0: {"id": 4, "action_name": "wind_fleet"}}),
+             (3, {0: {"id": 19, "action_name": "heat_pump"}, 1: {"id": 15, "action_name": "storage"}})]
+
+
+@pytest.fixture
+def community_context():
+    with open(CONTEXT_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def weather(tmp_path):
+    return {"weather_provider": ReplayWeatherProvider(REPLAY_DIR), "pvgis_cache": PVGISCache(tmp_path)}
+
+
+def test_contexts_of_the_scenarios_have_their_own_id(community_context, weather):
+    new_contexts = resbased_generator_contexts_creation(community_context, SCENARIOS, **weather)
+    assert len(new_contexts) == len(SCENARIOS)
+    ids = [new_context["id_temp"] for new_context in new_contexts]
+    assert len(set(ids)) == len(ids)
+    assert ids == [community_context["id"] + 1 + position for position in range(len(SCENARIOS))]
+    for new_context in new_contexts:
+        assert new_context["context_parent"] == community_context["id"]
+        # the modified buildings are tied to the context they belong to
+        context_ids = {building_asset_context["context_id"]
+                       for building_asset_context in new_context["building_asset_context"]
+                       if "context_id" in building_asset_context}
+        assert context_ids == {new_context["id_temp"]}
+
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies:
+    python 3.11
+    numpy                     1.26.4
+    pytest                    8.0.0
+License: GNU GPLv3
+The GNU General Public License is a free, copyleft license for software and other kinds of works.
+https://www.gnu.org/licenses/gpl-3.0.html
+You may copy, distribute and modify the software as long as you track changes/dates in source files.
+ Any modifications to or software including (via compiler) GPL-licensed code must also be made
+ available under the GPL along with build & install instructions.
+ This means, you must:
+     - Include original
+     - State Changes
+     - Disclose source
+     - Include the same license -- to make sure it remains free software for all its users.
+     - Include copyright
+     - Include install instructions
+
+You cannot: sublicense or hold liable.
+
+Copyright @CARTIF 2025
+
+***********************************************************************************************
+
+This part of the code checks the KPIs of the dummy community against reference values calculated before the numpy
+engine, that the parallel and batch calculations give the same results as the serial one, and that the incremental
+KPI recalculation of a child context (the community totals of its parent updated with the buildings removed and
+added) gives the same indicators as a full recalculation
+
+***********************************************************************************************
+"""
+import copy
+import json
+import math
+import os
+import numpy as np
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from scripts.KPI_module.key_performance_indicators import (recalculate_indicators, recalculate_indicators_incremental,
+                                                           calculate_indicators_batch, aggregate_demand_profiles,
+                                                           community_KPIs,
+                                                           community_state_key, get_building_keys, get_building_tasks,
+                                                           HOURLY, MONTHLY)
+from scripts.RESbased_scenario_generator.classes_database import KPICache
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "data_example")
+CONTEXT_PATH = os.path.join(DATA_PATH, "dummy_data_example.json")
+# sums, maximums and some hours of the hourly KPIs of the dummy community calculated before the numpy engine
+REFERENCE_PATH = os.path.join(DATA_PATH, "dummy_data_example_KPIs_reference.json")
+
+
+def load_parent():
+    """Dummy community context."""
+    with open(CONTEXT_PATH) as f:
+        return json.load(f)
+
+
+def new_child(parent, scale, removed_index):
+    """
+    Unsaved child context of the parent, as created by get_new_context (context_parent and id_temp, without id),
+    sharing some of its buildings: one building is removed and the electricity consumption of the first one changes.
+    """
+    child = copy.deepcopy(parent)
+    del child["id"]
+    child["id_temp"] = parent["id"] + 1
+    child["context_parent"] = parent["id"]
+    building_asset_context = child["building_asset_context"]
+    consumption = building_asset_context[0]["building_consumption"]
+    consumption["elec_consumption"] = [value * scale for value in consumption["elec_consumption"]]
+    del building_asset_context[removed_index]
+    return child
+
+
+def hourly_profile(peak, phase=0):
+    """Daily cycle of an asset (e.g. PV production), zero at night."""
+    return [round(max(0.0, peak * math.sin(2 * math.pi * ((hour + phase) % 24 - 6) / 24)), 6) for hour in range(8760)]
+
+
+def add_energy_assets(community_context):
+    """
+    Adds building energy assets to the dummy community, so every branch of the building engine is used: PV (its
+    self consumption), a heat pump asset for heating, a CHP consuming fuel and a heat pump for dhw without asset.
+    """
+    building_asset_context = community_context["building_asset_context"]
+    building_asset_context[0]["building_energy_asset"] = [
+        {"generation_system_id": 80, "pmax_scalar": 3, "availability_ts": {"value_input1": hourly_profile(0.3)}}]
+    building_asset_context[1]["generation_system_profile"]["heating_system_id"] = 61
+    building_asset_context[1]["building_energy_asset"] = [
+        {"generation_system_id": 61, "pmax_scalar": 1, "availability_ts": {"value_input1": hourly_profile(0.8, 12)}}]
+    building_asset_context[2]["building_energy_asset"] = [
+        {"generation_system_id": 88, "pmax_scalar": 2, "availability_ts": {"value_input1": hourly_profile(0.5, 6)}}]
+    building_asset_context[3]["generation_system_profile"]["dhw_system_id"] = 27
+    return community_context
+
+
+def load_parent_and_child():
+    """Dummy community context (parent) and a child context saved with its own id."""
+    parent = load_parent()
+    child = new_child(parent, 1.5, 2)
+    child["id"] = parent["id"] + 1
+    return parent, child
+
+
+def full_indicators(community_context, resolution):
+    citizen_KPIs, demand_profiles_context = recalculate_indicators(copy.deepcopy(community_context),
+                                                                   resolution=resolution)
+    total_demand = aggregate_demand_profiles(demand_profiles_context, as_matrix=True)
+    return citizen_KPIs, community_KPIs(citizen_KPIs, total_demand, resolution=resolution)
+
+
+def assert_same_values(result, expected, path=""):
+    if isinstance(expected, dict):
+        assert list(result) == list(expected), path
+        for key in expected:
+            assert_same_values(result[key], expected[key], f"{path}/{key}")
+    elif isinstance(expected, (list, tuple)) and expected and isinstance(expected[0], dict):
+        assert len(result) == len(expected), path
+        for index, (value, expected_value) in enumerate(zip(result, expected)):
+            assert_same_values(value, expected_value, f"{path}[{index}]")
+    elif isinstance(expected, (list, tuple, int, float)):
+        np.testing.assert_allclose(result, expected, rtol=1e-9, atol=1e-6, err_msg=path)
+    else:
+        assert result == expected, path
+
+
+def summarize(value, sample_hours):
+    """Sum, maximum and some hours of an hourly series, as stored in the reference file."""
+    if isinstance(value, list):
+        return {"sum": sum(value), "max": max(value), "samples": [value[hour] for hour in sample_hours]}
+    return value
+
+
+def assert_close_to_reference(value, expected, path):
+    if isinstance(expected, dict):
+        assert sorted(value) == sorted(expected), path
+        for key in expected:
+            np.testing.assert_allclose(value[key], expected[key], rtol=1e-9, atol=1e-9, err_msg=f"{path}/{key}")
+    else:
+        np.testing.assert_allclose(value, expected, rtol=1e-9, atol=1e-9, err_msg=path)
+
+
+@pytest.mark.parametrize("name", ["dummy_data_example", "dummy_data_example_with_assets"])
+def test_numpy_engine_matches_reference_values(name):
+    with open(REFERENCE_PATH) as f:
+        reference = json.load(f)
+    community_context = load_parent()
+    if name == "dummy_data_example_with_assets":
+        community_context = add_energy_assets(community_context)
+    sample_hours = reference["sample_hours"]
+    citizen_KPIs, demand_profiles_context = recalculate_indicators(community_context)
+    indicators = community_KPIs(citizen_KPIs, aggregate_demand_profiles(demand_profiles_context))
+
+    reference = reference[name]
+    assert [str(building_id) for building_id in citizen_KPIs] == list(reference["citizen_KPIs"])
+    for building_id, kpis in citizen_KPIs.items():
+        expected_kpis = reference["citizen_KPIs"][str(building_id)]
+        assert [kpi["name"] for kpi in kpis] == [kpi["name"] for kpi in expected_kpis]
+        for kpi, expected in zip(kpis, expected_kpis):
+            assert kpi["unit"] == expected["unit"]
+            assert_close_to_reference(summarize(kpi["value"], sample_hours), expected["value"],
+                                      f"{building_id}/{kpi['name']}")
+    assert sorted(indicators) == sorted(reference["community_indicators"])
+    for name, expected in reference["community_indicators"].items():
+        assert indicators[name]["unit"] == expected["unit"]
+        assert_close_to_reference(summarize(indicators[name]["value"], sample_hours), expected["value"], name)
+
+
+@pytest.mark.parametrize("resolution", [HOURLY, MONTHLY])
+def test_parallel_matches_serial(resolution):
+    parent = load_parent()
+    serial = recalculate_indicators(copy.deepcopy(parent), resolution=resolution)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        parallel = recalculate_indicators(copy.deepcopy(parent), executor=executor, resolution=resolution)
+    # same buildings in the same order
+    assert list(parallel[0]) == list(serial[0])
+    assert_same_values(parallel[0], serial[0])
+    assert_same_values(parallel[1], serial[1])
+
+
+@pytest.mark.parametrize("resolution", [HOURLY, MONTHLY])
+def test_batch_matches_single_contexts(resolution):
+    parent, child = load_parent_and_child()
+    sibling = new_child(parent, 0.5, 1)
+    community_contexts = [parent, child, sibling]
+    results = calculate_indicators_batch([copy.deepcopy(community_context)
+                                          for community_context in community_contexts], resolution=resolution)
+    assert len(results) == len(community_contexts)
+    for community_context, (citizen_KPIs, indicators) in zip(community_contexts, results):
+        expected_citizen_KPIs, expected_indicators = full_indicators(community_context, resolution)
+        assert_same_values(citizen_KPIs, expected_citizen_KPIs)
+        assert_same_values(indicators, expected_indicators)
+
+
+@pytest.mark.parametrize("resolution", [HOURLY, MONTHLY])
+def test_incremental_child_matches_full_recalculation(resolution):
+    parent, child = load_parent_and_child()
+    kpi_cache = KPICache()
+
+    parent_citizen_KPIs, _, parent_indicators = recalculate_indicators_incremental(copy.deepcopy(parent), kpi_cache,
+                                                                                   resolution=resolution)
+    assert kpi_cache.get_community(parent["id"]) is not None
+    parent_buildings = len(kpi_cache)
+    child_citizen_KPIs, _, child_indicators = recalculate_indicators_incremental(copy.deepcopy(child), kpi_cache,
+                                                                                 resolution=resolution)
+    # only the modified building is calculated, the child starts from the totals of its parent
+    assert len(kpi_cache) == parent_buildings + 1
+
+    for community_context, citizen_KPIs, indicators in ((parent, parent_citizen_KPIs, parent_indicators),
+                                                        (child, child_citizen_KPIs, child_indicators)):
+        expected_citizen_KPIs, expected_indicators = full_indicators(community_context, resolution)
+        assert_same_values(citizen_KPIs, expected_citizen_KPIs)
+        assert_same_values(indicators, expected_indicators)
+
+
+@pytest.mark.parametrize("resolution", [HOURLY, MONTHLY])
+def test_sibling_children_keep_their_own_totals(resolution):
+    parent = load_parent()
+    # unsaved children of the same parent share context_parent and id_temp
+    siblings = [new_child(parent, 1.5, 2), new_child(parent, 0.5, 1)]
+    kpi_cache = KPICache()
+    recalculate_indicators_incremental(copy.deepcopy(parent), kpi_cache, resolution=resolution)
+    results = [recalculate_indicators_incremental(copy.deepcopy(sibling), kpi_cache, resolution=resolution)
+               for sibling in siblings]
+
+    # the parent totals are not replaced by the ones of its children, and each child keeps its totals
+    parent_state = kpi_cache.get_community(parent["id"])
+    assert sorted(parent_state["keys"]) == sorted(get_building_keys(get_building_tasks(copy.deepcopy(parent))))
+    sibling_keys = [get_building_keys(get_building_tasks(copy.deepcopy(sibling))) for sibling in siblings]
+    assert len({community_state_key(keys) for keys in sibling_keys}) == 2
+    for keys in sibling_keys:
+        assert kpi_cache._communities[community_state_key(keys)]["keys"] == keys
+
+    for sibling, (citizen_KPIs, _, indicators) in zip(siblings, results):
+        expected_citizen_KPIs, expected_indicators = full_indicators(sibling, resolution)
+        assert_same_values(citizen_KPIs, expected_citizen_KPIs)
+        assert_same_values(indicators, expected_indicators)
+
+    # once saved, a child of the first sibling starts from its totals
+    saved = copy.deepcopy(siblings[0])
+    saved["id"] = parent["id"] + 1
+    recalculate_indicators_incremental(copy.deepcopy(saved), kpi_cache, resolution=resolution)
+    assert kpi_cache.get_community(saved["id"])["keys"] == sibling_keys[0]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies:
+    python 3.11
+    numpy                     1.26.4
+    pytest                    8.0.0
+License: GNU GPLv3
+The GNU General Public License is a free, copyleft license for software and other kinds of works.
+https://www.gnu.org/licenses/gpl-3.0.html
+You may copy, distribute and modify the software as long as you track changes/dates in source files.
+ Any modifications to or software including (via compiler) GPL-licensed code must also be made
+ available under the GPL along with build & install instructions.
+ This means, you must:
+     - Include original
+     - State Changes
+     - Disclose source
+     - Include the same license -- to make sure it remains free software for all its users.
+     - Include copyright
+     - Include install instructions
+
+You cannot: sublicense or hold liable.
+
+Copyright @CARTIF 2025
+
+***********************************************************************************************
+
+This part of the code checks the sizing rules of the building systems (sizing.py) and the handlers of the heating,
+cooling and dhw systems that use them (context_creation.py)
+
+***********************************************************************************************
+"""
+import numpy as np
+import pytest
+from scripts.RESbased_scenario_generator.sizing import (size_capacities, system_capacity, PEAK_FRACTION, PERCENTILE,
+                                                        ENERGY_SHARE)
+from scripts.RESbased_scenario_generator.context_creation import (handle_dhw_system, handle_heating_system,
+                                                                  handle_cooling_system)
+
+# hourly demand (kW) of a year with a daily and a yearly cycle
+HOURS = np.arange(8760)
+DEMAND = 5 + 4 * np.cos(2 * np.pi * HOURS / 8760) + 2 * np.sin(2 * np.pi * HOURS / 24) ** 2
+LEVELS = (0.5, 0.7, 0.9)
+
+
+def test_peak_fraction():
+    np.testing.assert_allclose(size_capacities(DEMAND, PEAK_FRACTION, LEVELS), DEMAND.max() * np.array(LEVELS))
+
+
+def test_percentile():
+    np.testing.assert_allclose(size_capacities(DEMAND, PERCENTILE, LEVELS), np.quantile(DEMAND, LEVELS))
+
+
+def test_energy_share():
+    capacities = size_capacities(DEMAND, ENERGY_SHARE, LEVELS)
+    # a base load system of the capacity supplies the share of the yearly demand
+    for capacity, level in zip(capacities, LEVELS):
+        np.testing.assert_allclose(np.minimum(DEMAND, capacity).sum(), level * DEMAND.sum(), rtol=1e-9)
+    assert np.all(np.diff(capacities) > 0)
+    np.testing.assert_allclose(size_capacities(DEMAND, ENERGY_SHARE, (1.0,)), [DEMAND.max()])
+
+
+@pytest.mark.parametrize("rule", [PEAK_FRACTION, PERCENTILE, ENERGY_SHARE])
+def test_many_systems_at_once(rule):
+    demands = np.stack([DEMAND, 2 * DEMAND, DEMAND[::-1]])
+    capacities = size_capacities(demands, rule, LEVELS)
+    assert capacities.shape == (3, len(LEVELS))
+    for demand, system_capacities in zip(demands, capacities):
+        np.testing.assert_allclose(system_capacities, size_capacities(demand, rule, LEVELS))
+
+
+@pytest.mark.parametrize("rule", [PEAK_FRACTION, PERCENTILE, ENERGY_SHARE])
+def test_empty_demand(rule):
+    with pytest.raises(ValueError):
+        size_capacities([], rule, LEVELS)
+
+
+def test_unknown_rule():
+    with pytest.raises(ValueError):
+        size_capacities(DEMAND, "mean", LEVELS)
+
+
+@pytest.mark.parametrize("handler, system_id, system, level", [
+    (handle_dhw_system, 27, "dhw", 0.7),
+    (handle_heating_system, 61, "heating", 0.7),
+    (handle_cooling_system, 1, "cooling", 0.9),
+])
+def test_system_handlers(handler, system_id, system, level):
+    # each handler updates its own system (handle_heating_system was once shadowed by a second handle_cooling_system)
+    assert handler.__name__ == f"handle_{system}_system"
+    generation_system_profile, building_energy_asset = handler({}, system_id, DEMAND.tolist(), None, 6)
+    assert list(generation_system_profile) == [f"{system}_system"]
+    assert generation_system_profile[f"{system}_system"]["id"] == system_id
+    assert building_energy_asset["generation_system_id"] == system_id
+    assert building_energy_asset["availability_ts"]["name"].endswith(f"_{system}_building_6")
+    assert building_energy_asset["pmaxmax_scalar"] == pytest.approx(level * DEMAND.max())
+    assert building_energy_asset["pmaxmax_scalar"] == system_capacity(DEMAND, system)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies:
+    python 3.11
+    numpy                     1.26.4
+    pandas                    2.2.0
+    pvlib                     0.11.0
+    requests                  2.31.0
+    pytest                    8.0.0
+License: GNU GPLv3
+The GNU General Public License is a free, copyleft license for software and other kinds of works.
+https://www.gnu.org/licenses/gpl-3.0.html
+You may copy, distribute and modify the software as long as you track changes/dates in source files.
+ Any modifications to or software including (via compiler) GPL-licensed code must also be made
+ available under the GPL along with build & install instructions.
+ This means, you must:
+     - Include original
+     - State Changes
+     - Disclose source
+     - Include the same license -- to make sure it remains free software for all its users.
+     - Include copyright
+     - Include install instructions
+
+You cannot: sublicense or hold liable.
+
+Copyright @CARTIF 2025
+
+***********************************************************************************************
+
+This part of the code checks the weather data of the contexts (weather_data.py) without network: the PVGIS cache,
+the grid snapping, the retries of the requests, the irradiance of the surfaces and the weather providers. The
+weather data is replayed from scripts/data_example/weather_replay (see README_dumy_example_data.md)
+
+***********************************************************************************************
+"""
+import json
+import os
+import numpy as np
+import pytest
+import requests
+from pvlib.irradiance import get_total_irradiance
+from scripts.RESbased_scenario_generator.context_creation import call_PVGIS
+from scripts.RESbased_scenario_generator.weather_data import (PVGISCache, WeatherCacheMiss, ReplayWeatherProvider,
+                                                              FileWeatherProvider, ConcurrentFetcher, snap_to_grid,
+                                                              get_location_arrays, poa_irradiance, ORIENTATIONS)
+
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "data_example", "weather_replay")
+# centroid of the dummy community (dummy_data_example.json) and the centre of its PVGIS grid cell
+LONGITUDE, LATITUDE = -2.5439082011102805, 43.36203347972567
+CELL = (43.375, -2.525)
+TILT_ANGLE = 35
+
+
+class CountingProvider(ReplayWeatherProvider):
+    """Replay of the recorded data counting the requests, to tell cache hits from fetches."""
+
+    def __init__(self, record_dir):
+        super().__init__(record_dir)
+        self.requests = 0
+
+    def get_tmy(self, latitude, longitude):
+        self.requests += 1
+        return super().get_tmy(latitude, longitude)
+
+    def get_pv_hourly(self, latitude, longitude, tilt_angle):
+        self.requests += 1
+        return super().get_pv_hourly(latitude, longitude, tilt_angle)
+
+
+def write_pvgis_tmy_json(path, tmy_data, location):
+    """Writes a TMY dataframe as a TMY json file downloaded from PVGIS."""
+    rows = tmy_data.reset_index(drop=True).to_dict("records")
+    for time, row in zip(tmy_data.index, rows):
+        row["time(UTC)"] = time.strftime("%Y%m%d:%H%M")
+    content = {"inputs": {"location": location, "meteo_data": {}},
+               "outputs": {"months_selected": [{"month": month, "year": 2005} for month in range(1, 13)],
+                           "tmy_hourly": rows},
+               "meta": {"inputs": {}, "outputs": {}}}
+    with open(path, "w") as file:
+        json.dump(content, file)
+
+
+def test_snap_to_grid():
+    assert snap_to_grid(LATITUDE, LONGITUDE, 0.05) == CELL
+    # the locations of the same cell share its centre, the next cell does not
+    assert snap_to_grid(LATITUDE + 0.01, LONGITUDE + 0.01, 0.05) == CELL
+    assert snap_to_grid(LATITUDE + 0.05, LONGITUDE, 0.05) != CELL
+    # a provider without grid keeps the exact location
+    assert snap_to_grid(LATITUDE, LONGITUDE, None) == (LATITUDE, LONGITUDE)
+
+
+def test_cache_miss_then_hit(tmp_path):
+    weather_provider = CountingProvider(REPLAY_DIR)
+    pvgis_cache = PVGISCache(tmp_path)
+    first = call_PVGIS(LONGITUDE, LATITUDE, TILT_ANGLE, pvgis_cache=pvgis_cache, weather_provider=weather_provider)
+    assert weather_provider.requests == 2
+    # the PV data of the tilt angle and the location data (TMY and solar position) are cached
+    assert len(list(tmp_path.glob("*.npz"))) == 2
+    assert len(first[1]) == 8760 and len(first[3]) == 8760
+
+    # a location of the same cell, read again from the files
+    pvgis_cache.clear_memory()
+    second = call_PVGIS(LONGITUDE + 0.01, LATITUDE + 0.01, TILT_ANGLE, pvgis_cache=pvgis_cache,
+                        weather_provider=weather_provider)
+    assert weather_provider.requests == 2
+    irradiance_dic, pv_profile, solar_elevation_midday_values, T2m, wind_potential, _ = first
+    assert second[0] == irradiance_dic and second[1] == pv_profile
+    assert second[2].equals(solar_elevation_midday_values)
+    assert second[3] == T2m and second[4] == wind_potential
+
+
+def test_offline_cache_miss(tmp_path):
+    weather_provider = CountingProvider(REPLAY_DIR)
+    with pytest.raises(WeatherCacheMiss):
+        call_PVGIS(LONGITUDE, LATITUDE, TILT_ANGLE, pvgis_cache=PVGISCache(tmp_path, offline=True),
+                   weather_provider=weather_provider)
+    assert weather_provider.requests == 0
+
+    # once cached, offline mode reads the cache
+    call_PVGIS(LONGITUDE, LATITUDE, TILT_ANGLE, pvgis_cache=PVGISCache(tmp_path), weather_provider=weather_provider)
+    call_PVGIS(LONGITUDE, LATITUDE, TILT_ANGLE, pvgis_cache=PVGISCache(tmp_path, offline=True),
+               weather_provider=weather_provider)
+    assert weather_provider.requests == 2
+
+
+def test_replay_of_a_location_not_recorded():
+    weather_provider = ReplayWeatherProvider(REPLAY_DIR)
+    assert weather_provider.source == "clearsky|ineichen"
+    assert weather_provider.snap(LATITUDE, LONGITUDE) == CELL
+    tmy_data, inputs = weather_provider.get_tmy(*CELL)
+    assert len(tmy_data) == 8760
+    assert inputs["location"]["elevation"] == 50
+    with pytest.raises(WeatherCacheMiss):
+        weather_provider.get_tmy(41.675, -4.725)
+    with pytest.raises(WeatherCacheMiss):
+        weather_provider.get_pv_hourly(*CELL, tilt_angle=20)
+
+
+def test_replay_records_the_provider(tmp_path):
+    recorded = ReplayWeatherProvider(tmp_path, ReplayWeatherProvider(REPLAY_DIR))
+    tmy_data, _ = recorded.get_tmy(*CELL)
+    # the recorded data is replayed without the provider, keeping its source and grid
+    replayed = ReplayWeatherProvider(tmp_path)
+    assert (replayed.source, replayed.grid_resolution) == ("clearsky|ineichen", 0.05)
+    replayed_tmy_data, _ = replayed.get_tmy(*CELL)
+    assert replayed_tmy_data.equals(tmy_data)
+
+
+def test_file_weather_provider(tmp_path):
+    tmy_data, inputs = ReplayWeatherProvider(REPLAY_DIR).get_tmy(*CELL)
+    path = tmp_path / "tmy_43.375_-2.525.json"
+    write_pvgis_tmy_json(path, tmy_data, inputs["location"])
+    weather_provider = FileWeatherProvider(path)
+
+    # every location uses the site of the nearest file
+    assert weather_provider.snap(LATITUDE, LONGITUDE) == CELL
+    assert weather_provider.snap(41.65, -4.72) == CELL
+    file_tmy_data, _ = weather_provider.get_tmy(LATITUDE, LONGITUDE)
+    np.testing.assert_allclose(file_tmy_data[tmy_data.columns].to_numpy(), tmy_data.to_numpy())
+
+    pv_data = weather_provider.get_pv_hourly(LATITUDE, LONGITUDE, TILT_ANGLE)
+    assert list(pv_data.columns) == ["P", "solar_elevation"]
+    assert len(pv_data) == 8760 and (pv_data.index.year == 2023).all()
+    assert pv_data["P"].max() > 0
+
+    irradiance_dic, pv_profile, _, T2m, _, _ = call_PVGIS(LONGITUDE, LATITUDE, TILT_ANGLE,
+                                                          pvgis_cache=PVGISCache(tmp_path / "cache"),
+                                                          weather_provider=weather_provider)
+    assert set(ORIENTATIONS) <= set(irradiance_dic)
+    np.testing.assert_allclose(T2m, tmy_data["T2m"].to_numpy())
+    np.testing.assert_allclose(pv_profile, pv_data["P"].to_numpy() / 1000)
+
+
+def test_poa_irradiance_matches_pvlib(tmp_path):
+    arrays = get_location_arrays(LATITUDE, LONGITUDE, pvgis_cache=PVGISCache(tmp_path),
+                                 weather_provider=ReplayWeatherProvider(REPLAY_DIR))
+    surfaces = [(0, 180), (35, 180), (90, 90), (90, 270), (60, 135), (90, 0)]
+    result = poa_irradiance(surfaces, arrays["apparent_zenith"], arrays["azimuth"], arrays["Gb(n)"],
+                            arrays["G(h)"], arrays["Gd(h)"], albedo=0.25)
+    assert result.shape == (len(surfaces), 8760)
+    for surface, irradiance in zip(surfaces, result):
+        expected = get_total_irradiance(surface_tilt=surface[0], surface_azimuth=surface[1],
+                                        solar_zenith=arrays["apparent_zenith"], solar_azimuth=arrays["azimuth"],
+                                        dni=arrays["Gb(n)"], ghi=arrays["G(h)"], dhi=arrays["Gd(h)"], albedo=0.25)
+        np.testing.assert_allclose(irradiance, np.asarray(expected["poa_global"], dtype=float), rtol=1e-9,
+                                   atol=1e-9, err_msg=str(surface))
+
+
+def failing_request(message, failures):
+    """Request failing failures times with the JSON error message of PVGIS (raised by pvlib without response)."""
+    calls = []
+
+    def request():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise requests.HTTPError(message)
+        return "data"
+    return request, calls
+
+
+def test_fetcher_retries_an_overloaded_service():
+    fetcher = ConcurrentFetcher(retries=2, backoff=0.001)
+    request, calls = failing_request("503 Server Error: Service Unavailable", failures=2)
+    assert fetcher.call("tmy|43.375|-2.525", request) == "data"
+    assert len(calls) == 3
+    assert fetcher.summary()["tmy"]["retries"] == 2
+
+    # the retries are bounded
+    request, calls = failing_request("503 Server Error: Service Unavailable", failures=5)
+    with pytest.raises(requests.HTTPError):
+        fetcher.call("tmy|43.375|-2.525", request)
+    assert len(calls) == 3
+
+
+def test_fetcher_does_not_retry_a_wrong_location():
+    fetcher = ConcurrentFetcher(retries=2, backoff=0.001)
+    request, calls = failing_request("Location over the sea. Please, select another location", failures=1)
+    with pytest.raises(requests.HTTPError):
+        fetcher.call("tmy|43.625|-2.525", request)
+    assert len(calls) == 1
+    summary = fetcher.summary()["tmy"]
+    assert (summary["requests"], summary["failed"], summary["retries"]) == (1, 1, 0)